@@ -0,0 +1,122 @@
+"""
+Offline capture / pipeline benchmark against collectors/fixture_server.py.
+
+Starts the fixture server in this process and runs the captures (or, with
+--pipeline, `python -m collectors run` up to package) in a child process with
+FLYER_BASE_URL pointing at it. Every run gets a fresh working directory under
+.cache/bench/capture/ (no feed-URL, HTTP or normalize cache carried over), so
+runs are repeatable. Reports wall time, items and items/s, the retries and
+bytes run_manifest counted, and what the server saw (requests, injected
+errors). The server's fault sequence restarts from --seed for every run.
+
+Usage:
+  python bench/bench_capture.py --items 5000 --flyers 4
+  python bench/bench_capture.py --latency 200 --jitter 100 --error-rate 0.1 --repeat 3
+  python bench/bench_capture.py --pipeline --items 20000 --captures fanout
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+COLLECTORS = ROOT / "collectors"
+RUNS_DIR = Path(".cache/bench/capture")
+
+sys.path.insert(0, str(COLLECTORS))
+
+import fixture_server  # noqa: E402
+
+DEFAULT_CAPTURES = "fanout"
+
+
+def _child_cmd(args: argparse.Namespace) -> List[str]:
+    if args.pipeline:
+        return [sys.executable, "-m", "collectors", "run", "--skip", "upload", "--capture", args.captures,
+                "--workers", str(args.workers), "--compress", "none"]
+    return [sys.executable, str(COLLECTORS / "capture_all.py"), *args.captures.split(",")]
+
+
+def run_once(args: argparse.Namespace, server: fixture_server.FixtureServer, i: int) -> Dict[str, Any]:
+    work = (RUNS_DIR / f"run-{i}").resolve()
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    shutil.copy(args.stores, work / "stores.json")
+
+    env = {**os.environ, "FLYER_BASE_URL": server.base_url, "PYTHONPATH": str(ROOT)}
+    server.reset()
+    t0 = time.perf_counter()
+    proc = subprocess.run(_child_cmd(args), cwd=work, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stdout[-2000:] + proc.stderr[-2000:])
+
+    try:
+        stages = json.loads((work / "out" / "run_manifest.json").read_text(encoding="utf-8")).get("stages") or {}
+    except (OSError, ValueError):
+        stages = {}
+    counted = [s for n, s in stages.items() if n == "normalize"] if args.pipeline else \
+        [s for n, s in stages.items() if n.startswith("capture.")]
+    items = sum(s.get("items") or 0 for s in counted)
+    seen = dict(server.stats)
+    return {
+        "ok": proc.returncode == 0,
+        "wall_s": round(wall, 3),
+        "items": items,
+        "items_per_s": round(items / wall, 1) if wall > 0 else None,
+        "retries": sum(s.get("retries") or 0 for n, s in stages.items() if n.startswith("capture.")),
+        "bytes_in": sum(s.get("bytes_in") or 0 for s in stages.values()),
+        "requests": seen.get("requests", 0),
+        "errors_injected": seen.get("errors_injected", 0),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark captures offline against the fixture server.")
+    ap.add_argument("--captures", default=DEFAULT_CAPTURES, help="comma-separated captures, as for capture_all.py")
+    ap.add_argument("--pipeline", action="store_true", help="run the in-process pipeline (no upload), not just capture")
+    ap.add_argument("--workers", type=int, default=0, help="normalize workers with --pipeline (0 = one per CPU)")
+    ap.add_argument("--stores", type=Path, default=ROOT / "stores.json", help="stores.json for the fanout capture")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    g = ap.add_argument_group("fixture server")
+    g.add_argument("--recordings", type=Path, help="http_cache directory to replay")
+    g.add_argument("--items", type=int, default=None, help="items per payload")
+    g.add_argument("--flyers", type=int, default=fixture_server.DEFAULT_FLYERS)
+    g.add_argument("--latency", type=float, default=0.0, help="ms")
+    g.add_argument("--jitter", type=float, default=0.0, help="ms")
+    g.add_argument("--error-rate", type=float, default=0.0)
+    g.add_argument("--error-status", type=int, default=503)
+    g.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    opts = fixture_server.Options(
+        items=args.items, flyers=args.flyers, latency_ms=args.latency, jitter_ms=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+        recordings=args.recordings.resolve() if args.recordings else None,
+    )
+    server = fixture_server.start(opts)
+    try:
+        results = [run_once(args, server, i) for i in range(max(1, args.repeat))]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"{'run':>3} {'ok':>3} {'wall s':>8} {'items':>9} {'items/s':>10} {'retries':>7} {'MB in':>7} "
+          f"{'requests':>8} {'errors':>6}")
+    for i, r in enumerate(results):
+        print(f"{i:>3} {'y' if r['ok'] else 'n':>3} {r['wall_s']:>8.2f} {r['items']:>9} {r['items_per_s'] or 0:>10.0f} "
+              f"{r['retries']:>7} {r['bytes_in'] / 1e6:>7.1f} {r['requests']:>8} {r['errors_injected']:>6}")
+    if args.json:
+        args.json.write_text(json.dumps({"options": {k: str(v) for k, v in vars(args).items()}, "results": results},
+                                        indent=2), encoding="utf-8")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Throughput / memory benchmark for normalize.py on synthetic feeds.
+
+For each feed size, every stage runs in its own child process (so peak RSS
+is per stage) on feeds from gen_feeds.py, cached under .cache/bench/feeds/:
+
+  extract_float  prices.extract_float over the price_text column
+  build_price    prices.build_price over the (pre, text, post) triples
+  parse_column   prices.parse_column over the same triples in one call
+  flyer_ranges   _FlyerRanges.add over every item's flyer / validity window
+  sobeys_items   _sobeys_item over the raw Sobeys items
+  walmart_items  _walmart_item over the raw Walmart items
+  merge          per-retailer + merged writers over already-normalized rows
+  main           normalize.main() end to end (--no-cache)
+  main_stream    normalize.main() end to end (--no-cache --stream --workers 0)
+
+Only the stage itself is timed (inputs are prepared first); peak RSS is the
+child process's own high-water mark (RUSAGE_SELF), so the main stages count
+their input without loading it (a loaded feed would set the mark before the
+run starts); the peak of any worker processes a stage starts is reported
+separately as workers_peak_rss_mb. Results can be saved as a baseline; later runs exit 1 when a
+stage's items/sec drops, or its peak RSS grows, by more than --threshold.
+
+Usage:
+  python bench/bench_normalize.py --sizes 1000,100000 --save-baseline
+  python bench/bench_normalize.py --sizes 1000,100000            # compare
+  python bench/bench_normalize.py --sizes 1000000 --stage main_stream
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+COLLECTORS = ROOT / "collectors"
+FEEDS_DIR = Path(".cache/bench/feeds")
+BASELINE_PATH = ROOT / "bench" / "baseline.json"
+
+DEFAULT_SIZES = "1000,10000,100000"
+THRESHOLD = 0.25
+# RSS noise floor: small feeds barely move the interpreter's own footprint.
+RSS_SLACK_MB = 8.0
+
+
+# ---------------------------------------------------------------------------
+# Stages (run inside the child, with cwd = the feed directory)
+# ---------------------------------------------------------------------------
+
+def _raw(nz, name: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    ad = nz.ADAPTERS[name]
+    meta: Dict[str, Any] = {}
+    return list(ad.iter_items(False, meta)), meta
+
+
+def _stage_extract_float(nz) -> Tuple[int, Callable[[], None]]:
+    col = [it.get("price_text") for it in _raw(nz, "sobeys")[0]]
+    col += [it.get("current_price") for it in _raw(nz, "walmart")[0]]
+
+    def run():
+        f = nz.prices.extract_float
+        for x in col:
+            f(x)
+    return len(col), run
+
+
+def _stage_build_price(nz) -> Tuple[int, Callable[[], None]]:
+    triples = [(it.get("pre_price_text"), it.get("price_text"), it.get("post_price_text")) for it in _raw(nz, "sobeys")[0]]
+
+    def run():
+        b = nz.prices.build_price
+        for pre, text, post in triples:
+            b(pre, text, post)
+    return len(triples), run
+
+
+def _stage_parse_column(nz) -> Tuple[int, Callable[[], None]]:
+    items = _raw(nz, "sobeys")[0]
+    pres = [it.get("pre_price_text") for it in items]
+    texts = [it.get("price_text") for it in items]
+    posts = [it.get("post_price_text") for it in items]
+    return len(items), lambda: nz.prices.parse_column(pres, texts, posts)
+
+
+def _stage_flyer_ranges(nz) -> Tuple[int, Callable[[], None]]:
+    rows = [
+        (nz._safe_str(it.get("flyer_id")), it.get("valid_from"), it.get("valid_to"))
+        for name in ("sobeys", "walmart") for it in _raw(nz, name)[0]
+    ]
+
+    def run():
+        r = nz._FlyerRanges()
+        for fid, vf, vt in rows:
+            r.add(fid, vf, vt)
+        r.flyers()
+    return len(rows), run
+
+
+def _items_stage(name: str):
+    def stage(nz) -> Tuple[int, Callable[[], None]]:
+        items = _raw(nz, name)[0]
+        to_item = nz.ADAPTERS[name].to_item
+
+        def run():
+            for it in items:
+                to_item(it)
+        return len(items), run
+    return stage
+
+
+def _stage_merge(nz) -> Tuple[int, Callable[[], None]]:
+    prepared = []
+    for name, ad in nz.ADAPTERS.items():
+        items, meta = _raw(nz, name)
+        prepared.append((ad, meta, nz._normalize_chunk(ad.to_item, items)[0]))
+    n = sum(len(rows) for _, _, rows in prepared)
+
+    def run():
+        merged = nz._StreamingDocWriter(nz.ALL_NORM)
+        flyers: List[Dict[str, Any]] = []
+        for ad, meta, rows in prepared:
+            out = nz._RetailerOutput(ad, meta)
+            out.add(rows, merged)
+            out.finish(flyers)
+        merged.finish({"schema_version": nz.SCHEMA_VERSION, "captured_at": nz._now_utc_iso(),
+                       "sources": list(nz.ADAPTERS), "flyers": flyers})
+    return n, run
+
+
+def _main_stage(*argv: str):
+    def stage(nz) -> Tuple[int, Callable[[], None]]:
+        # Streamed, so the count leaves no loaded feed behind in the peak RSS.
+        n = sum(sum(1 for _ in ad.iter_items(True, {})) for ad in nz.ADAPTERS.values())
+        gc.collect()
+        return n, lambda: nz.main(["--no-cache", *argv])
+    return stage
+
+
+STAGES: Dict[str, Callable[[Any], Tuple[int, Callable[[], None]]]] = {
+    "extract_float": _stage_extract_float,
+    "build_price": _stage_build_price,
+    "parse_column": _stage_parse_column,
+    "flyer_ranges": _stage_flyer_ranges,
+    "sobeys_items": _items_stage("sobeys"),
+    "walmart_items": _items_stage("walmart"),
+    "merge": _stage_merge,
+    "main": _main_stage(),
+    "main_stream": _main_stage("--stream", "--workers", "0"),
+}
+
+
+def _peak_rss_mb(who: int) -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_child(stage: str, feeds: Path) -> Dict[str, Any]:
+    sys.path.insert(0, str(COLLECTORS))
+    os.chdir(feeds)
+    import normalize as nz
+
+    n, run = STAGES[stage](nz)
+    gc.collect()
+    w0, c0 = time.perf_counter(), time.process_time()
+    run()
+    wall, cpu = time.perf_counter() - w0, time.process_time() - c0
+    result = {
+        "items": n,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "items_per_s": round(n / wall, 1) if wall > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource is not None else None,
+    }
+    workers_peak = _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else None
+    if workers_peak:
+        result["workers_peak_rss_mb"] = workers_peak
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Harness (parent)
+# ---------------------------------------------------------------------------
+
+def ensure_feeds(n: int, seed: int) -> Path:
+    d = FEEDS_DIR / f"{n}-s{seed}"
+    if not (d / ".complete").exists():
+        sys.path.insert(0, str(ROOT / "bench"))
+        import gen_feeds
+
+        t0 = time.perf_counter()
+        gen_feeds.generate(n, d / "out", seed)
+        (d / ".complete").write_text("ok")
+        print(f"[bench] generated {n}-item feeds in {time.perf_counter() - t0:.1f}s -> {d}")
+    return d.resolve()
+
+
+def measure(stage: str, feeds: Path, repeat: int) -> Dict[str, Any]:
+    """Best (fastest) of `repeat` child runs."""
+    best: Optional[Dict[str, Any]] = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--child", stage, "--feeds", str(feeds)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"stage {stage} failed:\n{proc.stderr[-2000:]}")
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or res["wall_s"] < best["wall_s"]:
+            best = res
+    return best
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    problems = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base.get("items_per_s") and cur.get("items_per_s") is not None:
+            if cur["items_per_s"] < base["items_per_s"] * (1 - threshold):
+                problems.append(f"{key}: {cur['items_per_s']:.0f} items/s vs baseline {base['items_per_s']:.0f}")
+        if base.get("peak_rss_mb") and cur.get("peak_rss_mb") is not None:
+            if cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold) + RSS_SLACK_MB:
+                problems.append(f"{key}: peak RSS {cur['peak_rss_mb']:.0f} MB vs baseline {base['peak_rss_mb']:.0f} MB")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark normalize.py stages on synthetic feeds.")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated items per feed (1000 .. 1000000)")
+    ap.add_argument("--stage", action="append", choices=sorted(STAGES), help="only these stages (repeatable)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest counts")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD,
+                    help="allowed relative drop in items/s (and growth in peak RSS) before failing")
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--feeds", type=Path, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.feeds)))
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    stages = args.stage or list(STAGES)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    print(f"{'stage':<24} {'items':>9} {'items/s':>12} {'wall s':>9} {'cpu s':>9} {'peak MB':>8}")
+    for n in sizes:
+        feeds = ensure_feeds(n, args.seed)
+        for stage in stages:
+            key = f"{stage}@{n}"
+            r = results[key] = measure(stage, feeds, max(1, args.repeat))
+            print(f"{key:<24} {r['items']:>9} {r['items_per_s'] or 0:>12,.0f} {r['wall_s']:>9.3f} "
+                  f"{r['cpu_s']:>9.3f} {r['peak_rss_mb'] or 0:>8.1f}")
+
+    doc = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {"results": {}}
+        baseline.update({k: v for k, v in doc.items() if k != "results"})
+        baseline["results"].update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        print(f"[bench] baseline saved -> {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"[bench] no baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    problems = compare(results, json.loads(args.baseline.read_text(encoding="utf-8"))["results"], args.threshold)
+    for p in problems:
+        print(f"[bench] REGRESSION {p}")
+    if problems:
+        return 1
+    print(f"[bench] no regressions past {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Synthetic raw feeds for benchmarking normalize.py.
+
+Writes <dir>/out/sobeys_products.json (products-feed list) and
+<dir>/out/walmart_products.json (Flipp items/search wrapper) with N items
+each, in the shapes the capturers save. The mix mirrors real flyers: most
+price strings repeat, some multi-buys ("2/", "2 for $5"), per-weight and
+per-100 g prices, cents, promo-only rows (no price, only a sale story) and
+fields that are missing or null. Items are written one by one, so 1M-item
+feeds don't need 1M items in memory.
+
+Usage:
+  python bench/gen_feeds.py --items 100000 --dir .cache/bench/feeds/100000
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ITEMS_PER_FLYER = 400
+
+# (pre, price_text, post, weight) -- repeated heavily, like real flyers
+SOBEYS_PRICES: List[Tuple[Any, Any, Any, int]] = [
+    ("", "4.99", "", 20),
+    ("", "2.99", "ea", 12),
+    ("", "3.49", "", 10),
+    ("2/", "5.00", "", 8),
+    ("3/", "10", "", 4),
+    ("2 /", "7.00", "", 2),
+    ("", "2 for $5", "", 3),
+    ("", "$3.99", "/lb", 6),
+    ("", "8.80", "/kg 3.99 lb", 4),
+    ("", "99¢", "", 3),
+    ("", "1.79", "/100 g", 3),
+    ("", "$1,299.99", "", 1),
+    ("SAVE", "$2", "", 2),
+    ("", "", "", 6),
+    (None, None, None, 4),
+    ("", "12.00", "ea", 3),
+]
+
+SALE_STORIES = ["", "", "", "SAVE $2", "Bonus 500 Scene+ points", "Buy 1 Get 1 Free", None]
+
+CATEGORIES = [
+    ("Meat & Seafood", "Chicken"), ("Meat & Seafood", "Beef"), ("Produce", "Fruit"),
+    ("Produce", "Vegetables"), ("Dairy & Eggs", "Cheese"), ("Bakery", "Bread"),
+    ("Pantry", "Pasta"), ("Frozen", "Pizza"), ("Household", "Cleaning"),
+]
+
+NAMES = [
+    "Boneless Skinless Chicken Breasts", "Lean Ground Beef", "Gala Apples", "English Cucumbers",
+    "Old Cheddar Cheese", "Whole Wheat Bread", "Spaghetti", "Rising Crust Pizza",
+    "Laundry Detergent", "Atlantic Salmon Fillets", "Greek Yogurt", "Strawberries",
+]
+
+BRANDS = ["Compliments", "Maple Leaf", "Kraft", "Dempster's", "Barilla", None, ""]
+
+
+def _weighted(rng: random.Random, table: List[Tuple[Any, ...]]) -> Tuple[Any, ...]:
+    return rng.choices(table, weights=[t[-1] for t in table])[0]
+
+
+def _flyer(i: int, base_id: int) -> Dict[str, Any]:
+    day = 10 + (i % 7)
+    return {
+        "flyer_id": base_id + i,
+        "valid_from": f"2026-10-{day:02d}T00:00:00-04:00",
+        "valid_to": f"2026-10-{day + 6:02d}T23:59:59-04:00",
+    }
+
+
+def _flyer_for(rng: random.Random, flyers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return flyers[rng.randrange(len(flyers))]
+
+
+def sobeys_items(n: int, seed: int) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    flyers = [_flyer(i, 7_100_000) for i in range(max(1, n // ITEMS_PER_FLYER))]
+    for i in range(n):
+        pre, text, post, _ = _weighted(rng, SOBEYS_PRICES)
+        flyer = _flyer_for(rng, flyers)
+        l1, l2 = CATEGORIES[rng.randrange(len(CATEGORIES))]
+        it: Dict[str, Any] = {
+            "id": 900_000_000 + i,
+            "flyer_id": flyer["flyer_id"],
+            "name": f"{NAMES[rng.randrange(len(NAMES))]} {i % 97}",
+            "brand": rng.choice(BRANDS),
+            "pre_price_text": pre,
+            "price_text": text,
+            "post_price_text": post,
+            "original_price": rng.choice([None, None, "5.99", "7.49"]),
+            "sale_story": rng.choice(SALE_STORIES),
+            "valid_from": flyer["valid_from"],
+            "valid_to": flyer["valid_to"],
+            "image_url": f"https://f.wishabi.net/page_items/{900_000_000 + i}/1.jpg",
+            "page": rng.randint(1, 24),
+        }
+        if rng.random() < 0.8:
+            it["description"] = rng.choice(["Selected varieties", "4 x 100 g", "Family size", ""])
+        if rng.random() < 0.85:
+            it["item_categories"] = {
+                "l1": {"category_name": l1, "google_category_id": 422},
+                "l2": {"category_name": l2, "google_category_id": None},
+            }
+        if rng.random() < 0.05:
+            it["valid_to"] = None  # open-ended rows exist
+        yield it
+
+
+def walmart_items(n: int, seed: int) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed + 1)
+    flyers = [_flyer(i, 7_200_000) for i in range(max(1, n // ITEMS_PER_FLYER))]
+    for i in range(n):
+        flyer = _flyer_for(rng, flyers)
+        pre, _, post, _ = _weighted(rng, SOBEYS_PRICES)
+        is_flyer = rng.random() < 0.9
+        l1, l2 = CATEGORIES[rng.randrange(len(CATEGORIES))]
+        price: Optional[Any] = rng.choice([3.97, 4.47, 1.97, 12.98, 0.88, None, "2.50"])
+        it: Dict[str, Any] = {
+            "id": 800_000_000 + i,
+            "flyer_item_id": 800_000_000 + i,
+            "flyer_id": flyer["flyer_id"],
+            "item_type": "flyer" if is_flyer else "ecom",
+            "merchant_name": "Walmart" if rng.random() < 0.95 else "Real Canadian Superstore",
+            "name": f"{NAMES[rng.randrange(len(NAMES))]} {i % 89}",
+            "current_price": price,
+            "original_price": rng.choice([None, 5.97]),
+            "pre_price_text": pre or "",
+            "post_price_text": post or "",
+            "sale_story": rng.choice(SALE_STORIES),
+            "valid_from": flyer["valid_from"],
+            "valid_to": flyer["valid_to"],
+            "clean_image_url": f"https://f.wishabi.net/page_items/{800_000_000 + i}/clean.jpg",
+        }
+        if rng.random() < 0.9:
+            it["_L1"] = l1
+            it["_L2"] = l2
+        yield it
+
+
+def _write_array(f, items: Iterator[Dict[str, Any]], indent: str) -> None:
+    f.write("[")
+    first = True
+    for it in items:
+        f.write("\n" + indent if first else ",\n" + indent)
+        f.write(json.dumps(it, ensure_ascii=False))
+        first = False
+    f.write("\n" + indent[:-2] + "]" if not first else "]")
+
+
+def generate(n: int, out_dir: Path, seed: int = 1) -> Dict[str, Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sobeys = out_dir / "sobeys_products.json"
+    walmart = out_dir / "walmart_products.json"
+
+    with sobeys.open("w", encoding="utf-8") as f:
+        _write_array(f, sobeys_items(n, seed), "  ")
+
+    with walmart.open("w", encoding="utf-8") as f:
+        f.write('{"source": "synthetic", "retrieved_at": "2026-10-15T12:00:00+00:00",\n')
+        f.write(' "request": {"url": "https://backflipp.wishabi.com/flipp/items/search"},\n')
+        f.write(' "data": {"ecom_items": [], "items": ')
+        _write_array(f, walmart_items(n, seed), "    ")
+        f.write("}}\n")
+
+    return {"sobeys": sobeys, "walmart": walmart}
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Write synthetic Sobeys + Walmart raw feeds.")
+    ap.add_argument("--items", type=int, default=10_000, help="items per feed")
+    ap.add_argument("--dir", type=Path, default=Path("."), help="writes <dir>/out/*_products.json")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+    paths = generate(max(0, args.items), args.dir / "out", args.seed)
+    for name, path in paths.items():
+        print(f"[gen] {name}: {path} ({args.items} items, {path.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""`python -m collectors run ...`: the single-process pipeline (see pipeline.py)."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pipeline  # noqa: E402
+
+if __name__ == "__main__":
+    sys.exit(pipeline.main())
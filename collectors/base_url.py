@@ -0,0 +1,33 @@
+"""
+Base-URL override for the live endpoints the collectors hit, so a capture can
+run against collectors/fixture_server.py (or any other mirror) instead:
+
+  FLYER_BASE_URL=http://127.0.0.1:8765 python collectors/capture_all.py fanout
+
+rebase() keeps the path and query of a live URL and moves its host into the
+first path segment under the override, so one server can tell the hosts apart
+and map a request back to the live URL (live_url()):
+
+  https://backflipp.wishabi.com/flipp/items/search
+    -> http://127.0.0.1:8765/backflipp.wishabi.com/flipp/items/search
+
+The host stays part of the URL, so patterns such as the collectors'
+PRODUCTS_RE (dam.flippenterprise.net/.../products?...) still match. Without
+the override every URL is returned unchanged.
+"""
+import os
+from urllib.parse import urlsplit
+
+BASE = os.environ.get("FLYER_BASE_URL", "").rstrip("/")
+
+
+def rebase(url: str, base: str = BASE) -> str:
+    if not base:
+        return url
+    parts = urlsplit(url)
+    return f"{base}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def live_url(path: str) -> str:
+    """The live URL behind a rebased request path ("/<host>/<path>?<query>")."""
+    return "https://" + path.lstrip("/")
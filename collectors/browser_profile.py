@@ -0,0 +1,122 @@
+"""
+Warm browser state for the Playwright collectors.
+
+A capture run launches one Chromium and gives each retailer its own context,
+restored from the retailer's saved storage state (cookies, localStorage)
+under .cache/browser/state/<retailer>.json, carried between runs with the
+rest of .cache. The context is kept for the retailer's retries, each attempt
+only opening a fresh page, and its storage state is saved back when the run
+closes it. Cookie banners and store-selection redirects are therefore paid
+once, and a retry also reuses the context's HTTP cache from the earlier
+attempt. Chromium's HTTP cache itself is not kept between runs: contexts of
+a shared browser are off the record.
+
+Time-to-feed is kept per retailer for warm and cold launches in
+.cache/browser/time_to_feed.json, and the medians are reported next to the
+capture stats.
+
+WARM_PROFILE=0 never restores or saves state (always cold).
+"""
+import json
+import os
+import statistics
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROFILE_ROOT = Path(".cache/browser")
+STATE_DIR = PROFILE_ROOT / "state"
+HISTORY_PATH = PROFILE_ROOT / "time_to_feed.json"
+HISTORY_KEEP = 20
+
+# chromium.launch() options for the shared browser
+BROWSER_OPTIONS: Dict[str, Any] = {"headless": True}
+
+_history_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.environ.get("WARM_PROFILE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def state_path(retailer: str) -> Path:
+    return STATE_DIR / f"{retailer}.json"
+
+
+def is_warm(retailer: str) -> bool:
+    """Whether the retailer has storage state saved by an earlier run."""
+    return enabled() and state_path(retailer).is_file()
+
+
+def context_options(retailer: str, **context_options: Any) -> Dict[str, Any]:
+    """Keyword arguments for browser.new_context(), with the saved state if any."""
+    if is_warm(retailer):
+        return {"storage_state": str(state_path(retailer)), **context_options}
+    return dict(context_options)
+
+
+def new_context(browser, retailer: str, **context_options_: Any):
+    """Sync API: the retailer's context on a shared browser."""
+    return browser.new_context(**context_options(retailer, **context_options_))
+
+
+async def new_context_async(browser, retailer: str, **context_options_: Any):
+    """Async API counterpart of new_context()."""
+    return await browser.new_context(**context_options(retailer, **context_options_))
+
+
+def _state_target(retailer: str) -> Optional[Path]:
+    if not enabled():
+        return None
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    return state_path(retailer)
+
+
+def save_state(ctx, retailer: str) -> None:
+    """Sync API: keep the context's storage state for the next run."""
+    path = _state_target(retailer)
+    if path is not None:
+        try:
+            ctx.storage_state(path=str(path))
+        except Exception as e:
+            print(f"[{retailer}] could not save browser state: {e}")
+
+
+async def save_state_async(ctx, retailer: str) -> None:
+    """Async API counterpart of save_state()."""
+    path = _state_target(retailer)
+    if path is not None:
+        try:
+            await ctx.storage_state(path=str(path))
+        except Exception as e:
+            print(f"[{retailer}] could not save browser state: {e}")
+
+
+def _median(xs: List[float]) -> Optional[float]:
+    return round(statistics.median(xs), 3) if xs else None
+
+
+def record_time_to_feed(retailer: str, warm: bool, seconds: Optional[float]) -> Dict[str, Any]:
+    """Add one sample; returns the warm vs cold summary for the retailer."""
+    with _history_lock:
+        try:
+            data = json.loads(HISTORY_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            data = {}
+        hist = data.setdefault(retailer, {"warm": [], "cold": []})
+        if seconds is not None:
+            kind = hist["warm" if warm else "cold"]
+            kind.append(seconds)
+            del kind[:-HISTORY_KEEP]
+            HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+            HISTORY_PATH.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+    summary = {
+        "warm_median_s": _median(hist["warm"]),
+        "cold_median_s": _median(hist["cold"]),
+        "warm_samples": len(hist["warm"]),
+        "cold_samples": len(hist["cold"]),
+    }
+    if summary["warm_median_s"] and summary["cold_median_s"]:
+        summary["warm_speedup"] = round(summary["cold_median_s"] / summary["warm_median_s"], 2)
+    return summary
@@ -0,0 +1,406 @@
+"""
+Run every retailer capture concurrently.
+
+One Chromium is shared by every browser-based retailer, each in its own
+context restored from its warm storage state (see browser_profile.py); a
+retailer's context is kept for its retries, so an attempt only opens and
+closes a page. The browser is only launched if some retailer actually needs
+it: a retailer whose products URL is still in the feed URL cache is fetched
+over plain HTTP. HTTP-only captures (Flipp) run in worker threads alongside them.
+Every retailer has its own deadline and its own result, so one slow or broken
+store never holds up (or fails) the others. Raw documents are saved to out/,
+or kept in memory for the rest of an in-process run (pipeline.py).
+
+Usage:
+  python collectors/capture_all.py                 # default retailers
+  python collectors/capture_all.py sobeys_flipp walmart   # no browser at all
+  python collectors/capture_all.py sobeys walmart_browser --deadline 90
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+import browser_profile
+import feed_url_cache
+import flipp_fanout
+import http_cache
+import lean_capture
+import run_manifest
+import sobeys_capture
+import sobeys_flipp_capture
+import walmart_capture
+import walmart_flipp_capture
+
+REPORT_PATH = Path("out/capture_report.json")
+
+DEFAULT_RETAILERS = ["sobeys", "walmart"]
+DEADLINE_S = 180.0
+ATTEMPTS = 2
+
+
+@dataclass
+class CaptureResult:
+    retailer: str
+    ok: bool
+    seconds: float
+    attempts: int
+    out_path: Optional[str] = None
+    error: Optional[str] = None
+    # parts of an ok capture that failed (e.g. a fan-out location or flyer)
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class Partial:
+    """What a capture returns when it succeeded without some of its parts."""
+    out_path: Any
+    failures: List[Dict[str, Any]]
+
+
+class RawSink:
+    """
+    Where a capture puts its raw documents: saved to out/ by the collector's
+    own save() (the default), or, with `keep`, kept in that dict under the
+    names normalize.normalize_all(raw=...) reads (an in-process run).
+    """
+
+    def __init__(self, keep: Optional[Dict[str, Any]] = None):
+        self.keep = keep
+
+    def put(self, name: str, doc: Any, save: Callable[[Any], None]) -> None:
+        if self.keep is None:
+            save(doc)
+        else:
+            self.keep[name] = doc
+
+
+async def _screenshot(page, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        await page.screenshot(path=str(path), full_page=True)
+    except Exception:
+        pass
+
+
+class LazyBrowser:
+    """
+    One Chromium, launched on first use; each retailer gets its own context
+    on it, created on first use and kept for its retries. Retailers create
+    their contexts concurrently; only the browser launch itself is shared.
+    """
+
+    def __init__(self, playwright):
+        self._pw = playwright
+        self._browser: Optional[asyncio.Task] = None
+        self._contexts: Dict[str, asyncio.Task] = {}
+        self._warm: Dict[str, bool] = {}
+
+    async def _new_context(self, retailer: str, context_options: Dict[str, Any]):
+        if self._browser is None:
+            self._browser = asyncio.ensure_future(self._pw.chromium.launch(**browser_profile.BROWSER_OPTIONS))
+        launching = self._browser
+        try:
+            browser = await launching
+        except Exception:
+            if self._browser is launching:
+                self._browser = None  # let the next attempt launch again
+            raise
+        return await browser_profile.new_context_async(browser, retailer, **context_options)
+
+    async def context(self, retailer: str, **context_options: Any):
+        """(context, warm): warm if the retailer's state was used before, in an earlier run or attempt."""
+        task = self._contexts.get(retailer)
+        reused = task is not None
+        if task is None:
+            self._warm[retailer] = browser_profile.is_warm(retailer)
+            task = self._contexts[retailer] = asyncio.ensure_future(self._new_context(retailer, context_options))
+        try:
+            # Shielded: a retailer hitting its deadline must not cancel a launch others wait on.
+            ctx = await asyncio.shield(task)
+        except Exception:
+            if self._contexts.get(retailer) is task:
+                del self._contexts[retailer]  # the next attempt tries again
+            raise
+        return ctx, reused or self._warm[retailer]
+
+    async def close(self) -> None:
+        for retailer, task in self._contexts.items():
+            if not _succeeded(task):
+                continue
+            await browser_profile.save_state_async(task.result(), retailer)
+            try:
+                await task.result().close()
+            except Exception:
+                pass
+        if self._browser is not None and _succeeded(self._browser):
+            try:
+                await self._browser.result().close()
+            except Exception:
+                pass
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is None
+
+
+async def capture_sobeys(browsers: LazyBrowser, lean: bool, sink: RawSink) -> Any:
+    data = await asyncio.to_thread(feed_url_cache.fetch_cached, "sobeys", sobeys_capture.fetch_json)
+    if data is not None:
+        sink.put("sobeys", data, sobeys_capture.save)
+        return sobeys_capture.OUT_PATH
+
+    ctx, warm = await browsers.context("sobeys")
+    stats = lean_capture.CaptureStats("sobeys", lean, warm)
+    page = await ctx.new_page()
+    try:
+        page.set_default_navigation_timeout(120_000)
+        page.set_default_timeout(120_000)
+        await lean_capture.install_async(page, stats)
+        try:
+            stats.start()
+            async with page.expect_response(
+                lambda r: bool(sobeys_capture.PRODUCTS_RE.search(r.url)), timeout=120_000
+            ) as resp_info:
+                await page.goto(sobeys_capture.STORE_URL, wait_until="domcontentloaded")
+            resp = await resp_info.value
+            stats.feed_seen()
+            data = await resp.json()
+        except Exception:
+            await _screenshot(page, sobeys_capture.DEBUG_SHOT)
+            raise
+    finally:
+        await page.close()
+        lean_capture.write_stats(stats)
+
+    http_cache.mark_changed("sobeys:browser")
+    feed_url_cache.put("sobeys", resp.url)
+    sink.put("sobeys", data, sobeys_capture.save)
+    return sobeys_capture.OUT_PATH
+
+
+async def capture_walmart_browser(browsers: LazyBrowser, lean: bool, sink: RawSink) -> Any:
+    data = await asyncio.to_thread(feed_url_cache.fetch_cached, "walmart", walmart_capture.fetch_json)
+    if data is not None:
+        sink.put("walmart", data, walmart_capture.save)
+        return walmart_capture.OUT_PATH
+
+    ctx, warm = await browsers.context("walmart", **walmart_capture.CONTEXT_OPTIONS)
+    stats = lean_capture.CaptureStats("walmart", lean, warm)
+    page = await ctx.new_page()
+    try:
+        page.set_default_timeout(120_000)
+        page.set_default_navigation_timeout(120_000)
+
+        seen = {"url": None}
+        await lean_capture.install_async(page, stats)
+
+        def on_request(req):
+            if walmart_capture.PRODUCTS_RE.search(req.url):
+                seen["url"] = req.url
+                stats.feed_seen()
+
+        page.on("request", on_request)
+
+        async def wait_for_feed(ms: int) -> None:
+            for _ in range(0, ms, 250):
+                if seen["url"]:
+                    return
+                await page.wait_for_timeout(250)
+
+        try:
+            stats.start()
+            await page.goto(walmart_capture.STORE_URL, wait_until="domcontentloaded")
+            await wait_for_feed(5000)
+            if not seen["url"]:
+                await page.mouse.wheel(0, 2000)
+                await wait_for_feed(4000)
+            if not seen["url"]:
+                raise RuntimeError("Did not observe Walmart products feed request URL.")
+        except Exception:
+            await _screenshot(page, walmart_capture.DEBUG_SHOT)
+            raise
+    finally:
+        await page.close()
+        lean_capture.write_stats(stats)
+
+    # The feed itself is a plain GET; keep it off the event loop.
+    data = await asyncio.to_thread(walmart_capture.fetch_json, seen["url"])
+    feed_url_cache.put("walmart", seen["url"])
+    sink.put("walmart", data, walmart_capture.save)
+    return walmart_capture.OUT_PATH
+
+
+async def capture_sobeys_flipp(browsers: LazyBrowser, lean: bool, sink: RawSink) -> Any:
+    items = await asyncio.to_thread(sobeys_flipp_capture.capture)
+    sink.put("sobeys", items, sobeys_flipp_capture.save)
+    return sobeys_flipp_capture.OUT_PATH
+
+
+async def capture_fanout(browsers: LazyBrowser, lean: bool, sink: RawSink) -> Any:
+    docs = await asyncio.to_thread(flipp_fanout.capture)
+    if sink.keep is None:
+        flipp_fanout.save(docs)
+    else:
+        sink.keep.update(docs)
+    flipp_fanout.check(docs)
+    failures = flipp_fanout.failures(docs)
+    return Partial(flipp_fanout.MEMBERSHIP_PATH, failures) if failures else flipp_fanout.MEMBERSHIP_PATH
+
+
+async def capture_walmart_flipp(browsers: LazyBrowser, lean: bool, sink: RawSink) -> Any:
+    payload = await asyncio.to_thread(walmart_flipp_capture.capture)
+    sink.put("walmart", payload, walmart_flipp_capture.save)
+    return walmart_flipp_capture.OUT_PATH
+
+
+CaptureFn = Callable[[LazyBrowser, bool, RawSink], Awaitable[Any]]
+
+CAPTURES: Dict[str, CaptureFn] = {
+    "sobeys": capture_sobeys,
+    "sobeys_flipp": capture_sobeys_flipp,
+    "walmart": capture_walmart_flipp,
+    "walmart_browser": capture_walmart_browser,
+    # every store in stores.json, one download per distinct flyer
+    "fanout": capture_fanout,
+}
+
+
+async def _run_one(
+    name: str,
+    fn: CaptureFn,
+    browsers: LazyBrowser,
+    deadline_s: float,
+    attempts: int,
+    lean: bool,
+    sink: RawSink,
+) -> CaptureResult:
+    # Each gathered task runs in its own context, so this stage is only
+    # "current" for this retailer (and the threads it hands work to).
+    with run_manifest.stage(f"capture.{name}") as st:
+        result = await _attempt_all(name, fn, browsers, deadline_s, attempts, lean, sink)
+        st.add(retries=max(0, result.attempts - 1))
+        if not result.ok:
+            st.fail(result.error)
+    return result
+
+
+async def _attempt_all(
+    name: str,
+    fn: CaptureFn,
+    browsers: LazyBrowser,
+    deadline_s: float,
+    attempts: int,
+    lean: bool,
+    sink: RawSink,
+) -> CaptureResult:
+    t0 = time.monotonic()
+    last_err: Optional[BaseException] = None
+    attempt = 0
+
+    async def _attempts():
+        nonlocal last_err, attempt
+        for attempt in range(1, attempts + 1):
+            try:
+                # Lean mode on the first attempt only; retries load the full page.
+                return await fn(browsers, lean and attempt == 1, sink)
+            except Exception as e:
+                last_err = e
+                print(f"[capture/{name}] attempt {attempt} failed: {e}")
+        return None
+
+    try:
+        out_path = await asyncio.wait_for(_attempts(), timeout=deadline_s)
+    except asyncio.TimeoutError:
+        out_path = None
+        last_err = TimeoutError(f"deadline of {deadline_s:.0f}s exceeded")
+
+    elapsed = time.monotonic() - t0
+    if isinstance(out_path, Partial):
+        return CaptureResult(name, True, round(elapsed, 3), attempt, out_path=str(out_path.out_path),
+                             failures=out_path.failures)
+    if out_path is not None:
+        return CaptureResult(name, True, round(elapsed, 3), attempt, out_path=str(out_path))
+    return CaptureResult(name, False, round(elapsed, 3), attempt, error=str(last_err))
+
+
+async def capture_all(
+    retailers: List[str],
+    deadline_s: float = DEADLINE_S,
+    attempts: int = ATTEMPTS,
+    lean: bool = False,
+    raw: Optional[Dict[str, Any]] = None,
+    reset_status: bool = False,
+) -> List[CaptureResult]:
+    """
+    Capture `retailers` concurrently. Raw documents are saved to out/, or,
+    given a `raw` dict, kept in it instead (see RawSink). With `reset_status`
+    the fetch results of earlier runs are dropped from out/http_status.json
+    first; otherwise this run's are added to them (e.g. the workflow's
+    fallback capture after the fan-out).
+    """
+    unknown = [r for r in retailers if r not in CAPTURES]
+    if unknown:
+        raise RuntimeError(f"Unknown retailer(s): {', '.join(unknown)}")
+
+    if reset_status:
+        http_cache.reset()
+    sink = RawSink(raw)
+    async with async_playwright() as p:
+        browsers = LazyBrowser(p)
+        try:
+            return await asyncio.gather(*[
+                _run_one(r, CAPTURES[r], browsers, deadline_s, attempts, lean, sink)
+                for r in retailers
+            ])
+        finally:
+            await browsers.close()
+
+
+def write_report(results: List[CaptureResult], wall_s: float) -> None:
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "wall_seconds": round(wall_s, 3),
+        "results": [asdict(r) for r in results],
+    }
+    REPORT_PATH.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def report(results: List[CaptureResult], wall_s: float, in_memory: bool = False) -> None:
+    """Log every result and write the capture report."""
+    for r in results:
+        if r.ok:
+            partial = f" ({len(r.failures)} parts failed)" if r.failures else ""
+            print(f"[capture/{r.retailer}] ok in {r.seconds:.1f}s{partial} -> {'(in memory)' if in_memory else r.out_path}")
+        else:
+            print(f"[capture/{r.retailer}] FAILED in {r.seconds:.1f}s: {r.error}")
+    print(f"[capture] {sum(r.ok for r in results)}/{len(results)} retailers in {wall_s:.1f}s wall")
+    write_report(results, wall_s)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Capture all retailer feeds concurrently.")
+    ap.add_argument("retailers", nargs="*", default=DEFAULT_RETAILERS, help=f"one of: {', '.join(CAPTURES)}")
+    ap.add_argument("--deadline", type=float, default=DEADLINE_S, help="per-retailer deadline in seconds")
+    ap.add_argument("--attempts", type=int, default=ATTEMPTS, help="attempts per retailer within its deadline")
+    ap.add_argument("--lean", action="store_true", default=lean_capture.enabled(),
+                    help="block non-essential requests (default: LEAN_CAPTURE env)")
+    ap.add_argument("--reset-status", action="store_true",
+                    help="start a new out/http_status.json (first capture of a run) instead of adding to it")
+    args = ap.parse_args(argv)
+
+    t0 = time.monotonic()
+    results = asyncio.run(capture_all(args.retailers, args.deadline, args.attempts, args.lean,
+                                      reset_status=args.reset_status))
+    report(results, time.monotonic() - t0)
+    return 0 if any(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
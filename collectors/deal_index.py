@@ -0,0 +1,303 @@
+"""
+SQLite deal index (out/deals.sqlite) built from the merged normalized feed.
+
+Typed columns for every field of a normalized item, b-tree indexes on
+retailer / flyer_id / category l1+l2 / price, and an FTS5 table over
+title, brand and description, so lookups don't need a full JSON parse.
+
+Query examples:
+  python collectors/deal_index.py chicken --valid-on today --per-retailer 1
+  python collectors/deal_index.py "ground beef" --retailer sobeys --max-price 10
+  python collectors/deal_index.py --category Dairy --limit 50 --json
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+DB_PATH = Path("out/deals.sqlite")
+
+_SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE flyers (
+    flyer_id TEXT NOT NULL,
+    retailer TEXT NOT NULL,
+    valid_from TEXT,
+    valid_to TEXT,
+    PRIMARY KEY (retailer, flyer_id)
+);
+CREATE TABLE deals (
+    id INTEGER PRIMARY KEY,
+    retailer TEXT NOT NULL,
+    source_item_id TEXT,
+    flyer_id TEXT,
+    title TEXT NOT NULL,
+    brand TEXT,
+    description TEXT,
+    price_value REAL,
+    price_unit TEXT,
+    price_unit_value REAL,
+    multi_buy_qty INTEGER,
+    price_pre TEXT,
+    price_text TEXT,
+    price_post TEXT,
+    currency TEXT,
+    original_price REAL,
+    sale_story TEXT,
+    valid_from TEXT,
+    valid_to TEXT,
+    category_l1 TEXT,
+    category_l2 TEXT,
+    category_l3 TEXT,
+    image_url TEXT,
+    page INTEGER,
+    promo_only INTEGER NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX deals_retailer ON deals(retailer);
+CREATE INDEX deals_flyer ON deals(flyer_id);
+CREATE INDEX deals_category ON deals(category_l1, category_l2);
+CREATE INDEX deals_category_l2 ON deals(category_l2);
+CREATE INDEX deals_price ON deals(price_value);
+CREATE VIRTUAL TABLE deals_fts USING fts5(
+    title, brand, description,
+    content='deals', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+INSERT INTO deals_fts(rowid, title, brand, description)
+    SELECT id, title, brand, description FROM deals;
+"""
+
+_INSERT = """
+INSERT INTO deals (
+    retailer, source_item_id, flyer_id, title, brand, description,
+    price_value, price_unit, price_unit_value, multi_buy_qty,
+    price_pre, price_text, price_post, currency,
+    original_price, sale_story, valid_from, valid_to,
+    category_l1, category_l2, category_l3, image_url, page, promo_only
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _cat(item: Dict[str, Any], level: str) -> Optional[str]:
+    c = (item.get("categories") or {}).get(level)
+    return c.get("name") if isinstance(c, dict) else None
+
+
+def _row(item: Dict[str, Any]) -> tuple:
+    price = item.get("price") or {}
+    return (
+        item.get("retailer"),
+        item.get("source_item_id"),
+        item.get("flyer_id"),
+        item.get("title") or "",
+        item.get("brand"),
+        item.get("description"),
+        price.get("value"),
+        price.get("unit"),
+        price.get("unit_value"),
+        price.get("multi_buy_qty"),
+        price.get("pre"),
+        price.get("text"),
+        price.get("post"),
+        price.get("currency"),
+        item.get("original_price"),
+        item.get("sale_story"),
+        item.get("valid_from"),
+        item.get("valid_to"),
+        _cat(item, "l1"),
+        _cat(item, "l2"),
+        _cat(item, "l3"),
+        item.get("image_url"),
+        item.get("page"),
+        1 if item.get("promo_only") else 0,
+    )
+
+
+def build_index(
+    items: Iterable[Dict[str, Any]],
+    flyers: Iterable[Dict[str, Any]] = (),
+    meta: Optional[Dict[str, Any]] = None,
+    db_path: Path = DB_PATH,
+    batch: int = 5000,
+) -> int:
+    """(Re)build the index from merged items (each carrying `retailer`). Returns the item count."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = db_path.with_suffix(".sqlite.tmp")
+    if tmp.exists():
+        tmp.unlink()
+
+    conn = sqlite3.connect(str(tmp))
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(_SCHEMA)
+
+        n = 0
+        buf: List[tuple] = []
+        for it in items:
+            buf.append(_row(it))
+            if len(buf) >= batch:
+                conn.executemany(_INSERT, buf)
+                n += len(buf)
+                buf.clear()
+        if buf:
+            conn.executemany(_INSERT, buf)
+            n += len(buf)
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO flyers (flyer_id, retailer, valid_from, valid_to) VALUES (?, ?, ?, ?)",
+            ((f.get("flyer_id"), f.get("retailer"), f.get("valid_from"), f.get("valid_to")) for f in flyers),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            ((k, json.dumps(v)) for k, v in (meta or {}).items()),
+        )
+
+        # Indexes after the bulk load: one sort each instead of n incremental updates.
+        conn.executescript(_INDEXES)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp, db_path)
+    return n
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+_word_re = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match (as a prefix)."""
+    words = _word_re.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def connect(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    if not db_path.exists():
+        raise RuntimeError(f"{db_path} not found; run normalize.py first")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def search(
+    conn: sqlite3.Connection,
+    text: Optional[str] = None,
+    retailer: Optional[str] = None,
+    category: Optional[str] = None,
+    valid_on: Optional[str] = None,
+    max_price: Optional[float] = None,
+    include_promo_only: bool = False,
+    per_retailer: Optional[int] = None,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    Cheapest-first deal search. Items are ranked by unit price when known
+    (multi-buys), else by price. `valid_on` is a YYYY-MM-DD date; `category`
+    matches l1 or l2; `per_retailer` keeps the N cheapest per store.
+    """
+    where: List[str] = []
+    params: List[Any] = []
+
+    fts = _fts_query(text) if text else None
+    if fts:
+        where.append("d.id IN (SELECT rowid FROM deals_fts WHERE deals_fts MATCH ?)")
+        params.append(fts)
+    if retailer:
+        where.append("d.retailer = ?")
+        params.append(retailer)
+    if category:
+        where.append("(d.category_l1 = ? OR d.category_l2 = ?)")
+        params += [category, category]
+    if valid_on:
+        where.append("(d.valid_from IS NULL OR substr(d.valid_from, 1, 10) <= ?)")
+        where.append("(d.valid_to IS NULL OR substr(d.valid_to, 1, 10) >= ?)")
+        params += [valid_on, valid_on]
+    if max_price is not None:
+        where.append("COALESCE(d.price_unit_value, d.price_value) <= ?")
+        params.append(max_price)
+    if not include_promo_only:
+        where.append("d.price_value IS NOT NULL")
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    order = "COALESCE(d.price_unit_value, d.price_value) IS NULL, COALESCE(d.price_unit_value, d.price_value), d.title"
+
+    if per_retailer:
+        sql = f"""
+            SELECT * FROM (
+                SELECT d.*, ROW_NUMBER() OVER (PARTITION BY d.retailer ORDER BY {order}) AS rank_in_retailer
+                FROM deals d {where_sql}
+            ) WHERE rank_in_retailer <= ?
+            ORDER BY COALESCE(price_unit_value, price_value) IS NULL, COALESCE(price_unit_value, price_value), title
+            LIMIT ?
+        """
+        params += [per_retailer, limit]
+    else:
+        sql = f"SELECT d.* FROM deals d {where_sql} ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Query the deal index (out/deals.sqlite).")
+    ap.add_argument("text", nargs="?", help="words to match in title/brand/description")
+    ap.add_argument("--retailer")
+    ap.add_argument("--category", help="category name (l1 or l2)")
+    ap.add_argument("--valid-on", help="YYYY-MM-DD or 'today'")
+    ap.add_argument("--max-price", type=float)
+    ap.add_argument("--per-retailer", type=int, help="keep only the N cheapest per retailer")
+    ap.add_argument("--promo-only", action="store_true", help="include items without a numeric price")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="print JSON rows")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    args = ap.parse_args(argv)
+
+    valid_on = date.today().isoformat() if args.valid_on == "today" else args.valid_on
+
+    conn = connect(args.db)
+    try:
+        rows = search(
+            conn, args.text, args.retailer, args.category, valid_on, args.max_price,
+            args.promo_only, args.per_retailer, args.limit,
+        )
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return 0
+
+    for r in rows:
+        price = "promo" if r["price_value"] is None else f"${r['price_value']:.2f}"
+        if r["multi_buy_qty"] and r["price_unit_value"] is not None:
+            price += f" (${r['price_unit_value']:.2f} ea)"
+        elif r["price_unit"] and r["price_unit"] != "ea":
+            price += f"/{r['price_unit']}"
+        print(f"{r['retailer']:<8} {price:<22} {r['title']}")
+    if not rows:
+        print("(no matches)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
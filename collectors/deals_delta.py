@@ -0,0 +1,194 @@
+"""
+Week-over-week delta of the merged normalized feed (out/deals_delta.json).
+
+Items are matched on (retailer, source_item_id, flyer_id) against the
+previous run and reported as added, removed or price-changed; unchanged items
+are only counted. Consumers that poll weekly can fetch this instead of the
+full deals_*.normalized.json files.
+
+The previous run is a compact snapshot in .cache/delta/ (carried between CI
+runs with the rest of .cache); after writing the delta the current run
+becomes the new snapshot. Without a snapshot every item is reported as added
+and the delta is marked "baseline".
+
+Usage:
+  python collectors/deals_delta.py [--previous PATH] [--no-rotate]
+
+--previous also accepts a full deals_all.normalized.json from an older run;
+a run against an explicit --previous is a one-off comparison and leaves both
+that file and the cached snapshot alone.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import run_manifest
+from normalize import ALL_NORM, OUT_DIR, SCHEMA_VERSION, _iter_json_array
+
+DELTA_PATH = OUT_DIR / "deals_delta.json"
+SNAPSHOT_PATH = Path(".cache/delta/previous.json")
+
+# Price fields that make an item "price-changed"; text/pre/post are display only.
+PRICE_FIELDS = ("value", "unit", "multi_buy_qty", "unit_value")
+
+Key = Tuple[str, str, str]
+
+
+def item_key(item: Dict[str, Any]) -> Key:
+    return (str(item.get("retailer") or ""), str(item.get("source_item_id") or ""), str(item.get("flyer_id") or ""))
+
+
+def _price_sig(price: Any) -> Tuple[Any, ...]:
+    price = price if isinstance(price, dict) else {}
+    return tuple(price.get(k) for k in PRICE_FIELDS)
+
+
+def _compact(item: Dict[str, Any]) -> Dict[str, Any]:
+    """What the snapshot (and a `removed` entry) keeps of an item."""
+    return {
+        "retailer": item.get("retailer"),
+        "source_item_id": item.get("source_item_id"),
+        "flyer_id": item.get("flyer_id"),
+        "title": item.get("title"),
+        "price": item.get("price"),
+    }
+
+
+def load_previous(path: Path) -> Optional[Dict[str, Any]]:
+    """{"captured_at", "items": {key: compact item}}, or None without a previous run."""
+    if not path.exists():
+        return None
+    meta: Dict[str, Any] = {}
+    items: Dict[Key, Dict[str, Any]] = {}
+    for it in _iter_json_array(path, ("items",), meta):
+        items.setdefault(item_key(it), _compact(it))
+    return {"captured_at": meta.get("captured_at"), "items": items}
+
+
+class DeltaBuilder:
+    """compute_delta() one item at a time (add), for callers that feed several consumers in one pass."""
+
+    def __init__(self, previous: Optional[Dict[str, Any]]):
+        self.previous = previous
+        self.prev_items: Dict[Key, Dict[str, Any]] = previous["items"] if previous else {}
+        self.seen: Dict[Key, Dict[str, Any]] = {}
+        self.added: List[Dict[str, Any]] = []
+        self.changed: List[Dict[str, Any]] = []
+        self.unchanged = self.duplicates = 0
+
+    def add(self, it: Dict[str, Any]) -> None:
+        key = item_key(it)
+        if key in self.seen:
+            self.duplicates += 1
+            return
+        self.seen[key] = _compact(it)
+        old = self.prev_items.get(key)
+        if old is None:
+            self.added.append(it)
+        elif _price_sig(old.get("price")) != _price_sig(it.get("price")):
+            self.changed.append({**it, "previous_price": old.get("price")})
+        else:
+            self.unchanged += 1
+
+    def result(self) -> Dict[str, Any]:
+        removed = [old for key, old in self.prev_items.items() if key not in self.seen]
+        return {
+            "added": self.added,
+            "removed": removed,
+            "price_changed": self.changed,
+            "counts": {
+                "added": len(self.added),
+                "removed": len(removed),
+                "price_changed": len(self.changed),
+                "unchanged": self.unchanged,
+                "duplicate_keys": self.duplicates,
+            },
+            "_snapshot": list(self.seen.values()),
+        }
+
+
+def compute_delta(current: Iterable[Dict[str, Any]], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Diff the current items against `previous` (see load_previous). Returns the
+    delta document plus, under "_snapshot", the compact current items.
+    """
+    builder = DeltaBuilder(previous)
+    for it in current:
+        builder.add(it)
+    return builder.result()
+
+
+def write_delta(
+    current_path: Path = ALL_NORM,
+    previous_path: Path = SNAPSHOT_PATH,
+    out_path: Path = DELTA_PATH,
+    rotate: bool = True,
+    snapshot_path: Path = SNAPSHOT_PATH,
+) -> Dict[str, int]:
+    if not current_path.exists():
+        raise RuntimeError(f"{current_path} not found; run normalize.py first")
+
+    builder = DeltaBuilder(load_previous(previous_path))
+    meta: Dict[str, Any] = {}
+    for it in _iter_json_array(current_path, ("items",), meta):
+        builder.add(it)
+    return finish_delta(builder, meta.get("captured_at"), out_path, rotate, snapshot_path)
+
+
+def finish_delta(builder: DeltaBuilder, captured_at: Optional[str], out_path: Path = DELTA_PATH,
+                 rotate: bool = True, snapshot_path: Path = SNAPSHOT_PATH) -> Dict[str, int]:
+    """
+    Write the delta of everything added to `builder`; with `rotate`, the
+    current run becomes the snapshot at `snapshot_path`.
+    """
+    previous = builder.previous
+    delta = builder.result()
+    snapshot = delta.pop("_snapshot")
+
+    doc = {
+        "schema_version": SCHEMA_VERSION,
+        "captured_at": captured_at,
+        "previous_captured_at": previous["captured_at"] if previous else None,
+        "baseline": previous is None,
+        "key": ["retailer", "source_item_id", "flyer_id"],
+        **delta,
+    }
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding="utf-8")
+    run_manifest.wrote(out_path, items=len(delta["added"]) + len(delta["removed"]) + len(delta["price_changed"]))
+    c = delta["counts"]
+    print(
+        f"[delta] wrote {out_path} (+{c['added']} -{c['removed']} ~{c['price_changed']} "
+        f"={c['unchanged']}{', baseline' if previous is None else ''})"
+    )
+
+    if rotate:
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = snapshot_path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({"captured_at": captured_at, "items": snapshot}, ensure_ascii=False, separators=(",", ":")),
+            encoding="utf-8",
+        )
+        os.replace(tmp, snapshot_path)
+    return c
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Diff the merged normalized feed against the previous run.")
+    ap.add_argument("--current", type=Path, default=ALL_NORM)
+    ap.add_argument("--previous", type=Path, default=None,
+                    help="previous snapshot or deals_all.normalized.json to diff against, without "
+                         "rotating (default: the cached snapshot, which then rotates)")
+    ap.add_argument("--out", type=Path, default=DELTA_PATH)
+    ap.add_argument("--no-rotate", action="store_true",
+                    help=f"don't replace {SNAPSHOT_PATH} with a snapshot of the current run")
+    args = ap.parse_args(argv)
+    rotate = args.previous is None and not args.no_rotate
+    with run_manifest.stage("delta"):
+        write_delta(args.current, args.previous or SNAPSHOT_PATH, args.out, rotate=rotate)
+
+
+if __name__ == "__main__":
+    main()
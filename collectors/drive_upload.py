@@ -1,23 +1,97 @@
+import argparse
+import contextvars
+import hashlib
+import json
 import os
+import random
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import run_manifest
+
+# Startup clock: the Google client stack is imported on first use (not for
+# --fake-drive), so time from here to the first byte sent is what an upload
+# step pays before doing any work (see startup_report).
+_T0 = time.perf_counter()
+_startup: Dict[str, float] = {}
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 TOKEN_URI = "https://oauth2.googleapis.com/token"
 
+# Resumable upload chunk size; must be a multiple of 256 KiB.
+CHUNK_SIZE = int(os.environ.get("GDRIVE_CHUNK_MB", "8")) * 1024 * 1024
+WORKERS = int(os.environ.get("GDRIVE_UPLOAD_WORKERS", "4"))
+ATTEMPTS = 4
+
+CACHE_DIR = Path(".cache/drive")
+# Access token + expiry of the last refresh (never the refresh token), reused
+# until it expires; GDRIVE_TOKEN_CACHE=0 disables it.
+TOKEN_CACHE = CACHE_DIR / "token.json"
+# The Drive v3 discovery document cut down to the methods used here (and the
+# schemas they reference), so the service is built without loading the full one;
+# see discovery_cache_path() for the file name.
+DISCOVERY_METHODS = {"files": ("list", "create", "update")}
+
+
+def _mark(event: str) -> None:
+    """Seconds from startup to the first occurrence of `event`."""
+    _startup.setdefault(event, round(time.perf_counter() - _T0, 3))
+
+
+def startup_report() -> Dict[str, float]:
+    """Log the startup marks and record them on the current manifest stage (`timings`)."""
+    if _startup:
+        st = run_manifest.current()
+        for event, t in _startup.items():
+            st.timing(f"startup.{event}", t)
+        print("[drive] startup: " + ", ".join(f"{event} {t:.3f}s" for event, t in _startup.items()))
+    return dict(_startup)
+
+
+def _token_key(client_id: str, refresh_token: str) -> str:
+    return hashlib.sha256(f"{client_id}:{refresh_token}".encode("utf-8")).hexdigest()[:16]
+
+
+def _load_token(key: str) -> Tuple[Optional[str], Optional[datetime]]:
+    if os.environ.get("GDRIVE_TOKEN_CACHE", "1") == "0":
+        return None, None
+    try:
+        data = json.loads(TOKEN_CACHE.read_text(encoding="utf-8"))
+        if data.get("key") != key:
+            return None, None
+        return data["token"], datetime.fromisoformat(data["expiry"])
+    except Exception:
+        return None, None
+
+
+def _save_token(key: str, creds) -> None:
+    if os.environ.get("GDRIVE_TOKEN_CACHE", "1") == "0" or not creds.token or not creds.expiry:
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = TOKEN_CACHE.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "token": creds.token, "expiry": creds.expiry.isoformat()}, f)
+    os.replace(tmp, TOKEN_CACHE)
+
+
+def drive_credentials():
+    from google.oauth2.credentials import Credentials
 
-def drive_service():
     client_id = os.environ["GDRIVE_CLIENT_ID"]
     client_secret = os.environ["GDRIVE_CLIENT_SECRET"]
     refresh_token = os.environ["GDRIVE_REFRESH_TOKEN"]
 
+    key = _token_key(client_id, refresh_token)
+    token, expiry = _load_token(key)
     creds = Credentials(
-        token=None,
+        token=token,
+        expiry=expiry,  # naive UTC, as google-auth keeps it
         refresh_token=refresh_token,
         token_uri=TOKEN_URI,
         client_id=client_id,
@@ -25,9 +99,126 @@ def drive_service():
         scopes=SCOPES,
     )
 
-    # Exchange refresh_token -> access token
-    creds.refresh(Request())
-    return build("drive", "v3", credentials=creds)
+    # Exchange refresh_token -> access token, unless the cached one is still
+    # valid (google-auth treats it as expired a few minutes early).
+    if not creds.valid:
+        from google.auth.transport.requests import Request
+
+        creds.refresh(Request())
+        _save_token(key, creds)
+        _mark("token_refreshed")
+    else:
+        _mark("token_cached")
+    return creds
+
+
+def _schema_refs(node: Any, out: set) -> None:
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str):
+            out.add(ref)
+        for v in node.values():
+            _schema_refs(v, out)
+    elif isinstance(node, list):
+        for v in node:
+            _schema_refs(v, out)
+
+
+def trim_discovery(doc: Dict[str, Any], methods: Dict[str, Tuple[str, ...]] = DISCOVERY_METHODS) -> Dict[str, Any]:
+    """`doc` with only `methods` (resource -> method names) and the schemas they reach."""
+    resources = {r: {"methods": {m: doc["resources"][r]["methods"][m] for m in ms}} for r, ms in methods.items()}
+    schemas = doc.get("schemas") or {}
+    keep: set = set()
+    todo: set = set()
+    _schema_refs(resources, todo)
+    while todo:
+        name = todo.pop()
+        if name in keep or name not in schemas:
+            continue
+        keep.add(name)
+        _schema_refs(schemas[name], todo)
+    return {**doc, "resources": resources, "schemas": {k: schemas[k] for k in sorted(keep)}}
+
+
+def discovery_cache_path(methods: Dict[str, Tuple[str, ...]] = DISCOVERY_METHODS) -> Path:
+    """
+    Where the trimmed document for `methods` is cached: the name carries a hash
+    of `methods` and the installed google-api-python-client version, so adding
+    a method or upgrading the client (whose static copy may change) cuts a
+    fresh one instead of reusing a stale cache.
+    """
+    from importlib.metadata import version
+
+    key = json.dumps([methods, version("google-api-python-client")], sort_keys=True)
+    return CACHE_DIR / f"drive.v3.discovery.{hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]}.json"
+
+
+def discovery_document(path: Optional[Path] = None) -> Optional[str]:
+    """
+    The trimmed Drive v3 discovery document, cut from the copy shipped with
+    google-api-python-client on first use and cached in `path` (default
+    discovery_cache_path()); None if the client ships no static copy.
+    """
+    path = path or discovery_cache_path()
+    try:
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        pass
+    from googleapiclient import discovery_cache
+
+    full = discovery_cache.get_static_doc("drive", "v3")
+    if full is None:
+        return None
+    doc = json.dumps(trim_discovery(json.loads(full)), separators=(",", ":"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(doc, encoding="utf-8")
+    os.replace(tmp, path)
+    return doc
+
+
+def drive_service(creds=None):
+    creds = creds or drive_credentials()
+    from googleapiclient.discovery import build, build_from_document
+
+    doc = discovery_document()
+    if doc is None:
+        service = build("drive", "v3", credentials=creds)
+    else:
+        service = build_from_document(doc, credentials=creds)
+    _mark("service")
+    return service
+
+
+def authorized_http_factory(creds) -> Callable[[], object]:
+    """
+    httplib2 (and so a googleapiclient service) is not thread-safe; each
+    upload thread executes its requests on its own authorized Http.
+    """
+    import google_auth_httplib2
+    import httplib2
+
+    return lambda: google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+
+
+def list_folder(service, folder_id: str) -> Dict[str, Dict[str, str]]:
+    """One (paginated) listing of the folder: name -> {id, md5Checksum}."""
+    q = f"'{folder_id}' in parents and trashed=false"
+    files: Dict[str, Dict[str, str]] = {}
+    page_token = None
+    _mark("first_request")
+    while True:
+        resp = service.files().list(
+            q=q,
+            fields="nextPageToken, files(id,name,md5Checksum)",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute(num_retries=ATTEMPTS)
+        for f in resp.get("files", []):
+            files.setdefault(f["name"], f)  # keep the first, like find_existing did
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return files
 
 
 def find_existing(service, folder_id: str, name: str):
@@ -38,37 +229,137 @@ def find_existing(service, folder_id: str, name: str):
     return files[0]["id"] if files else None
 
 
+def file_md5(path: Path) -> str:
+    h = hashlib.md5()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _is_retryable(e: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    if isinstance(e, HttpError):
+        return e.resp.status in (408, 429) or e.resp.status >= 500
+    return isinstance(e, OSError)  # connection resets, timeouts
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(min(30.0, 2 ** attempt) + random.random())
+
 
-def upsert_file(service, folder_id: str, path: Path):
+def _run_resumable(request, http=None) -> dict:
+    _mark("first_byte")
+    resp = None
+    while resp is None:
+        _, resp = request.next_chunk(http=http, num_retries=ATTEMPTS)
+    return resp
+
+
+def upsert_file(service, folder_id: str, path: Path, existing: Optional[Dict[str, str]] = None,
+                chunk_size: int = CHUNK_SIZE, http=None) -> str:
+    """
+    Create or update `path` in the folder. `existing` is the folder-listing
+    entry for the same name (None = not in Drive); when omitted it is looked
+    up with a per-file query.
+    """
     name = path.name
-    media = MediaFileUpload(str(path), resumable=True)
+    if existing is None:
+        existing_id = find_existing(service, folder_id, name)
+        existing = {"id": existing_id} if existing_id else None
+
+    if existing and existing.get("md5Checksum") and existing["md5Checksum"] == file_md5(path):
+        print(f"[drive] unchanged: {name} ({existing['id']})")
+        return existing["id"]
+
+    from googleapiclient.http import MediaFileUpload
+
+    last_err: Optional[Exception] = None
+    for attempt in range(1, ATTEMPTS + 1):
+        # A fresh media object per attempt so a failed session restarts cleanly.
+        media = MediaFileUpload(str(path), resumable=True, chunksize=chunk_size)
+        try:
+            if existing:
+                _run_resumable(service.files().update(fileId=existing["id"], media_body=media, fields="id"), http)
+                run_manifest.add(items=1, bytes_out=path.stat().st_size)
+                print(f"[drive] updated: {name} ({existing['id']})")
+                return existing["id"]
+
+            meta = {"name": name, "parents": [folder_id]}
+            created = _run_resumable(service.files().create(body=meta, media_body=media, fields="id"), http)
+            file_id = created["id"]
+            run_manifest.add(items=1, bytes_out=path.stat().st_size)
+            print(f"[drive] created: {name} ({file_id})")
+            return file_id
+        except Exception as e:
+            if not _is_retryable(e) or attempt == ATTEMPTS:
+                raise
+            last_err = e
+            run_manifest.add(retries=1)
+            print(f"[drive] {name}: attempt {attempt} failed ({e}); retrying")
+            _backoff(attempt)
 
-    existing_id = find_existing(service, folder_id, name)
-    if existing_id:
-        service.files().update(fileId=existing_id, media_body=media).execute()
-        print(f"[drive] updated: {name} ({existing_id})")
-        return existing_id
+    raise RuntimeError(f"[drive] {name}: upload failed: {last_err}")
 
-    meta = {"name": name, "parents": [folder_id]}
-    created = service.files().create(body=meta, media_body=media, fields="id").execute()
-    file_id = created["id"]
-    print(f"[drive] created: {name} ({file_id})")
-    return file_id
 
+def upload_all(service, folder_id: str, paths: List[Path], workers: int = WORKERS,
+               chunk_size: int = CHUNK_SIZE, http_factory: Optional[Callable[[], object]] = None) -> Dict[str, str]:
+    """List the folder once, skip files whose MD5 matches, upload the rest in parallel."""
+    listing = list_folder(service, folder_id)
+    local = threading.local()
 
-def main():
+    def one(path: Path) -> str:
+        http = None
+        if http_factory is not None:
+            http = getattr(local, "http", None)
+            if http is None:
+                http = local.http = http_factory()
+        return upsert_file(service, folder_id, path, listing.get(path.name, {}), chunk_size, http)
+
+    if workers <= 1 or len(paths) <= 1:
+        ids = {p.name: one(p) for p in paths}
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Each task runs in a copy of this context, so the current run_manifest stage counts it.
+            futures = [pool.submit(contextvars.copy_context().run, one, p) for p in paths]
+            ids = {p.name: f.result() for p, f in zip(paths, futures)}
+    startup_report()
+    return ids
+
+
+def open_drive(fake_drive: Optional[Path] = None) -> Tuple[object, str, Optional[Callable[[], object]]]:
+    """(service, folder_id, http_factory) for upload_all: Drive from GDRIVE_* env, or a FakeDriveService directory."""
+    if fake_drive:
+        import fake_drive as fake
+        return fake.FakeDriveService(fake_drive), fake.ROOT_ID, None
     folder_id = os.environ["GDRIVE_FOLDER_ID"]
-    service = drive_service()
+    creds = drive_credentials()
+    return drive_service(creds), folder_id, authorized_http_factory(creds)
 
-    if len(sys.argv) < 2:
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Upload files to a Google Drive folder (skips unchanged files).")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE // (1024 * 1024),
+                    help="resumable upload chunk size in MiB")
+    ap.add_argument("--fake-drive", type=Path,
+                    help="upload into a local directory through fake_drive.FakeDriveService instead of Drive")
+    args = ap.parse_args(argv)
+
+    if not args.files:
         print("Usage: drive_upload.py <file1> <file2> ...")
         sys.exit(2)
 
-    for p in sys.argv[1:]:
-        path = Path(p)
+    paths = [Path(p) for p in args.files]
+    for path in paths:
         if not path.exists() or path.stat().st_size == 0:
             raise RuntimeError(f"Missing or empty file: {path}")
-        upsert_file(service, folder_id, path)
+
+    service, folder_id, http_factory = open_drive(args.fake_drive)
+    with run_manifest.stage("drive_upload"):
+        upload_all(service, folder_id, paths, max(1, args.workers), max(1, args.chunk_mb) * 1024 * 1024, http_factory)
 
 
 if __name__ == "__main__":
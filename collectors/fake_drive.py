@@ -0,0 +1,125 @@
+"""
+Local stand-in for the subset of the Drive v3 service drive_upload.py uses.
+
+Files live in a plain directory (one folder, ROOT_ID); list() reports the
+same id/name/md5Checksum fields Drive does, and create()/update() consume
+resumable MediaFileUpload objects chunk by chunk through next_chunk(), so the
+whole upload path (single listing, MD5 skip, parallel chunked uploads) runs
+offline:
+
+  python collectors/drive_upload.py --fake-drive /tmp/drive out/*.json
+
+`calls` counts API calls per method, e.g. to check that a re-run with
+unchanged files lists once and uploads nothing.
+"""
+import hashlib
+import json
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ROOT_ID = "fake-root"
+_INDEX = ".fake_drive.json"
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, num_retries: int = 0, http=None):
+        return self._fn()
+
+
+class _UploadRequest:
+    def __init__(self, drive: "FakeDriveService", file_id: Optional[str], body: Dict[str, Any], media):
+        self._drive = drive
+        self._file_id = file_id
+        self._body = body
+        self._media = media
+        self._offset = 0
+        self._buf = bytearray()
+
+    def next_chunk(self, http=None, num_retries: int = 0):
+        size = self._media.size()
+        n = self._media.chunksize() if self._media.resumable() else size
+        if self._offset < size:
+            chunk = self._media.getbytes(self._offset, min(n, size - self._offset))
+            self._buf += chunk
+            self._offset += len(chunk)
+            self._drive._count("upload_chunk")
+        if self._offset < size:
+            return _Progress(self._offset, size), None
+        return None, self._drive._store(self._file_id, self._body, bytes(self._buf))
+
+    def execute(self, num_retries: int = 0, http=None):
+        resp = None
+        while resp is None:
+            _, resp = self.next_chunk()
+        return resp
+
+
+class _Progress:
+    def __init__(self, done: int, total: int):
+        self.resumable_progress = done
+        self.total_size = total
+
+    def progress(self) -> float:
+        return self.resumable_progress / self.total_size if self.total_size else 1.0
+
+
+class _Files:
+    def __init__(self, drive: "FakeDriveService"):
+        self._d = drive
+
+    def list(self, q: str = "", fields: str = "", pageSize: int = 100, pageToken: Optional[str] = None, **_):
+        def run():
+            self._d._count("list")
+            files = sorted(self._d._index.values(), key=lambda f: f["name"])
+            if "name='" in q:
+                name = q.split("name='", 1)[1].split("' and", 1)[0].replace("\\'", "'")
+                files = [f for f in files if f["name"] == name]
+            start = int(pageToken or 0)
+            page = files[start:start + pageSize]
+            resp: Dict[str, Any] = {"files": [dict(f) for f in page]}
+            if start + pageSize < len(files):
+                resp["nextPageToken"] = str(start + pageSize)
+            return resp
+        return _Request(run)
+
+    def create(self, body: Dict[str, Any], media_body=None, fields: str = "", **_):
+        self._d._count("create")
+        return _UploadRequest(self._d, None, body, media_body)
+
+    def update(self, fileId: str, media_body=None, body: Optional[Dict[str, Any]] = None, fields: str = "", **_):
+        self._d._count("update")
+        return _UploadRequest(self._d, fileId, body or {}, media_body)
+
+
+class FakeDriveService:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        idx = self.root / _INDEX
+        self._index: Dict[str, Dict[str, str]] = json.loads(idx.read_text()) if idx.exists() else {}
+
+    def files(self) -> _Files:
+        return _Files(self)
+
+    def _count(self, what: str) -> None:
+        with self._lock:
+            self.calls[what] += 1
+
+    def _store(self, file_id: Optional[str], body: Dict[str, Any], data: bytes) -> Dict[str, str]:
+        with self._lock:
+            if file_id is None:
+                file_id = f"fake-{len(self._index) + 1}"
+                name = body["name"]
+            else:
+                name = self._index[file_id]["name"]
+            (self.root / name).write_bytes(data)
+            self._index[file_id] = {"id": file_id, "name": name, "md5Checksum": hashlib.md5(data).hexdigest()}
+            (self.root / _INDEX).write_text(json.dumps(self._index, indent=2))
+            return {"id": file_id}
@@ -0,0 +1,110 @@
+"""
+On-disk cache of discovered products-feed URLs.
+
+The Playwright collectors only need a browser to *find* the
+dam.flippenterprise.net `.../products` URL; the feed itself is a plain GET.
+Once a URL has been seen we keep it here (with a TTL) so later runs can hit it
+directly and only fall back to browser discovery when it stops working.
+
+A cached URL is considered stale (and dropped) when:
+  - it is older than the TTL
+  - the server answers 4xx
+  - the body is not JSON
+Any other failure (5xx, network) falls back to the browser for this run but
+keeps the URL, since it says nothing about the URL itself. URLs are kept per
+base_url.BASE, so one discovered on a fixture server is never used live (and
+the other way round).
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import base_url
+import run_manifest
+
+CACHE_PATH = Path(".cache/feed_urls.json")
+
+# Flyers rotate weekly; keep URLs for a day by default so re-triggered and
+# manual runs skip the browser, but the weekly run always re-discovers.
+TTL_S = float(os.environ.get("FEED_URL_TTL_HOURS", "24")) * 3600
+
+
+class StaleFeedUrl(RuntimeError):
+    """The products URL no longer serves the feed (4xx or non-JSON body)."""
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    try:
+        data = json.loads(CACHE_PATH.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _store(data: Dict[str, Dict[str, Any]]) -> None:
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(CACHE_PATH)
+
+
+def get(retailer: str) -> Optional[str]:
+    entry = _load().get(retailer)
+    if not entry or not entry.get("url") or entry.get("base", "") != base_url.BASE:
+        return None
+    if time.time() - float(entry.get("discovered_at", 0)) > TTL_S:
+        return None
+    return entry["url"]
+
+
+def put(retailer: str, url: str) -> None:
+    data = _load()
+    data[retailer] = {"url": url, "discovered_at": time.time(), "base": base_url.BASE}
+    _store(data)
+
+
+def invalidate(retailer: str) -> None:
+    data = _load()
+    if data.pop(retailer, None) is not None:
+        _store(data)
+
+
+def parse_feed_response(r) -> Any:
+    """Decode a `requests` response from a products URL, classifying stale URLs."""
+    if not getattr(r, "from_cache", False):
+        run_manifest.add(bytes_in=len(r.content))
+    if 400 <= r.status_code < 500:
+        raise StaleFeedUrl(f"HTTP {r.status_code} from products URL")
+    r.raise_for_status()
+
+    # Some endpoints return JSON even with odd content-type
+    text = r.text.lstrip()
+    if not (text.startswith("{") or text.startswith("[")):
+        raise StaleFeedUrl("Response did not look like JSON.")
+    try:
+        return r.json()
+    except ValueError as e:
+        raise StaleFeedUrl(f"Response did not parse as JSON: {e}") from e
+
+
+def fetch_cached(retailer: str, fetch: Callable[[str], Any]) -> Optional[Any]:
+    """
+    Fetch the feed through the cached URL, if there is a usable one.
+    Returns None when browser discovery is needed.
+    """
+    url = get(retailer)
+    if not url:
+        return None
+    try:
+        data = fetch(url)
+    except StaleFeedUrl as e:
+        print(f"[{retailer}] cached products URL is stale ({e}); rediscovering")
+        invalidate(retailer)
+        return None
+    except Exception as e:
+        print(f"[{retailer}] cached products URL fetch failed ({e}); using browser this run")
+        return None
+    print(f"[{retailer}] fetched feed via cached products URL (no browser)")
+    return data
@@ -0,0 +1,327 @@
+"""
+Local stand-in for the feed endpoints the collectors hit, for offline and
+repeatable capture runs and load tests. Point the collectors at it with
+FLYER_BASE_URL (see base_url.py):
+
+  python collectors/fixture_server.py --port 8765 --items 5000 --latency 50 --error-rate 0.05
+  FLYER_BASE_URL=http://127.0.0.1:8765 python -m collectors run --capture fanout --skip upload
+
+Request paths are "/<live host>/<live path>?<query>" (base_url.rebase):
+  items/search   {"items": [...], "ecom_items": []}; flyer hits are labelled
+                 with the searched merchant and spread over --flyers flyers
+  flyer_items    the items of flyer <id> (flyer_id set to <id>)
+  products       a products feed (dam.flippenterprise.net/.../products)
+  flyer pages    www.sobeys.com/flyer, www.walmart.ca/en/flyer: a stand-in
+                 page that requests a products feed, which is what the
+                 browser captures wait for (the live pages load their scripts
+                 from live hosts, so they cannot be replayed offline)
+  /_stats        requests, injected errors and bytes served so far
+
+Payloads are replayed from --recordings, an http_cache directory (.cache/http
+of a live run, e.g. restored from the Actions cache): the recording of the
+exact live URL, else any recording of the same route. Without one they are
+synthetic (bench/gen_feeds.py). --items scales every item list to that many
+items; recorded items are repeated under new ids.
+
+Faults: --latency / --jitter delay every response, --error-rate answers that
+share of requests with --error-status (503 by default, which flipp.py's
+session retries), drawn from --seed. Bodies are built once per URL and carry
+an ETag; If-None-Match gets a 304, as from the live feeds (see http_cache.py).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import base_url
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "bench"))
+
+import gen_feeds  # noqa: E402
+
+PORT = 8765
+
+ROUTES: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("search", re.compile(r"^/[^/]+/flipp/items/search$")),
+    ("flyer_items", re.compile(r"^/[^/]+/api/flipp/flyers/[^/]+/flyer_items$")),
+    ("products", re.compile(r"^/dam\.flippenterprise\.net/.*/products$")),
+    ("page", re.compile(r"^/www\.(sobeys\.com/flyer|walmart\.ca/en/flyer)$")),
+)
+
+# What the stand-in flyer page requests (matches the collectors' PRODUCTS_RE).
+PRODUCTS_PATH = "/dam.flippenterprise.net/flyerkit/publication/{retailer}/products?display_type=all&locale=en"
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>{retailer} flyer (fixture)</title></head>
+<body><h1>{retailer} flyer</h1>
+<script>fetch({products!r}).then(function (r) {{ return r.text(); }});</script>
+</body></html>
+"""
+
+# Synthetic payload sizes when --items is not given.
+DEFAULT_ITEMS = gen_feeds.ITEMS_PER_FLYER
+DEFAULT_FLYERS = 2
+
+
+@dataclass(frozen=True)
+class Options:
+    items: Optional[int] = None
+    flyers: int = DEFAULT_FLYERS
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int = 1
+    recordings: Optional[Path] = None
+
+
+def _route(path: str) -> Optional[str]:
+    return next((name for name, pattern in ROUTES if pattern.match(path)), None)
+
+
+def _live_path(url: str) -> str:
+    parts = urlsplit(url)
+    return f"/{parts.netloc}{parts.path}"
+
+
+def _load_recordings(directory: Optional[Path]) -> Dict[str, Path]:
+    """Live URL -> gzipped body, from an http_cache directory."""
+    found: Dict[str, Path] = {}
+    if directory is None:
+        return found
+    for meta_path in directory.glob("*.json"):
+        body = meta_path.with_suffix(".gz")
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if meta.get("url") and body.exists() and 200 <= int(meta.get("status") or 200) < 300:
+            found[meta["url"]] = body
+    return found
+
+
+def scale(items: List[Dict[str, Any]], n: Optional[int], id_keys: Tuple[str, ...] = ("id", "flyer_item_id")) -> List[Dict[str, Any]]:
+    """`items` repeated (or cut) to n items; copy k of an item gets ids "<id>-<k>"."""
+    if n is None or not items:
+        return items
+    out = []
+    for i in range(n):
+        k, j = divmod(i, len(items))
+        it = items[j]
+        if k:
+            it = {**it, **{key: f"{it[key]}-{k}" for key in id_keys if it.get(key) is not None}}
+        out.append(it)
+    return out
+
+
+def _synthetic_flyer_items(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Flipp flyer_items shape: "price" rather than the products feed's "price_text"."""
+    items = []
+    for it in gen_feeds.sobeys_items(n, seed):
+        it["price"] = it.pop("price_text")
+        items.append(it)
+    return items
+
+
+class Fixtures:
+    """Response bodies per live URL, built once (recorded or synthetic, then scaled)."""
+
+    def __init__(self, opts: Options):
+        self.opts = opts
+        self.recorded = _load_recordings(opts.recordings)
+        # route -> one recording of it, for URLs that were not recorded themselves
+        self.by_route: Dict[str, Path] = {}
+        for url, path in sorted(self.recorded.items()):
+            route = _route(_live_path(url))
+            if route is not None:
+                self.by_route.setdefault(route, path)
+        self.body = lru_cache(maxsize=16)(self._body)
+
+    def _payload(self, route: str, url: str) -> Tuple[Any, str, List[Dict[str, Any]], str]:
+        """
+        (document, key of its item list or "" for a bare list, items, source);
+        source is "exact" (recording of `url`), "route" (of another URL) or
+        "synthetic".
+        """
+        path, source = self.recorded.get(url), "exact"
+        if path is None:
+            path, source = self.by_route.get(route), "route"
+        if path is not None:
+            doc = json.loads(gzip.decompress(path.read_bytes()))
+            key = ""
+            if isinstance(doc, dict):
+                key = next((k for k in ("items", "flyer_items") if isinstance(doc.get(k), list)), "items")
+            items = doc.get(key) or [] if key else doc
+            return doc, key, scale(items, self.opts.items), source
+        n = self.opts.items if self.opts.items is not None else DEFAULT_ITEMS
+        if route == "search":
+            return {"items": [], "ecom_items": []}, "items", list(gen_feeds.walmart_items(n, self.opts.seed)), "synthetic"
+        if route == "products":
+            return [], "", list(gen_feeds.sobeys_items(n, self.opts.seed)), "synthetic"
+        return [], "", _synthetic_flyer_items(n, self.opts.seed), "synthetic"
+
+    def _body(self, route: str, url: str) -> Tuple[bytes, str, str]:
+        """(body, content type, etag) for GET `url` on `route`."""
+        parts = urlsplit(url)
+        if route == "page":
+            retailer = parts.netloc.split(".")[1]
+            body = PAGE.format(retailer=retailer, products=PRODUCTS_PATH.format(retailer=retailer)).encode()
+            return body, "text/html; charset=utf-8", _etag(body)
+
+        doc, key, items, source = self._payload(route, url)
+        if route == "search" and source != "exact":
+            # Someone else's search: answer for the merchant asked about; synthetic
+            # hits are spread over --flyers flyers (each then fetched by flyer_items).
+            merchant = (parse_qs(parts.query).get("q") or [""])[0].strip().title()
+            flyer_ids = [7_300_000 + i for i in range(max(1, self.opts.flyers))]
+            items = [
+                {**it, "merchant_name": merchant,
+                 **({"flyer_id": flyer_ids[i % len(flyer_ids)]} if source == "synthetic" else {})}
+                if str(it.get("item_type") or "").lower() == "flyer" else it
+                for i, it in enumerate(items)
+            ]
+        elif route == "flyer_items" and source != "exact":
+            flyer_id = parts.path.split("/")[-2]
+            items = [{**it, "flyer_id": flyer_id} for it in items]
+        doc = {**doc, key: items} if key else items
+        body = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+        return body, "application/json; charset=utf-8", _etag(body)
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], opts: Options):
+        super().__init__(address, _Handler)
+        self.opts = opts
+        self.fixtures = Fixtures(opts)
+        self.stats: Counter = Counter()
+        self._rng = random.Random(opts.seed)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Zero the stats and restart the fault sequence from --seed (e.g. between benchmark runs)."""
+        with self._lock:
+            self.stats.clear()
+            self._rng.seed(self.opts.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, **kw: int) -> None:
+        with self._lock:
+            self.stats.update(kw)
+
+    def draw(self) -> Tuple[float, bool]:
+        """(delay in s, inject an error) for the next request."""
+        o = self.opts
+        with self._lock:
+            jitter = self._rng.uniform(-o.jitter_ms, o.jitter_ms) if o.jitter_ms else 0.0
+            fail = o.error_rate > 0 and self._rng.random() < o.error_rate
+        return max(0.0, o.latency_ms + jitter) / 1000, fail
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FixtureServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # one line per request would swamp a load test; counts are in /_stats
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "text/plain", etag: Optional[str] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(bytes_out=len(body))
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0]
+        if path == "/_stats":
+            self._send(200, json.dumps(dict(self.server.stats)).encode(), "application/json")
+            return
+        route = _route(path)
+        if route is None:
+            self.server.count(not_found=1)
+            self._send(404, b"no fixture for " + path.encode())
+            return
+
+        delay, fail = self.server.draw()
+        if delay:
+            time.sleep(delay)
+        self.server.count(requests=1, **{f"requests.{route}": 1})
+        if fail:
+            self.server.count(errors_injected=1)
+            self._send(self.server.opts.error_status, b"injected error")
+            return
+
+        body, content_type, etag = self.server.fixtures.body(route, base_url.live_url(self.path))
+        if self.headers.get("If-None-Match") == etag:
+            self.server.count(not_modified=1)
+            self._send(304, etag=etag)
+            return
+        self._send(200, body, content_type, etag)
+
+
+def start(opts: Options, host: str = "127.0.0.1", port: int = 0) -> FixtureServer:
+    """Serve in a daemon thread (port 0: any free port); stop with .shutdown()."""
+    server = FixtureServer((host, port), opts)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Serve recorded or synthetic flyer feeds locally (see FLYER_BASE_URL).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--recordings", type=Path, help="http_cache directory to replay (e.g. .cache/http of a live run)")
+    ap.add_argument("--items", type=int, default=None,
+                    help=f"items per search / flyer / products payload (default: as recorded, else {DEFAULT_ITEMS})")
+    ap.add_argument("--flyers", type=int, default=DEFAULT_FLYERS, help="distinct flyers per items/search answer")
+    ap.add_argument("--latency", type=float, default=0.0, help="delay before every response, in ms")
+    ap.add_argument("--jitter", type=float, default=0.0, help="+/- random part of the delay, in ms")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    opts = Options(
+        items=args.items, flyers=args.flyers, latency_ms=args.latency, jitter_ms=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed, recordings=args.recordings,
+    )
+    server = FixtureServer((args.host, args.port), opts)
+    print(f"[fixtures] serving on {server.base_url} ({len(server.fixtures.recorded)} recordings); "
+          f"FLYER_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[fixtures] {json.dumps(dict(server.stats))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
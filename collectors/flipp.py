@@ -0,0 +1,96 @@
+"""
+Plain-HTTP helpers for the Flipp endpoints (no browser needed).
+
+  - items/search: the endpoint walmart_flipp_capture.py already relies on;
+    also used here to resolve which flyer(s) a merchant currently runs
+  - flyers/<id>/flyer_items: every item of one flyer
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import base_url
+import http_cache
+import run_manifest
+
+SEARCH_URL = base_url.rebase("https://backflipp.wishabi.com/flipp/items/search")
+FLYER_ITEMS_URL = base_url.rebase("https://flyers-ng.flippback.com/api/flipp/flyers/{flyer_id}/flyer_items")
+
+LOCALE = "en-ca"
+
+UA = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+)
+
+HEADERS = {
+    "User-Agent": UA,
+    "Accept": "application/json,text/plain,*/*",
+    "Accept-Language": "en-CA,en;q=0.9",
+}
+
+
+def new_session(pool_size: int = 10) -> requests.Session:
+    """
+    Session with a connection pool sized for `pool_size` concurrent requests.
+    Response bytes and retries count towards the run_manifest stage it was
+    created in.
+    """
+    s = requests.Session()
+    s.headers.update(HEADERS)
+    retry = Retry(
+        total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",), raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    run_manifest.track_session(s)
+    return s
+
+
+def search_items(session: requests.Session, postal_code: str, q: str, locale: str = LOCALE) -> Tuple[str, Dict[str, Any]]:
+    """Run an items/search query; returns (final request URL, JSON body)."""
+    params = {"locale": locale, "postal_code": postal_code, "q": q}
+    r = http_cache.get(SEARCH_URL, session, params=params, timeout=60)
+    r.raise_for_status()
+    return r.url, r.json()
+
+
+def merchant_flyers(search_data: Dict[str, Any], merchant: str) -> List[Dict[str, Any]]:
+    """Distinct flyers of `merchant` referenced by an items/search result."""
+    want = merchant.strip().lower()
+    flyers: Dict[str, Dict[str, Any]] = {}
+    for it in search_data.get("items") or []:
+        if str(it.get("item_type") or "").lower() != "flyer":
+            continue
+        if str(it.get("merchant_name") or "").strip().lower() != want:
+            continue
+        fid = it.get("flyer_id")
+        if fid is None or str(fid) in flyers:
+            continue
+        flyers[str(fid)] = {
+            "flyer_id": fid,
+            "merchant": it.get("merchant_name"),
+            "merchant_id": it.get("merchant_id"),
+            "valid_from": it.get("valid_from"),
+            "valid_to": it.get("valid_to"),
+        }
+    return list(flyers.values())
+
+
+def flyer_items(session: requests.Session, flyer_id: Any, locale: str = LOCALE) -> List[Dict[str, Any]]:
+    r = http_cache.get(FLYER_ITEMS_URL.format(flyer_id=flyer_id), session, params={"locale": locale}, timeout=60)
+    r.raise_for_status()
+    data = r.json()
+    if isinstance(data, dict):
+        data = data.get("items") or data.get("flyer_items") or []
+    if not isinstance(data, list):
+        raise RuntimeError(f"Unexpected flyer_items payload for flyer {flyer_id}")
+    return data
+
+
+def first_image(it: Dict[str, Any]) -> Optional[str]:
+    return it.get("cutout_image_url") or it.get("clean_image_url") or it.get("clipping_image_url") or it.get("image_url")
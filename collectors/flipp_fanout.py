@@ -0,0 +1,250 @@
+"""
+Multi-store / multi-postal-code capture over Flipp, deduplicated per flyer.
+
+Reads the tracked stores from stores.json, resolves every distinct
+(postal code, merchant) to its current flyer_ids concurrently, then downloads
+each distinct flyer exactly once -- most stores of a banner share a flyer.
+
+Writes, per retailer, the same raw files the single-store collectors write
+(out/sobeys_products.json, out/walmart_products.json) plus
+out/flyer_stores.json (retailer -> flyer_id -> [store_id]), which
+normalize.py uses to attach store membership to items instead of
+duplicating them per store.
+
+A failed location lookup or flyer download (after flipp's own retries) only
+loses that location or flyer: every flyer that resolved is still kept, and
+the failures are listed under "failures" in flyer_stores.json and in the
+capture report. A retailer for which nothing succeeded fails the capture
+(see check()), after the other retailers' files are saved.
+
+Usage:
+  python collectors/flipp_fanout.py [--stores stores.json] [--concurrency 8]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import flipp
+import run_manifest
+import sobeys_flipp_capture
+
+STORES_PATH = Path("stores.json")
+MEMBERSHIP_PATH = Path("out/flyer_stores.json")
+WALMART_OUT = Path("out/walmart_products.json")
+
+CONCURRENCY = int(os.environ.get("FANOUT_CONCURRENCY", "8"))
+
+MERCHANTS = {
+    "sobeys": "Sobeys",
+    "walmart": "Walmart",
+}
+
+
+@dataclass(frozen=True)
+class Location:
+    retailer: str
+    store_id: str
+    postal_code: str
+
+    @property
+    def merchant(self) -> str:
+        return MERCHANTS[self.retailer]
+
+
+def load_locations(path: Path = STORES_PATH) -> List[Location]:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    out = []
+    for s in data.get("stores") or []:
+        retailer = str(s["retailer"]).lower()
+        if retailer not in MERCHANTS:
+            raise RuntimeError(f"{path}: unsupported retailer {retailer!r}")
+        postal = str(s["postal_code"]).replace(" ", "").upper()
+        out.append(Location(retailer, str(s.get("store_id") or postal), postal))
+    if not out:
+        raise RuntimeError(f"{path}: no stores configured")
+    return out
+
+
+def _walmart_raw_item(it: Dict[str, Any], flyer: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a flyer item like an items/search hit (what normalize_walmart reads)."""
+    return {
+        **it,
+        "item_type": "flyer",
+        "merchant_name": flyer.get("merchant") or MERCHANTS["walmart"],
+        "flyer_id": it.get("flyer_id") or flyer.get("flyer_id"),
+        "current_price": it.get("current_price", it.get("price")),
+        "valid_from": it.get("valid_from") or flyer.get("valid_from"),
+        "valid_to": it.get("valid_to") or flyer.get("valid_to"),
+        "clean_image_url": flipp.first_image(it),
+    }
+
+
+def fan_out(locations: List[Location], concurrency: int = CONCURRENCY) -> Dict[str, Any]:
+    session = flipp.new_session(pool_size=concurrency)
+
+    # 1) Resolve each distinct (postal code, merchant) once.
+    queries: Dict[Tuple[str, str], List[Location]] = {}
+    for loc in locations:
+        queries.setdefault((loc.postal_code, loc.retailer), []).append(loc)
+
+    def resolve(key: Tuple[str, str]) -> List[Dict[str, Any]]:
+        postal, retailer = key
+        _, data = flipp.search_items(session, postal, MERCHANTS[retailer].lower())
+        return flipp.merchant_flyers(data, MERCHANTS[retailer])
+
+    failures: List[Dict[str, Any]] = []
+    resolved: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(resolve, key): key for key in queries}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                resolved[key] = fut.result()
+            except Exception as e:
+                print(f"[fanout] {MERCHANTS[key[1]]} lookup near {key[0]} failed: {e}")
+                failures.append({
+                    "retailer": key[1],
+                    "postal_code": key[0],
+                    "stores": sorted(loc.store_id for loc in queries[key]),
+                    "error": str(e)[:500],
+                })
+
+    # 2) flyer -> stores, per retailer
+    flyers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    stores: Dict[Tuple[str, str], Set[str]] = {}
+    for key, found in resolved.items():
+        retailer = key[1]
+        if not found:
+            print(f"[fanout] no {MERCHANTS[retailer]} flyer near {key[0]}")
+        for f in found:
+            fkey = (retailer, str(f["flyer_id"]))
+            flyers.setdefault(fkey, f)
+            stores.setdefault(fkey, set()).update(loc.store_id for loc in queries[key])
+
+    # 3) Download each distinct flyer once.
+    def download(fkey: Tuple[str, str]) -> List[Dict[str, Any]]:
+        return flipp.flyer_items(session, fkey[1])
+
+    items: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(download, fkey): fkey for fkey in flyers}
+        for fut in as_completed(futures):
+            fkey = futures[fut]
+            try:
+                items[fkey] = fut.result()
+            except Exception as e:
+                print(f"[fanout] {MERCHANTS[fkey[0]]} flyer {fkey[1]} failed: {e}")
+                failures.append({
+                    "retailer": fkey[0],
+                    "flyer_id": fkey[1],
+                    "stores": sorted(stores[fkey]),
+                    "error": str(e)[:500],
+                })
+
+    print(
+        f"[fanout] {len(locations)} stores -> {len(queries)} lookups -> "
+        f"{len(flyers)} distinct flyers ({sum(len(v) for v in items.values())} items"
+        f"{f', {len(failures)} failed' if failures else ''})"
+    )
+    return {"flyers": flyers, "stores": stores, "items": items, "failures": failures}
+
+
+def documents(result: Dict[str, Any], retailers: List[str]) -> Dict[str, Any]:
+    """
+    The raw documents of a fan-out, keyed like normalize's in-memory input:
+    "sobeys" (item list), "walmart" (items/search-shaped payload) and
+    "flyer_stores" (retailer -> flyer_id -> [store_id], plus "failures":
+    retailer -> [failed lookup or flyer] when any failed). A retailer without
+    items has no document, and only flyers that downloaded have members.
+    """
+    retrieved_at = datetime.now(timezone.utc).isoformat()
+    membership: Dict[str, Dict[str, List[str]]] = {r: {} for r in retailers}
+    for (retailer, fid), ids in result["stores"].items():
+        if (retailer, fid) in result["items"]:
+            membership[retailer][fid] = sorted(ids)
+
+    per_retailer: Dict[str, List[Dict[str, Any]]] = {r: [] for r in retailers}
+    for (retailer, fid), raw_items in result["items"].items():
+        flyer = result["flyers"][(retailer, fid)]
+        for it in raw_items:
+            if not it.get("name"):
+                continue  # banners / non-product tiles
+            if retailer == "sobeys":
+                per_retailer[retailer].append(sobeys_flipp_capture.to_sobeys_item(it, flyer))
+            else:
+                per_retailer[retailer].append(_walmart_raw_item(it, flyer))
+
+    docs: Dict[str, Any] = {}
+    if "sobeys" in retailers and per_retailer["sobeys"]:
+        docs["sobeys"] = per_retailer["sobeys"]
+    if "walmart" in retailers and per_retailer["walmart"]:
+        docs["walmart"] = {
+            "source": "flipp_fanout_flyer_items",
+            "retrieved_at": retrieved_at,
+            "request": {"stores": sorted(s for ids in membership["walmart"].values() for s in ids)},
+            "data": {"items": per_retailer["walmart"]},
+        }
+    # Only retailers whose raw file came from this fan-out; a fallback capture
+    # of another retailer must not get empty memberships attached.
+    docs["flyer_stores"] = {r: m for r, m in membership.items() if per_retailer[r]}
+    failures: Dict[str, List[Dict[str, Any]]] = {}
+    for f in result["failures"]:
+        failures.setdefault(f["retailer"], []).append({k: v for k, v in f.items() if k != "retailer"})
+    if failures:
+        docs["flyer_stores"]["failures"] = failures
+    return docs
+
+
+def failures(docs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every failed lookup / flyer download of a fan-out, with its retailer."""
+    return [{"retailer": r, **f} for r, fs in (docs["flyer_stores"].get("failures") or {}).items() for f in fs]
+
+
+def check(docs: Dict[str, Any]) -> None:
+    """Raise if a retailer had failures and got no items at all."""
+    lost = sorted(r for r in docs["flyer_stores"].get("failures") or {} if r not in docs)
+    if lost:
+        raise RuntimeError(f"fanout: nothing captured for {', '.join(lost)} ({len(failures(docs))} failures)")
+
+
+def save(docs: Dict[str, Any]) -> None:
+    if "sobeys" in docs:
+        sobeys_flipp_capture.save(docs["sobeys"])
+    if "walmart" in docs:
+        WALMART_OUT.parent.mkdir(parents=True, exist_ok=True)
+        WALMART_OUT.write_text(json.dumps(docs["walmart"], ensure_ascii=False, indent=2), encoding="utf-8")
+        n = len(docs["walmart"]["data"]["items"])
+        run_manifest.wrote(WALMART_OUT, items=n)
+        print(f"[walmart/fanout] saved -> {WALMART_OUT} ({n} items)")
+
+    MEMBERSHIP_PATH.parent.mkdir(parents=True, exist_ok=True)
+    MEMBERSHIP_PATH.write_text(json.dumps(docs["flyer_stores"], ensure_ascii=False, indent=2), encoding="utf-8")
+    run_manifest.wrote(MEMBERSHIP_PATH)
+    print(f"[fanout] saved -> {MEMBERSHIP_PATH}")
+
+
+def capture(stores_path: Path = STORES_PATH, concurrency: int = CONCURRENCY) -> Dict[str, Any]:
+    """Fan out over every tracked store; returns the raw documents (see documents())."""
+    locations = load_locations(stores_path)
+    result = fan_out(locations, concurrency)
+    return documents(result, sorted({loc.retailer for loc in locations}))
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Capture every tracked store via Flipp, one download per flyer.")
+    ap.add_argument("--stores", type=Path, default=STORES_PATH)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = ap.parse_args(argv)
+    with run_manifest.stage("capture.fanout"):
+        docs = capture(args.stores, max(1, args.concurrency))
+        save(docs)
+        check(docs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Conditional GETs with an on-disk response cache for the feed endpoints.
+
+Every cached URL keeps its ETag / Last-Modified and its body (gzipped) under
+.cache/http/. The next GET of that URL is conditional; on a 304 the cached
+body is served as a normal 200 response (`r.from_cache` is True), so
+callers don't change.
+
+Each fetch is also recorded in out/http_status.json for the run as
+not_modified / same_body / changed / new / error. The first capture of a run
+resets it (reset(); `capture_all.py --reset-status`, and every pipeline.py
+capture), so only that run's fetches count; later captures of the same run
+(the workflow's Playwright fallback) and single collectors run by hand add
+to it. Captures that bypass HTTP (a
+Playwright-observed body) mark themselves changed. `http_cache.py changed`
+prints "false" only when every feed of the run came back unchanged; the
+workflow then skips normalization and publishing.
+
+Usage:
+  python collectors/http_cache.py changed    # "true" / "false"
+  python collectors/http_cache.py status     # per-URL results
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = Path(".cache/http")
+STATUS_PATH = Path("out/http_status.json")
+
+# Entries not refreshed for this long are dropped (flyer URLs rotate weekly).
+MAX_AGE_S = float(os.environ.get("HTTP_CACHE_MAX_AGE_DAYS", "21")) * 86400
+
+# Response headers kept with the cached body.
+_KEEP_HEADERS = ("content-type", "etag", "last-modified")
+
+_status_lock = threading.Lock()
+_pruned = False
+
+
+def _paths(url: str):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{key}.json", CACHE_DIR / f"{key}.gz"
+
+
+def _load_meta(url: str) -> Optional[Dict[str, Any]]:
+    meta_path, body_path = _paths(url)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    return meta if meta.get("url") == url and body_path.exists() else None
+
+
+def _prune() -> None:
+    global _pruned
+    if _pruned or not CACHE_DIR.exists():
+        return
+    _pruned = True
+    cutoff = time.time() - MAX_AGE_S
+    for p in CACHE_DIR.iterdir():
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except OSError:
+            pass
+
+
+def _store(url: str, r: requests.Response, sha: str) -> None:
+    _prune()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    meta_path, body_path = _paths(url)
+    # One temp file per writer: captures running side by side (e.g. fanout and
+    # sobeys_flipp) can fetch the same URL at the same time.
+    tmp = body_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        f.write(r.content)
+    os.replace(tmp, body_path)
+    meta = {
+        "url": url,
+        "status": r.status_code,
+        "encoding": r.encoding,
+        "headers": {k: r.headers[k] for k in _KEEP_HEADERS if k in r.headers},
+        "sha256": sha,
+        "stored_at": time.time(),
+    }
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+
+def _cached_response(meta: Dict[str, Any], fresh: requests.Response) -> requests.Response:
+    _, body_path = _paths(meta["url"])
+    r = requests.Response()
+    r.status_code = meta.get("status", 200)
+    r.reason = "OK (not modified)"
+    r._content = gzip.decompress(body_path.read_bytes())
+    r.headers = CaseInsensitiveDict(meta.get("headers") or {})
+    r.encoding = meta.get("encoding")
+    r.url = fresh.url
+    r.request = fresh.request
+    r.from_cache = True
+    os.utime(body_path)  # keep it from being pruned
+    return r
+
+
+def record(url: str, result: str) -> None:
+    """Add one fetch result to the run's out/http_status.json."""
+    with _status_lock:
+        try:
+            data = json.loads(STATUS_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            data = {}
+        data[url] = result
+        STATUS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        STATUS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def reset() -> None:
+    """Start a new run's out/http_status.json, dropping earlier runs' results."""
+    with _status_lock:
+        STATUS_PATH.unlink(missing_ok=True)
+
+
+def mark_changed(label: str) -> None:
+    """For captures whose data didn't come through get() (e.g. a browser-observed body)."""
+    record(label, "changed")
+
+
+def get(
+    url: str,
+    session: Optional[requests.Session] = None,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 60,
+) -> requests.Response:
+    """
+    GET through the cache. Non-2xx responses are returned as-is and never
+    cached. The returned response has `from_cache` (True on a 304).
+    """
+    full_url = requests.Request("GET", url, params=params).prepare().url
+    meta = _load_meta(full_url)
+    hdrs = dict(headers or {})
+    if meta:
+        h = meta.get("headers") or {}
+        if h.get("etag"):
+            hdrs["If-None-Match"] = h["etag"]
+        if h.get("last-modified"):
+            hdrs["If-Modified-Since"] = h["last-modified"]
+
+    try:
+        r = (session or requests).get(full_url, headers=hdrs, timeout=timeout)
+    except Exception:
+        record(full_url, "error")
+        raise
+    if r.status_code == 304 and meta:
+        record(full_url, "not_modified")
+        return _cached_response(meta, r)
+
+    r.from_cache = False
+    if not 200 <= r.status_code < 300:
+        record(full_url, "error")
+    else:
+        sha = hashlib.sha256(r.content).hexdigest()
+        if meta is None:
+            result = "new"
+        else:
+            result = "same_body" if meta.get("sha256") == sha else "changed"
+        record(full_url, result)
+        _store(full_url, r, sha)
+    return r
+
+
+def changed(status_path: Path = STATUS_PATH) -> bool:
+    """False only if this run fetched feeds and every one of them was unchanged."""
+    try:
+        data = json.loads(status_path.read_text(encoding="utf-8"))
+    except Exception:
+        return True
+    if not data:
+        return True
+    return any(v not in ("not_modified", "same_body") for v in data.values())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else "changed"
+    if cmd == "changed":
+        print("true" if changed() else "false")
+        return 0
+    if cmd == "status":
+        try:
+            data = json.loads(STATUS_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            data = {}
+        for url, result in sorted(data.items()):
+            print(f"{result:<13} {url}")
+        return 0
+    print("Usage: http_cache.py [changed|status]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Compact model of a normalized item: `NormalizedItem`, `Price` and
+`Categories`, all __slots__ classes (no per-instance __dict__).
+
+Adapters build a NormalizedItem per raw item; it is serialized once, at the
+write boundary, by to_json(), which emits exactly what
+output_formats.dumps(item.to_dict()) would (compact, ensure_ascii=False, keys
+in FIELDS order) without building the dict. Price objects are shared: the
+same (pre, text, post) triple always yields the same interned Price (see
+prices.price_object), whose JSON is encoded once and reused by every item
+that carries it. Categories are shared the same way (categories()).
+
+The retailer is not a field: writers append it to the serialized item
+(normalize._with_retailer), so merging never copies an item.
+"""
+from functools import lru_cache
+from json.encoder import encode_basestring
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import output_formats
+
+
+def _value_json(x: Any, _str=str, _float=float, _int=int, _frepr=float.__repr__, _irepr=int.__repr__) -> str:
+    """JSON for one value, like output_formats.dumps; fast paths for scalars."""
+    t = type(x)
+    if t is _str:
+        return encode_basestring(x)
+    if x is None:
+        return "null"
+    if t is _float and x - x == 0:  # finite (nan / inf fall through to the encoder)
+        return _frepr(x)
+    if x is True:
+        return "true"
+    if x is False:
+        return "false"
+    if t is _int:
+        return _irepr(x)
+    return output_formats.dumps(x)
+
+
+class Price:
+    FIELDS = ("currency", "value", "unit", "pre", "post", "text", "multi_buy_qty", "unit_value")
+    __slots__ = FIELDS + ("_json",)
+
+    def __init__(self, currency: str, value: Optional[float], unit: str, pre: str, post: str, text: str,
+                 multi_buy_qty: Optional[int], unit_value: Optional[float]):
+        self.currency = currency
+        self.value = value
+        self.unit = unit
+        self.pre = pre
+        self.post = post
+        self.text = text
+        self.multi_buy_qty = multi_buy_qty
+        self.unit_value = unit_value
+        self._json: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = output_formats.dumps(self.to_dict())
+        return self._json
+
+
+class Categories:
+    """Category levels ({"l1": {"name", "google_id"}, ...}); shared via categories()."""
+
+    __slots__ = ("levels", "_json")
+
+    def __init__(self, levels: Tuple[Tuple[str, Any, Any], ...]):
+        self.levels = levels
+        self._json: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {level: {"name": name, "google_id": gid} for level, name, gid in self.levels}
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = output_formats.dumps(self.to_dict())
+        return self._json
+
+
+_NO_CATEGORIES = Categories(())
+
+
+@lru_cache(maxsize=4096)
+def _categories(levels: Tuple[Tuple[str, Any, Any], ...]) -> Categories:
+    return Categories(levels)
+
+
+def categories(levels: Iterable[Tuple[str, Any, Any]]) -> Categories:
+    """The shared Categories for these (level, name, google_id) triples."""
+    levels = tuple(levels)
+    if not levels:
+        return _NO_CATEGORIES
+    try:
+        return _categories(levels)
+    except TypeError:  # unhashable raw google_id
+        return Categories(levels)
+
+
+class NormalizedItem:
+    FIELDS = (
+        "source_item_id", "flyer_id", "title", "brand", "description", "price", "original_price",
+        "sale_story", "valid_from", "valid_to", "categories", "image_url", "page", "promo_only",
+    )
+    __slots__ = FIELDS
+
+    def __init__(self, source_item_id: str, flyer_id: str, title: str, brand: Optional[str],
+                 description: Optional[str], price: Price, original_price: Optional[float],
+                 sale_story: Optional[str], valid_from: Optional[str], valid_to: Optional[str],
+                 categories: Categories, image_url: Any, page: Any, promo_only: bool):
+        self.source_item_id = source_item_id
+        self.flyer_id = flyer_id
+        self.title = title
+        self.brand = brand
+        self.description = description
+        self.price = price
+        self.original_price = original_price
+        self.sale_story = sale_story
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.categories = categories
+        self.image_url = image_url
+        self.page = page
+        self.promo_only = promo_only
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {f: getattr(self, f) for f in self.FIELDS}
+        d["price"] = self.price.to_dict()
+        d["categories"] = self.categories.to_dict()
+        return d
+
+    def to_json(self) -> str:
+        v = _value_json
+        return (
+            '{"source_item_id":' + v(self.source_item_id)
+            + ',"flyer_id":' + v(self.flyer_id)
+            + ',"title":' + v(self.title)
+            + ',"brand":' + v(self.brand)
+            + ',"description":' + v(self.description)
+            + ',"price":' + self.price.to_json()
+            + ',"original_price":' + v(self.original_price)
+            + ',"sale_story":' + v(self.sale_story)
+            + ',"valid_from":' + v(self.valid_from)
+            + ',"valid_to":' + v(self.valid_to)
+            + ',"categories":' + self.categories.to_json()
+            + ',"image_url":' + v(self.image_url)
+            + ',"page":' + v(self.page)
+            + ',"promo_only":' + v(self.promo_only)
+            + "}"
+        )
@@ -0,0 +1,147 @@
+"""
+"Lean capture" support for the Playwright collectors.
+
+In lean mode every request is aborted except the document, scripts and the
+XHR/fetch calls that lead to the products feed; images, fonts, CSS, media and
+known third-party trackers never leave the browser. Debug screenshots are only
+taken on failure.
+
+Capture stats (requests, blocked requests, bytes transferred, time-to-feed)
+are recorded in both modes so lean and full runs can be compared; they are
+merged per retailer into out/capture_stats.json, along with the warm vs cold
+time-to-feed medians of the retailer's browser profile.
+
+Enable with LEAN_CAPTURE=1 (or `capture_all.py --lean`).
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import browser_profile
+import run_manifest
+
+STATS_PATH = Path("out/capture_stats.json")
+
+ALLOWED_TYPES = {"document", "script", "xhr", "fetch"}
+
+BLOCKED_HOST_RE = re.compile(
+    r"(google-analytics|googletagmanager|googlesyndication|doubleclick|facebook|"
+    r"hotjar|optimizely|newrelic|nr-data|segment\.(io|com)|quantserve|scorecardresearch|"
+    r"adsrvr|criteo|bing\.com|tiktok|pinterest|snapchat|clarity\.ms|demdex|omtrdc)\."
+)
+
+
+def enabled() -> bool:
+    return os.environ.get("LEAN_CAPTURE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def allow(resource_type: str, url: str) -> bool:
+    """Whether a request is needed to reach the products feed."""
+    if resource_type not in ALLOWED_TYPES:
+        return False
+    return not BLOCKED_HOST_RE.search(url)
+
+
+class CaptureStats:
+    def __init__(self, retailer: str, lean: bool, warm: bool = False):
+        self.retailer = retailer
+        self.lean = lean
+        # page opened in an already-used browser profile (see browser_profile)
+        self.warm = warm
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+        self._t0 = time.monotonic()
+        self.time_to_feed_s: Optional[float] = None
+
+    def start(self) -> None:
+        """Reset the clock (call right before navigation)."""
+        self._t0 = time.monotonic()
+
+    def feed_seen(self) -> None:
+        if self.time_to_feed_s is None:
+            self.time_to_feed_s = round(time.monotonic() - self._t0, 3)
+
+    def add_sizes(self, sizes: Dict[str, int]) -> None:
+        self.requests += 1
+        self.bytes += sum(max(0, int(sizes.get(k) or 0)) for k in (
+            "requestHeadersSize", "requestBodySize", "responseHeadersSize", "responseBodySize",
+        ))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "lean": self.lean,
+            "warm": self.warm,
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "bytes": self.bytes,
+            "time_to_feed_s": self.time_to_feed_s,
+        }
+
+
+def install(page, stats: CaptureStats) -> None:
+    """Attach stats listeners (and request blocking in lean mode) to a sync page."""
+
+    def on_finished(req):
+        try:
+            stats.add_sizes(req.sizes())
+        except Exception:
+            stats.requests += 1
+
+    page.on("requestfinished", on_finished)
+
+    if stats.lean:
+        def route_handler(route):
+            req = route.request
+            if allow(req.resource_type, req.url):
+                route.continue_()
+            else:
+                stats.blocked += 1
+                route.abort()
+
+        page.route("**/*", route_handler)
+
+
+async def install_async(page, stats: CaptureStats) -> None:
+    """Async-API counterpart of install()."""
+
+    async def on_finished(req):
+        try:
+            stats.add_sizes(await req.sizes())
+        except Exception:
+            stats.requests += 1
+
+    page.on("requestfinished", on_finished)
+
+    if stats.lean:
+        async def route_handler(route):
+            req = route.request
+            if allow(req.resource_type, req.url):
+                await route.continue_()
+            else:
+                stats.blocked += 1
+                await route.abort()
+
+        await page.route("**/*", route_handler)
+
+
+def write_stats(stats: CaptureStats) -> None:
+    STATS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        data = json.loads(STATS_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        data = {}
+    history = browser_profile.record_time_to_feed(stats.retailer, stats.warm, stats.time_to_feed_s)
+    data[stats.retailer] = {**stats.as_dict(), "time_to_feed_history": history}
+    run_manifest.add(bytes_in=stats.bytes)
+    STATS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    ttf = "n/a" if stats.time_to_feed_s is None else f"{stats.time_to_feed_s:.1f}s"
+    print(
+        f"[{stats.retailer}] {'lean' if stats.lean else 'full'} {'warm' if stats.warm else 'cold'} capture: "
+        f"{stats.requests} requests, {stats.blocked} blocked, "
+        f"{stats.bytes / 1024:.0f} KiB, time-to-feed {ttf} "
+        f"(median warm {history['warm_median_s']}s / cold {history['cold_median_s']}s)"
+    )
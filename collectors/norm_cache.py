@@ -0,0 +1,149 @@
+"""
+Content-hash cache for normalize.py.
+
+Two levels:
+  - item level: hash(raw item) -> normalized row (flyer_id, validity window,
+    serialized item JSON). Only new or changed raw items are normalized again;
+    everything else is copied from the cache byte-for-byte.
+  - stage level: sha256 of every raw file. When all of them match the previous
+    run, the previous outputs are restored as-is and normalization is skipped.
+
+Keys are salted with the normalizer version, so bumping NORMALIZER_VERSION in
+normalize.py invalidates everything. Entries not used for KEEP_RUNS runs are
+pruned.
+"""
+import hashlib
+import json
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CACHE_DIR = Path(".cache/normalize")
+DB_PATH = CACHE_DIR / "items.sqlite"
+OUTPUTS_DIR = CACHE_DIR / "outputs"
+
+KEEP_RUNS = 4
+_LOOKUP_BATCH = 500
+
+# (flyer_id, valid_from, valid_to, serialized item) -- same shape as normalize._Row
+Row = Tuple[str, Optional[str], Optional[str], str]
+
+
+def item_key(salt: str, raw_item: Any) -> str:
+    # Key order is kept (no sort_keys): pass-through fields keep raw ordering.
+    blob = json.dumps(raw_item, ensure_ascii=False)
+    return hashlib.blake2b((salt + "\x00" + blob).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# One read-only connection per process (pool workers each get their own).
+_readers: Dict[str, sqlite3.Connection] = {}
+
+
+def lookup(db_path: str, keys: Sequence[str]) -> Dict[str, Row]:
+    conn = _readers.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        _readers[db_path] = conn
+
+    found: Dict[str, Row] = {}
+    for i in range(0, len(keys), _LOOKUP_BATCH):
+        batch = keys[i:i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        for key, fid, vf, vt, item_json in conn.execute(
+            f"SELECT key, flyer_id, valid_from, valid_to, item_json FROM items WHERE key IN ({marks})",
+            batch,
+        ):
+            found[key] = (fid, vf, vt, item_json)
+    return found
+
+
+class NormCache:
+    def __init__(self, db_path: Path = DB_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                key TEXT PRIMARY KEY,
+                flyer_id TEXT,
+                valid_from TEXT,
+                valid_to TEXT,
+                item_json TEXT NOT NULL,
+                run INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS items_run ON items(run);
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        cur = self.conn.execute(
+            "INSERT INTO runs (started_at) VALUES (?)", (datetime.now(timezone.utc).isoformat(),)
+        )
+        self.run = cur.lastrowid
+        self.conn.commit()
+
+    def put(self, entries: Iterable[Tuple[str, Row]]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO items (key, flyer_id, valid_from, valid_to, item_json, run) VALUES (?, ?, ?, ?, ?, ?)",
+            ((key, *row, self.run) for key, row in entries),
+        )
+
+    def touch(self, keys: Iterable[str]) -> None:
+        self.conn.executemany("UPDATE items SET run = ? WHERE key = ?", ((self.run, k) for k in keys))
+
+    # ---- stage level -----------------------------------------------------
+
+    def _get_meta(self, key: str) -> Optional[Any]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def previous_stage(self, fingerprint: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        """Item counts of the previous run if it had exactly this fingerprint."""
+        stage = self._get_meta("stage")
+        if not stage or stage.get("fingerprint") != fingerprint:
+            return None
+        return stage.get("counts")
+
+    def record_stage(self, fingerprint: Dict[str, Any], counts: Dict[str, int], outputs: List[Path]) -> None:
+        OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+        for p in outputs:
+            shutil.copy2(p, OUTPUTS_DIR / p.name)
+        self._set_meta("stage", {"fingerprint": fingerprint, "counts": counts, "outputs": [p.name for p in outputs]})
+        self.conn.commit()
+
+    def restore_outputs(self, outputs: List[Path]) -> bool:
+        saved = [OUTPUTS_DIR / p.name for p in outputs]
+        if not all(s.exists() for s in saved):
+            return False
+        for src, dst in zip(saved, outputs):
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+        return True
+
+    def close(self) -> None:
+        self.conn.execute("DELETE FROM items WHERE run <= ?", (self.run - KEEP_RUNS,))
+        self.conn.execute("DELETE FROM runs WHERE id <= ?", (self.run - KEEP_RUNS,))
+        self.conn.commit()
+        self.conn.close()
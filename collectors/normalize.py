@@ -1,11 +1,24 @@
+import argparse
+import itertools
 import json
 import os
-import re
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import deal_index
+import item_model
+import norm_cache
+import output_formats
+import prices
+import product_match
+import run_manifest
+import schema_check
+from item_model import NormalizedItem, Price
 
 OUT_DIR = Path("out")
 
@@ -18,15 +31,25 @@ SOBEYS_NORM = OUT_DIR / "deals_sobeys.normalized.json"
 WALMART_NORM = OUT_DIR / "deals_walmart.normalized.json"
 ALL_NORM = OUT_DIR / "deals_all.normalized.json"
 
+# Optional: retailer -> flyer_id -> [store_id], written by flipp_fanout.py
+FLYER_STORES = OUT_DIR / "flyer_stores.json"
+DEALS_DB = OUT_DIR / "deals.sqlite"
+
 SCHEMA_VERSION = 1
-CURRENCY = "CAD"
+
+# Bump whenever the normalized output for the same raw item changes, or what
+# the cache may hold does (invalidates the normalize cache).
+NORMALIZER_VERSION = 6
 
 
 def _now_utc_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _file_mtime_iso(path: Path) -> str:
+def _file_mtime_iso(path: Optional[Path]) -> str:
+    """mtime of a raw feed; now for one captured in this process (path None)."""
+    if path is None:
+        return _now_utc_iso()
     try:
         ts = os.path.getmtime(path)
         return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
@@ -45,158 +68,135 @@ def _parse_iso_datetime(s: Optional[str]) -> Optional[str]:
     return str(s)
 
 
-_float_re = re.compile(r"[-+]?\d+(?:\.\d+)?")
-
-def _extract_float(s: Any) -> Optional[float]:
-    """Extract first float-looking number from s."""
-    if s is None:
-        return None
-    if isinstance(s, (int, float)):
-        return float(s)
-    txt = str(s)
-    m = _float_re.search(txt.replace(",", ""))
-    if not m:
-        return None
-    try:
-        return float(m.group(0))
-    except Exception:
-        return None
-
-
-def _parse_multi_buy_qty(pre: Any) -> Optional[int]:
-    """
-    Detect patterns like:
-      "2/"  or "2 /"  or "2/"
-    You can extend this later for '2 for' etc.
-    """
-    if not pre:
-        return None
-    txt = str(pre).strip()
-    m = re.match(r"^\s*(\d+)\s*/\s*$", txt)
-    if m:
-        try:
-            return int(m.group(1))
-        except Exception:
-            return None
-    return None
-
-
-def _normalize_unit(post: Any) -> str:
-    """
-    Normalize unit from post_price_text.
-    Examples: "lb" -> "lb", "ea" -> "ea", "" -> "ea".
-    """
-    if not post:
-        return "ea"
-    u = str(post).strip().lower()
-    if not u:
-        return "ea"
-    return u
-
-
-def _build_price(pre: Any, price_text: Any, post: Any, numeric_override: Optional[float] = None) -> Dict[str, Any]:
-    pre_s = _safe_str(pre).strip()
-    post_s = _safe_str(post).strip()
-    text_s = _safe_str(price_text).strip()
-
-    value = numeric_override if numeric_override is not None else _extract_float(price_text)
-    unit = _normalize_unit(post_s)
-
-    multi_qty = _parse_multi_buy_qty(pre_s)
-    unit_value = None
-    if value is not None and multi_qty and multi_qty > 0:
-        # Example: pre "2/" + price "4.50" means 2 for 4.50 => unit_value 2.25
-        unit_value = round(value / multi_qty, 4)
-
-    return {
-        "currency": CURRENCY,
-        "value": value,
-        "unit": unit,
-        "pre": pre_s if pre_s else "",
-        "post": post_s if post_s else "",
-        "text": text_s if text_s else "",
-        "multi_buy_qty": multi_qty,
-        "unit_value": unit_value,
-    }
-
-
-def _is_promo_only(price_obj: Dict[str, Any], sale_story: Any) -> bool:
+def _is_promo_only(price_obj: Price, sale_story: Any) -> bool:
     """
     Promo-only heuristic: no numeric price AND some sale_story text (e.g., points offers).
     """
-    if price_obj.get("value") is None and _safe_str(sale_story).strip():
+    if price_obj.value is None and _safe_str(sale_story).strip():
         return True
     return False
 
 
-def _sobeys_categories(item: Dict[str, Any]) -> Dict[str, Any]:
+def _sobeys_categories(item: Dict[str, Any]) -> item_model.Categories:
     cats = item.get("item_categories") or {}
-    out = {}
+    out = []
     for level in ("l1", "l2", "l3"):
         c = cats.get(level)
         if isinstance(c, dict) and c.get("category_name"):
-            out[level] = {
-                "name": c.get("category_name"),
-                "google_id": c.get("google_category_id"),
-            }
-    return out
+            out.append((level, c.get("category_name"), c.get("google_category_id")))
+    return item_model.categories(out)
+
+
+class _FlyerRanges:
+    """Running min/max of each flyer's validity window."""
+
+    def __init__(self):
+        self._ranges: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    def add(self, flyer_id: str, valid_from: Optional[str], valid_to: Optional[str]) -> None:
+        if not flyer_id:
+            return
+        vf, vt = self._ranges.get(flyer_id, (None, None))
+        vf = vf or valid_from
+        vt = vt or valid_to
+        # crude min/max by string (ISO sorts OK if same tz style; good enough for our use)
+        if valid_from and vf and valid_from < vf:
+            vf = valid_from
+        if valid_to and vt and valid_to > vt:
+            vt = valid_to
+        self._ranges[flyer_id] = (vf, vt)
+
+    def flyers(self) -> List[Dict[str, Any]]:
+        return [
+            {"flyer_id": fid, "valid_from": rng[0], "valid_to": rng[1]}
+            for fid, rng in sorted(self._ranges.items(), key=lambda x: x[0])
+        ]
+
+
+def _sobeys_item(it: Dict[str, Any]) -> NormalizedItem:
+    flyer_id = _safe_str(it.get("flyer_id"))
+    valid_from = _parse_iso_datetime(it.get("valid_from_timestamp") or it.get("valid_from"))
+    valid_to = _parse_iso_datetime(it.get("valid_to_timestamp") or it.get("valid_to"))
+
+    price = prices.price_object(it.get("pre_price_text"), it.get("price_text"), it.get("post_price_text"))
+    promo_only = _is_promo_only(price, it.get("sale_story"))
+
+    return NormalizedItem(
+        source_item_id=_safe_str(it.get("id")),
+        flyer_id=flyer_id,
+        title=_safe_str(it.get("name")).strip(),
+        brand=_safe_str(it.get("brand")).strip() or None,
+        description=_safe_str(it.get("description")).strip() or None,
+        price=price,
+        original_price=prices.extract_float(it.get("original_price")),
+        sale_story=_safe_str(it.get("sale_story")).strip() or None,
+        valid_from=valid_from,
+        valid_to=valid_to,
+        categories=_sobeys_categories(it),
+        image_url=it.get("image_url") or (it.get("images")[0] if it.get("images") else None),
+        page=it.get("page"),
+        promo_only=promo_only,
+    )
+
+
+def _walmart_item(it: Dict[str, Any]) -> Optional[NormalizedItem]:
+    """Normalize one Flipp item; None for anything that isn't a Walmart flyer item."""
+    # Only flyer items for Walmart
+    if _safe_str(it.get("item_type")).lower() != "flyer":
+        return None
+    if _safe_str(it.get("merchant_name")).strip().lower() != "walmart":
+        return None
+
+    flyer_id = _safe_str(it.get("flyer_id"))
+    valid_from = _parse_iso_datetime(it.get("valid_from"))
+    valid_to = _parse_iso_datetime(it.get("valid_to"))
+
+    # Walmart already provides numeric current_price
+    price = prices.price_object(it.get("pre_price_text"), it.get("current_price"), it.get("post_price_text"), numeric_override=prices.extract_float(it.get("current_price")))
+    promo_only = _is_promo_only(price, it.get("sale_story"))
+
+    levels = []
+    l1 = it.get("_L1")
+    l2 = it.get("_L2")
+    if l1:
+        levels.append(("l1", _safe_str(l1), None))
+    if l2:
+        levels.append(("l2", _safe_str(l2), None))
+
+    return NormalizedItem(
+        source_item_id=_safe_str(it.get("id") or it.get("flyer_item_id")),
+        flyer_id=flyer_id,
+        title=_safe_str(it.get("name")).strip(),
+        brand=None,  # Walmart payload doesn’t reliably include brand name here
+        description=None,
+        price=price,
+        original_price=prices.extract_float(it.get("original_price")),
+        sale_story=_safe_str(it.get("sale_story")).strip() or None,
+        valid_from=valid_from,
+        valid_to=valid_to,
+        categories=item_model.categories(levels),
+        image_url=it.get("clean_image_url") or it.get("clipping_image_url"),
+        page=None,  # not present in this dataset
+        promo_only=promo_only,
+    )
 
 
 def normalize_sobeys(raw_items: List[Dict[str, Any]]) -> Dict[str, Any]:
     captured_at = _file_mtime_iso(SOBEYS_RAW)
 
     items_norm: List[Dict[str, Any]] = []
-    flyer_ranges: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    flyer_ranges = _FlyerRanges()
 
     for it in raw_items:
-        flyer_id = _safe_str(it.get("flyer_id"))
-        valid_from = _parse_iso_datetime(it.get("valid_from_timestamp") or it.get("valid_from"))
-        valid_to = _parse_iso_datetime(it.get("valid_to_timestamp") or it.get("valid_to"))
-
-        # Track flyer validity window (min/max)
-        if flyer_id:
-            cur = flyer_ranges.get(flyer_id, (None, None))
-            vf, vt = cur
-            vf = vf or valid_from
-            vt = vt or valid_to
-            # crude min/max by string (ISO sorts OK if same tz style; good enough for our use)
-            if valid_from and vf and valid_from < vf:
-                vf = valid_from
-            if valid_to and vt and valid_to > vt:
-                vt = valid_to
-            flyer_ranges[flyer_id] = (vf, vt)
-
-        price = _build_price(it.get("pre_price_text"), it.get("price_text"), it.get("post_price_text"))
-        promo_only = _is_promo_only(price, it.get("sale_story"))
-
-        item_out = {
-            "source_item_id": _safe_str(it.get("id")),
-            "flyer_id": flyer_id,
-            "title": _safe_str(it.get("name")).strip(),
-            "brand": _safe_str(it.get("brand")).strip() or None,
-            "description": _safe_str(it.get("description")).strip() or None,
-            "price": price,
-            "original_price": _extract_float(it.get("original_price")),
-            "sale_story": _safe_str(it.get("sale_story")).strip() or None,
-            "valid_from": valid_from,
-            "valid_to": valid_to,
-            "categories": _sobeys_categories(it),
-            "image_url": it.get("image_url") or (it.get("images")[0] if it.get("images") else None),
-            "page": it.get("page"),
-            "promo_only": promo_only,
-        }
-        items_norm.append(item_out)
-
-    flyers = [
-        {"flyer_id": fid, "valid_from": rng[0], "valid_to": rng[1]}
-        for fid, rng in sorted(flyer_ranges.items(), key=lambda x: x[0])
-    ]
+        item_out = _sobeys_item(it)
+        flyer_ranges.add(item_out.flyer_id, item_out.valid_from, item_out.valid_to)
+        items_norm.append(item_out.to_dict())
 
     return {
         "schema_version": SCHEMA_VERSION,
         "retailer": "sobeys",
         "captured_at": captured_at,
-        "flyers": flyers,
+        "flyers": flyer_ranges.flyers(),
         "items": items_norm,
     }
 
@@ -208,125 +208,653 @@ def normalize_walmart(raw_wrapper: Dict[str, Any]) -> Dict[str, Any]:
     raw_items = data.get("items") or []
 
     items_norm: List[Dict[str, Any]] = []
-    flyer_ranges: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    flyer_ranges = _FlyerRanges()
 
     for it in raw_items:
-        # Only flyer items for Walmart
-        if _safe_str(it.get("item_type")).lower() != "flyer":
-            continue
-        if _safe_str(it.get("merchant_name")).strip().lower() != "walmart":
+        item_out = _walmart_item(it)
+        if item_out is None:
             continue
-
-        flyer_id = _safe_str(it.get("flyer_id"))
-        valid_from = _parse_iso_datetime(it.get("valid_from"))
-        valid_to = _parse_iso_datetime(it.get("valid_to"))
-
-        if flyer_id:
-            cur = flyer_ranges.get(flyer_id, (None, None))
-            vf, vt = cur
-            vf = vf or valid_from
-            vt = vt or valid_to
-            if valid_from and vf and valid_from < vf:
-                vf = valid_from
-            if valid_to and vt and valid_to > vt:
-                vt = valid_to
-            flyer_ranges[flyer_id] = (vf, vt)
-
-        # Walmart already provides numeric current_price
-        price = _build_price(it.get("pre_price_text"), it.get("current_price"), it.get("post_price_text"), numeric_override=_extract_float(it.get("current_price")))
-        promo_only = _is_promo_only(price, it.get("sale_story"))
-
-        categories = {}
-        l1 = it.get("_L1")
-        l2 = it.get("_L2")
-        if l1:
-            categories["l1"] = {"name": _safe_str(l1), "google_id": None}
-        if l2:
-            categories["l2"] = {"name": _safe_str(l2), "google_id": None}
-
-        item_out = {
-            "source_item_id": _safe_str(it.get("id") or it.get("flyer_item_id")),
-            "flyer_id": flyer_id,
-            "title": _safe_str(it.get("name")).strip(),
-            "brand": None,  # Walmart payload doesn’t reliably include brand name here
-            "description": None,
-            "price": price,
-            "original_price": _extract_float(it.get("original_price")),
-            "sale_story": _safe_str(it.get("sale_story")).strip() or None,
-            "valid_from": valid_from,
-            "valid_to": valid_to,
-            "categories": categories,
-            "image_url": it.get("clean_image_url") or it.get("clipping_image_url"),
-            "page": None,  # not present in this dataset
-            "promo_only": promo_only,
-        }
-        items_norm.append(item_out)
-
-    flyers = [
-        {"flyer_id": fid, "valid_from": rng[0], "valid_to": rng[1]}
-        for fid, rng in sorted(flyer_ranges.items(), key=lambda x: x[0])
-    ]
+        flyer_ranges.add(item_out.flyer_id, item_out.valid_from, item_out.valid_to)
+        items_norm.append(item_out.to_dict())
 
     return {
         "schema_version": SCHEMA_VERSION,
         "retailer": "walmart",
         "captured_at": captured_at,
-        "flyers": flyers,
+        "flyers": flyer_ranges.flyers(),
         "items": items_norm,
     }
 
 
-def main():
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+# ---------------------------------------------------------------------------
+# Streaming mode: constant memory regardless of feed size
+# ---------------------------------------------------------------------------
+
+class _JsonStream:
+    """
+    Minimal incremental JSON reader over a text file.
+    Values are decoded one at a time with the C scanner (raw_decode), so only
+    the current value (e.g. one flyer item) is ever held in memory.
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, f, name: str):
+        self._f = f
+        self._name = name
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._dec = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(self.CHUNK)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            n = len(self._buf)
+            while self._pos < n and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < n:
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        got = self.peek()
+        if got != ch:
+            raise RuntimeError(f"{self._name}: expected {ch!r} but found {got or 'EOF'!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                val, end = self._dec.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A value ending exactly at the buffer edge may be a truncated number.
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return val
+
+
+def _iter_json_array(path: Path, keys: Tuple[str, ...] = (), meta: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """
+    Yield the elements of the JSON array found at `keys` inside `path`, one at
+    a time. `()` means the document itself is the array.
+
+    The first key must exist; deeper keys may be missing, and any container on
+    the way may be null (both mean "no items").
+    Scalar values skipped over at the top level are collected into `meta`.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        s = _JsonStream(f, path.name)
+
+        for depth, key in enumerate(keys):
+            if depth and s.peek() == "n":
+                s.value()  # null container -> no items
+                return
+            s.expect("{")
+            while True:
+                if s.peek() == "}":
+                    if depth == 0:
+                        raise RuntimeError(f"{path.name}: missing '{key}' field")
+                    return
+                k = s.value()
+                s.expect(":")
+                if k == key:
+                    break
+                v = s.value()
+                if depth == 0 and meta is not None and not isinstance(v, (dict, list)):
+                    meta[k] = v
+                if s.peek() == ",":
+                    s.expect(",")
+
+        if s.peek() == "n" and keys:
+            s.value()  # null
+            return
+        s.expect("[")
+        if s.peek() == "]":
+            return
+        while True:
+            yield s.value()
+            if s.peek() == "]":
+                return
+            s.expect(",")
+
+
+def _item_json(item: NormalizedItem) -> str:
+    return item.to_json()
+
+
+def _append_key(item_json: str, key: str, value: Any) -> str:
+    """Append a top-level key to an already-serialized (compact) item, no dict copy."""
+    return item_json[:-1] + "," + json.dumps(key) + ":" + output_formats.dumps(value) + "}"
+
+
+def _with_retailer(item_json: str, retailer: str) -> str:
+    return _append_key(item_json, "retailer", retailer)
+
+
+class _StreamingDocWriter:
+    """
+    Write `{<header>, "items": [...]}` in every format of `opts` (see
+    output_formats.py) without holding the items: they are spooled to a temp
+    file, one compact item per line, and spliced in once the header (which
+    depends on every item, e.g. flyer ranges) is known.
+    """
+
+    def __init__(self, path: Path, opts: Optional[output_formats.OutputOptions] = None):
+        self.path = path
+        self.opts = opts or output_formats.OutputOptions()
+        self.count = 0
+        self._spool = tempfile.TemporaryFile("w+", encoding="utf-8", dir=path.parent)
+
+    def add(self, item_json: str) -> None:
+        self._spool.write(item_json)
+        self._spool.write("\n")
+        self.count += 1
+
+    def finish(self, header: Dict[str, Any]) -> List[Path]:
+        """Write the (uncompressed) files; returns them, the .json first."""
+        try:
+            output_formats.write_json(self._spool, self.count, header, self.path, self.opts.pretty)
+            if "ndjson" in self.opts.formats:
+                output_formats.write_ndjson(self._spool, output_formats.variant_path(self.path, "ndjson"))
+            if "columnar" in self.opts.formats:
+                output_formats.write_columnar(self._spool, self.count, header,
+                                              output_formats.variant_path(self.path, "columnar"))
+        finally:
+            self._spool.close()
+        return output_formats.uncompressed_paths(self.path, self.opts)
+
+
+def _load_json_array(path: Path, keys: Tuple[str, ...] = (), meta: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """Non-streaming counterpart of _iter_json_array (same rules, whole file in memory)."""
+    return _json_array(json.loads(path.read_text(encoding="utf-8")), keys, meta, path.name)
+
+
+def _json_array(node: Any, keys: Tuple[str, ...], meta: Optional[Dict[str, Any]], name: str) -> List[Any]:
+    """The array at `keys` of an already-parsed document (rules of _iter_json_array)."""
+    for depth, key in enumerate(keys):
+        if node is None and depth:
+            return []
+        if not isinstance(node, dict):
+            raise RuntimeError(f"{name}: expected an object")
+        if depth == 0:
+            if meta is not None:
+                meta.update({k: v for k, v in node.items() if not isinstance(v, (dict, list))})
+            if key not in node:
+                raise RuntimeError(f"{name}: missing '{key}' field")
+        node = node.get(key)
+    if node is None and keys:
+        return []
+    if not isinstance(node, list):
+        raise RuntimeError(f"{name}: expected a list")
+    return node
+
+
+# ---------------------------------------------------------------------------
+# Retailer adapters
+# ---------------------------------------------------------------------------
+
+def _captured_at_mtime(raw_path: Optional[Path], meta: Dict[str, Any]) -> str:
+    return _file_mtime_iso(raw_path)
+
+
+def _captured_at_retrieved(raw_path: Optional[Path], meta: Dict[str, Any]) -> str:
+    return _parse_iso_datetime(meta.get("retrieved_at")) or _file_mtime_iso(raw_path)
+
+
+@dataclass(frozen=True)
+class RetailerAdapter:
+    """
+    Everything the driver needs to normalize one retailer's raw feed.
 
-    outputs = []
-
-    # Sobeys
-    if SOBEYS_RAW.exists():
-        raw = json.loads(SOBEYS_RAW.read_text(encoding="utf-8"))
-        if not isinstance(raw, list):
-            raise RuntimeError("sobeys_products.json expected to be a list of items.")
-        sob_norm = normalize_sobeys(raw)
-        SOBEYS_NORM.write_text(json.dumps(sob_norm, ensure_ascii=False, indent=2), encoding="utf-8")
-        outputs.append(sob_norm)
-        print(f"[normalize] wrote {SOBEYS_NORM} ({len(sob_norm['items'])} items)")
-    else:
-        print("[normalize] sobeys_products.json not found; skipping")
-
-    # Walmart
-    if WALMART_RAW.exists():
-        raw = json.loads(WALMART_RAW.read_text(encoding="utf-8"))
-        if not isinstance(raw, dict) or "data" not in raw:
-            raise RuntimeError("walmart_products.json expected to be an object with a 'data' field.")
-        wal_norm = normalize_walmart(raw)
-        WALMART_NORM.write_text(json.dumps(wal_norm, ensure_ascii=False, indent=2), encoding="utf-8")
-        outputs.append(wal_norm)
-        print(f"[normalize] wrote {WALMART_NORM} ({len(wal_norm['items'])} items)")
-    else:
-        print("[normalize] walmart_products.json not found; skipping")
-
-    # Merge pool
-    merged_items = []
-    merged_flyers = []
-    for o in outputs:
-        merged_items.extend([
-            {**it, "retailer": o["retailer"]}
-            for it in o.get("items", [])
-        ])
-        merged_flyers.extend([
-            {**f, "retailer": o["retailer"]}
-            for f in o.get("flyers", [])
-        ])
-
-    merged = {
+    `to_item` maps one raw item to a normalized item (or None to drop it). It
+    must be a module-level function so it can be shipped to pool workers.
+    """
+    name: str
+    raw_path: Path
+    norm_path: Path
+    to_item: Callable[[Dict[str, Any]], Optional[NormalizedItem]]
+    # Where the item list lives in the raw JSON; () means the document is the list.
+    items_at: Tuple[str, ...] = ()
+    # (raw_path, header scalars) -> captured_at; raw_path is None for a feed captured in this process.
+    captured_at: Callable[[Optional[Path], Dict[str, Any]], str] = _captured_at_mtime
+    shape_error: str = "unexpected raw feed shape"
+
+    def iter_items(self, stream: bool, meta: Dict[str, Any], doc: Any = None) -> Iterator[Dict[str, Any]]:
+        """Raw items of raw_path, or of `doc` (the raw document, already parsed in this process)."""
+        if doc is not None:
+            return iter(_json_array(doc, self.items_at, meta, self.raw_path.name))
+        if stream:
+            return _iter_json_array(self.raw_path, self.items_at, meta)
+        return iter(_load_json_array(self.raw_path, self.items_at, meta))
+
+
+ADAPTERS: Dict[str, RetailerAdapter] = {}
+
+
+def register_adapter(adapter: RetailerAdapter) -> RetailerAdapter:
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+register_adapter(RetailerAdapter(
+    name="sobeys",
+    raw_path=SOBEYS_RAW,
+    norm_path=SOBEYS_NORM,
+    to_item=_sobeys_item,
+    shape_error="sobeys_products.json expected to be a list of items.",
+))
+
+register_adapter(RetailerAdapter(
+    name="walmart",
+    raw_path=WALMART_RAW,
+    norm_path=WALMART_NORM,
+    to_item=_walmart_item,
+    items_at=("data", "items"),
+    captured_at=_captured_at_retrieved,
+    shape_error="walmart_products.json expected to be an object with a 'data' field.",
+))
+
+
+# ---------------------------------------------------------------------------
+# Driver: chunked, optionally parallel normalization of every adapter
+# ---------------------------------------------------------------------------
+
+CHUNK_SIZE = 5000
+
+# (flyer_id, valid_from, valid_to, serialized item)
+_Row = Tuple[str, Optional[str], Optional[str], str]
+
+
+# Cached row for a raw item the adapter drops (e.g. non-flyer Walmart items).
+_DROPPED: _Row = ("", None, None, "")
+
+
+def _normalize_row(to_item: Callable[[Dict[str, Any]], Optional[NormalizedItem]], it: Dict[str, Any],
+                   invalid: List[schema_check.Invalid]) -> _Row:
+    """Normalize + serialize one raw item; appends it to `invalid` if it fails schema_check."""
+    item_out = to_item(it)
+    if item_out is None:
+        return _DROPPED
+    issues = schema_check.item_issues(item_out)
+    if issues:
+        invalid.append((item_out.source_item_id, issues))
+    return (item_out.flyer_id, item_out.valid_from, item_out.valid_to, _item_json(item_out))
+
+
+def _normalize_chunk(
+    to_item: Callable[[Dict[str, Any]], Optional[NormalizedItem]],
+    chunk: List[Dict[str, Any]],
+    salt: Optional[str] = None,
+    db_path: Optional[str] = None,
+) -> Tuple[List[_Row], List[Tuple[str, _Row]], List[str], List[schema_check.Invalid]]:
+    """
+    Worker body: normalize + serialize + validate a chunk of raw items.
+    With a cache `salt`, raw items are hashed and looked up in `db_path`
+    first; returns (rows, new cache entries, keys of cache hits, items that
+    failed schema_check). Failed items are not cached, so hits need no check.
+    """
+    invalid: List[schema_check.Invalid] = []
+    if salt is None:
+        rows = [_normalize_row(to_item, it, invalid) for it in chunk]
+        return [r for r in rows if r[3]], [], [], invalid
+
+    keys = [norm_cache.item_key(salt, it) for it in chunk]
+    cached = norm_cache.lookup(db_path, keys) if db_path else {}
+
+    rows: List[_Row] = []
+    misses: List[Tuple[str, _Row]] = []
+    hits: List[str] = []
+    for key, it in zip(keys, chunk):
+        row = cached.get(key)
+        if row is None:
+            failed = len(invalid)
+            row = _normalize_row(to_item, it, invalid)
+            if len(invalid) == failed:
+                misses.append((key, row))
+        else:
+            hits.append(key)
+        if row[3]:
+            rows.append(row)
+    return rows, misses, hits, invalid
+
+
+def _cache_salt(adapter: "RetailerAdapter") -> str:
+    return f"v{NORMALIZER_VERSION}:{adapter.name}"
+
+
+def _iter_jobs(adapters: List[RetailerAdapter], stream: bool, chunk_size: int, raw: Optional[Dict[str, Any]] = None):
+    """Yield (adapter, meta, chunk); every adapter yields at least one (maybe empty) chunk."""
+    for ad in adapters:
+        meta: Dict[str, Any] = {}
+        try:
+            items = ad.iter_items(stream, meta, (raw or {}).get(ad.name))
+            sent = False
+            while True:
+                chunk = list(itertools.islice(items, chunk_size))
+                if chunk or not sent:
+                    yield ad, meta, chunk
+                    sent = True
+                if len(chunk) < chunk_size:
+                    break
+        except RuntimeError as e:
+            raise RuntimeError(f"{ad.shape_error} ({e})") from e
+
+
+def _run_jobs(jobs, workers: int, cache: Optional[norm_cache.NormCache] = None, read_cache: bool = True):
+    """Yield (adapter, meta, chunk result) in job order, using up to `workers` processes."""
+    db_path = str(cache.db_path) if cache is not None and read_cache else None
+
+    def args(ad, chunk):
+        return (ad.to_item, chunk, _cache_salt(ad) if cache is not None else None, db_path)
+
+    if workers <= 1:
+        for ad, meta, chunk in jobs:
+            yield ad, meta, _normalize_chunk(*args(ad, chunk))
+        return
+
+    # Bounded window of in-flight chunks keeps memory flat on huge feeds.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window: deque = deque()
+        for ad, meta, chunk in jobs:
+            window.append((ad, meta, pool.submit(_normalize_chunk, *args(ad, chunk))))
+            if len(window) >= workers * 2:
+                ad0, meta0, fut = window.popleft()
+                yield ad0, meta0, fut.result()
+        while window:
+            ad0, meta0, fut = window.popleft()
+            yield ad0, meta0, fut.result()
+
+
+class _RetailerOutput:
+    def __init__(self, adapter: RetailerAdapter, meta: Dict[str, Any], stores: Optional[Dict[str, List[str]]] = None,
+                 opts: Optional[output_formats.OutputOptions] = None, in_memory: bool = False):
+        self.adapter = adapter
+        self.meta = meta
+        self.in_memory = in_memory
+        # flyer_id -> store ids; when known, items carry `stores` (one item, many stores)
+        self.stores = stores
+        self.writer = _StreamingDocWriter(adapter.norm_path, opts)
+        self.flyer_ranges = _FlyerRanges()
+        self.cached = 0
+        self.written: List[Path] = []
+
+    def add(self, rows: List[_Row], merged: _StreamingDocWriter) -> None:
+        name = self.adapter.name
+        for flyer_id, valid_from, valid_to, item_json in rows:
+            self.flyer_ranges.add(flyer_id, valid_from, valid_to)
+            if self.stores is not None:
+                item_json = _append_key(item_json, "stores", self.stores.get(flyer_id, []))
+            self.writer.add(item_json)
+            merged.add(_with_retailer(item_json, name))
+
+    def finish(self, merged_flyers: List[Dict[str, Any]], report: Optional[schema_check.Report] = None) -> int:
+        ad = self.adapter
+        flyers = self.flyer_ranges.flyers()
+        if self.stores is not None:
+            for f in flyers:
+                f["stores"] = self.stores.get(f["flyer_id"], [])
+        header = {
+            "schema_version": SCHEMA_VERSION,
+            "retailer": ad.name,
+            "captured_at": ad.captured_at(None if self.in_memory else ad.raw_path, self.meta),
+            "flyers": flyers,
+        }
+        if report is not None:
+            report.document(ad.norm_path.name, header, schema_check.RETAILER_KEYS)
+        self.written = self.writer.finish(header)
+        merged_flyers.extend({**f, "retailer": ad.name} for f in flyers)
+        return self.writer.count
+
+
+def _stage_fingerprint(adapters: List[RetailerAdapter], matches: bool = True,
+                       opts: Optional[output_formats.OutputOptions] = None) -> Dict[str, Any]:
+    return {
+        "normalizer_version": NORMALIZER_VERSION,
+        "matcher_version": product_match.MATCHER_VERSION if matches else None,
+        "schema_version": SCHEMA_VERSION,
+        "output": (opts or output_formats.OutputOptions()).fingerprint(),
+        "raw": {ad.name: norm_cache.file_sha256(ad.raw_path) for ad in adapters},
+        "flyer_stores": norm_cache.file_sha256(FLYER_STORES) if FLYER_STORES.exists() else None,
+    }
+
+
+def _load_flyer_stores() -> Optional[Dict[str, Dict[str, List[str]]]]:
+    if not FLYER_STORES.exists():
+        return None
+    data = json.loads(FLYER_STORES.read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        raise RuntimeError(f"{FLYER_STORES.name} expected to be an object")
+    return data
+
+
+def normalize_all(
+    adapters: Optional[List[RetailerAdapter]] = None,
+    stream: bool = False,
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    cache: Optional[norm_cache.NormCache] = None,
+    full: bool = False,
+    sqlite: bool = True,
+    matches: bool = True,
+    opts: Optional[output_formats.OutputOptions] = None,
+    raw: Optional[Dict[str, Any]] = None,
+    max_invalid: Optional[int] = None,
+    max_invalid_share: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Normalize every registered retailer into its own file plus ALL_NORM
+    (and the deal index, unless `sqlite` is off). ALL_NORM gets a `matches`
+    section of cross-retailer product groups unless `matches` is off.
+    Every normalized document is written in the formats of `opts` (minified
+    JSON, NDJSON, columnar); the merged one, which is what gets published,
+    also gets .gz / .xz copies by default.
+
+    With a `cache`, unchanged raw items are copied from it and the whole stage
+    is skipped when no raw file changed; `full` ignores (but refreshes) it.
+
+    `raw` holds raw documents already parsed in this process (adapter name ->
+    document, plus "flyer_stores"), as kept by capture_all.RawSink; they take
+    the place of the raw files. Whole-stage skipping needs raw files to hash,
+    so it is off when any document is passed in memory (the item cache still
+    applies).
+
+    Items and document headers are checked as they are written (see
+    schema_check.py) into schema_check.REPORT_PATH; with `max_invalid`, more
+    failures than that raise schema_check.ValidationError mid-run, and with
+    `max_invalid_share`, a document error, no items or more than that share
+    of invalid items raise it once the merged document is written.
+    """
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    adapters = list(ADAPTERS.values()) if adapters is None else adapters
+    raw = raw or {}
+
+    present = []
+    for ad in adapters:
+        if ad.name in raw or ad.raw_path.exists():
+            present.append(ad)
+        else:
+            print(f"[normalize] {ad.raw_path.name} not found; skipping")
+
+    opts = opts or output_formats.OutputOptions()
+    # What the stage cache keeps; the compressed copies are redone from it.
+    outputs = [p for ad in present for p in output_formats.paths_for(ad.norm_path, opts, compressed=False)]
+    outputs += output_formats.paths_for(ALL_NORM, opts, compressed=False)
+    outputs.append(schema_check.REPORT_PATH)
+    if sqlite:
+        outputs.append(DEALS_DB)
+    fingerprint = _stage_fingerprint(present, matches, opts) if cache is not None and not raw else None
+    if fingerprint is not None and not full:
+        prev_counts = cache.previous_stage(fingerprint)
+        if prev_counts is not None and cache.restore_outputs(outputs):
+            for path in outputs:
+                run_manifest.wrote(path)
+            print(f"[normalize] raw feeds unchanged since last run; restored previous outputs ({sum(prev_counts.values())} items)")
+            schema_check.enforce_saved(max_invalid, max_invalid_share)
+            _compress_published(opts)
+            return prev_counts
+
+    merged = _StreamingDocWriter(ALL_NORM, opts)
+    merged_flyers: List[Dict[str, Any]] = []
+    counts: Dict[str, int] = {}
+    mode = "streamed" if stream else "loaded"
+    report = schema_check.Report(max_invalid, max_invalid_share)
+
+    membership = raw["flyer_stores"] if "flyer_stores" in raw else _load_flyer_stores()
+    current: Optional[_RetailerOutput] = None
+
+    def _finish_current() -> None:
+        counts[current.adapter.name] = current.finish(merged_flyers, report)
+        for path in current.written:
+            run_manifest.wrote(path)
+        cached = f", {current.cached} raw items from cache" if cache is not None else ""
+        print(f"[normalize] wrote {current.adapter.norm_path} ({counts[current.adapter.name]} items{cached}, "
+              f"{'in memory' if current.in_memory else mode})")
+
+    jobs = _iter_jobs(present, stream, chunk_size, raw)
+    for ad, meta, (rows, misses, hits, invalid) in _run_jobs(jobs, workers, cache, read_cache=not full):
+        if current is None or current.adapter is not ad:
+            if current is not None:
+                _finish_current()
+            current = _RetailerOutput(ad, meta, membership.get(ad.name) if membership is not None else None, opts,
+                                      in_memory=ad.name in raw)
+        report.add(ad.name, len(rows), invalid)
+        current.add(rows, merged)
+        if cache is not None:
+            cache.put(misses)
+            cache.touch(hits)
+            current.cached += len(hits)
+    if current is not None:
+        _finish_current()
+
+    merged_header = {
         "schema_version": SCHEMA_VERSION,
         "captured_at": _now_utc_iso(),
-        "sources": [o["retailer"] for o in outputs],
+        "sources": list(counts),
         "flyers": merged_flyers,
-        "items": merged_items,
     }
-    ALL_NORM.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"[normalize] wrote {ALL_NORM} ({len(merged_items)} items total)")
+    if matches:
+        # Streamed pass over the per-retailer files just written; the matcher
+        # only keeps a compact match key per priced item.
+        with run_manifest.stage("normalize.matches") as st:
+            matcher = product_match.Matcher()
+            for ad in present:
+                matcher.add_all(_iter_json_array(ad.norm_path, ("items",)), ad.name)
+            merged_header["matches"] = matcher.groups()
+            st.add(items=len(merged_header["matches"]))
+        print(f"[normalize] matched {len(merged_header['matches'])} cross-retailer product groups")
+    report.document(ALL_NORM.name, merged_header, schema_check.MERGED_KEYS)
+    for path in merged.finish(merged_header):
+        run_manifest.wrote(path)
+    print(f"[normalize] wrote {ALL_NORM} ({merged.count} items total)")
+    run_manifest.wrote(report.write())
+    print(f"[normalize] validation: {report.summary()} -> {schema_check.REPORT_PATH}")
+    report.finish()
+
+    if sqlite:
+        # Second streamed pass over the merged file; keeps memory flat.
+        with run_manifest.stage("normalize.deal_index") as st:
+            n = deal_index.build_index(
+                _iter_json_array(ALL_NORM, ("items",)),
+                merged_flyers,
+                {k: merged_header[k] for k in ("schema_version", "captured_at", "sources")},
+                DEALS_DB,
+            )
+            st.add(items=n)
+            run_manifest.wrote(DEALS_DB)
+        print(f"[normalize] wrote {DEALS_DB} ({n} items indexed)")
+
+    if fingerprint is not None:
+        cache.record_stage(fingerprint, counts, outputs)
+    _compress_published(opts)
+    return counts
+
+
+def _compress_published(opts: output_formats.OutputOptions) -> None:
+    """The .gz / .xz copies of the merged document's files."""
+    if not opts.compress:
+        return
+    published = output_formats.paths_for(ALL_NORM, opts, compressed=False)
+    with run_manifest.stage("normalize.compress") as st:
+        for path in output_formats.compress_all(published, opts.compress, workers=os.cpu_count() or 1):
+            run_manifest.wrote(path)
+        st.add(items=len(published) * len(opts.compress))
+    print(f"[normalize] wrote {'/'.join(opts.compress)} copies of {len(published)} files")
+
+
+def _list_arg(allowed: Tuple[str, ...], what: str) -> Callable[[str], Tuple[str, ...]]:
+    def parse(value: str) -> Tuple[str, ...]:
+        try:
+            return output_formats.parse_list(value, allowed, what)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e)) from None
+    return parse
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Normalize raw retailer feeds in out/.")
+    ap.add_argument("--stream", action="store_true",
+                    help="parse raw feeds incrementally and write items as they are normalized (flat memory)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="worker processes for normalization (0 = one per CPU)")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                    help="raw items per worker task")
+    ap.add_argument("--retailer", action="append", choices=sorted(ADAPTERS),
+                    help="only normalize these retailers (repeatable; default: all registered)")
+    ap.add_argument("--full", action="store_true",
+                    help="ignore the normalize cache and re-normalize every item (the cache is still refreshed)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="neither read nor write the normalize cache")
+    ap.add_argument("--no-sqlite", action="store_true",
+                    help=f"don't build the {DEALS_DB.name} deal index")
+    ap.add_argument("--no-matches", action="store_true",
+                    help=f"don't add cross-retailer product matches to {ALL_NORM.name}")
+    ap.add_argument("--max-invalid", type=int, default=None, metavar="N",
+                    help="fail as soon as more than N items (or document headers) fail schema validation "
+                         "(default: only report them)")
+    ap.add_argument("--max-invalid-share", type=float, default=None, metavar="F",
+                    help="fail on any document error, on no items, or when more than this share (0-1) of the "
+                         "items fail schema validation; fewer item failures are only reported")
+    ap.add_argument("--pretty", action="store_true",
+                    help="write the .json documents indented (default: minified)")
+    ap.add_argument("--format", type=_list_arg(output_formats.FORMATS, "format"),
+                    default=output_formats.FORMATS,
+                    help="comma-separated formats besides .json: ndjson, columnar, or none (default: all)")
+    ap.add_argument("--compress", type=_list_arg(output_formats.COMPRESSIONS, "compression"),
+                    default=output_formats.COMPRESSIONS,
+                    help="comma-separated precompressed copies: gz, xz, or none (default: gz,xz)")
+    args = ap.parse_args(argv)
+    opts = output_formats.OutputOptions(pretty=args.pretty, formats=args.format, compress=args.compress)
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    adapters = [ADAPTERS[r] for r in args.retailer] if args.retailer else None
+    cache = None if args.no_cache else norm_cache.NormCache()
+    try:
+        with run_manifest.stage("normalize") as st:
+            counts = normalize_all(adapters, stream=args.stream, workers=workers, chunk_size=max(1, args.chunk_size),
+                                   cache=cache, full=args.full, sqlite=not args.no_sqlite,
+                                   matches=not args.no_matches, opts=opts, max_invalid=args.max_invalid,
+                                   max_invalid_share=args.max_invalid_share)
+            st.add(items=sum(counts.values()))
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == "__main__":
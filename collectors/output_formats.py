@@ -0,0 +1,243 @@
+"""
+Publish formats for the normalized documents written by normalize.py.
+
+Every document (`{<header>, "items": [...]}`) is written as:
+  - <name>.json           minified JSON (pretty, indent=2, only with --pretty)
+  - <name>.ndjson         one compact item per line, no header, for consumers
+                          that stream (`--format ndjson`)
+  - <name>.columnar.json  the header plus one array per field (nested objects
+                          flattened to dotted names, e.g. "price.value"; null
+                          where an item lacks the field). Repeated strings
+                          such as retailer, flyer_id, unit and currency are
+                          stored once under "dicts" and the column holds
+                          indexes into it (`--format columnar`)
+and the files of the published merged document get precompressed .gz / .xz
+copies (`--compress`), compressed in parallel threads (zlib and lzma release
+the GIL). The copies are cheap to regenerate from the JSON, so they are not
+kept in the normalize stage cache.
+
+Writers get the items as compact JSON lines (the spool written by
+normalize._StreamingDocWriter), so NDJSON is a straight copy and only the
+pretty and columnar variants parse items again.
+"""
+import gzip
+import json
+import lzma
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Dict, List, Tuple
+
+FORMATS = ("json", "ndjson", "columnar")
+COMPRESSIONS = ("gz", "xz")
+
+# Dictionary-encoded columns of the columnar variant.
+DICT_COLUMNS = frozenset({
+    "retailer", "flyer_id", "valid_from", "valid_to", "price.unit", "price.currency",
+    "categories.l1.name", "categories.l2.name", "categories.l3.name", "sale_story",
+})
+
+_COPY_BUFSIZE = 1 << 20
+_COLUMN_CHUNK = 10_000
+# gzip 6 / xz preset 3: most of the size of gzip 9 / xz 6 for a fraction
+# of the CPU (level 9 and preset 6 were most of normalize's wall time).
+GZIP_LEVEL = 6
+XZ_PRESET = 3
+
+
+@dataclass(frozen=True)
+class OutputOptions:
+    pretty: bool = False
+    formats: Tuple[str, ...] = FORMATS
+    compress: Tuple[str, ...] = COMPRESSIONS
+
+    def fingerprint(self) -> Dict[str, Any]:
+        return {"pretty": self.pretty, "formats": sorted(self.formats), "compress": sorted(self.compress)}
+
+
+# One encoder for every compact dump (json.dumps with options builds a new one per call).
+_compact = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return _compact(obj)
+
+
+def variant_path(path: Path, fmt: str) -> Path:
+    """deals_all.normalized.json -> .ndjson / .columnar.json (json: unchanged)."""
+    if fmt == "json":
+        return path
+    if fmt == "ndjson":
+        return path.with_suffix(".ndjson")
+    if fmt == "columnar":
+        return path.with_suffix(".columnar.json")
+    raise ValueError(f"unknown output format: {fmt}")
+
+
+def compressed_path(path: Path, comp: str) -> Path:
+    return path.with_name(f"{path.name}.{comp}")
+
+
+def uncompressed_paths(path: Path, opts: OutputOptions) -> List[Path]:
+    return [variant_path(path, fmt) for fmt in FORMATS if fmt == "json" or fmt in opts.formats]
+
+
+def paths_for(path: Path, opts: OutputOptions, compressed: bool = True) -> List[Path]:
+    """Every file written for the document at `path` (json first); `compressed`: with its copies."""
+    base = uncompressed_paths(path, opts)
+    if not compressed:
+        return base
+    return base + [compressed_path(p, comp) for p in base for comp in opts.compress]
+
+
+def parse_list(value: str, allowed: Tuple[str, ...], what: str) -> Tuple[str, ...]:
+    """'a,b' -> ('a', 'b'); '' or 'none' -> (). For argparse `type=`."""
+    if value.strip().lower() in ("", "none"):
+        return ()
+    out = tuple(dict.fromkeys(v.strip().lower() for v in value.split(",") if v.strip()))
+    bad = [v for v in out if v not in allowed]
+    if bad:
+        raise ValueError(f"unknown {what}: {', '.join(bad)} (choose from {', '.join(allowed)})")
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Writers (items come from a spool of compact JSON lines)
+# ---------------------------------------------------------------------------
+
+def write_json(spool: IO[str], count: int, header: Dict[str, Any], path: Path, pretty: bool) -> None:
+    """
+    `{<header>, "items": [...]}` byte-for-byte like dumps(doc, pretty), without
+    holding the items: the header is serialized with an empty list and the
+    spooled items are spliced in.
+    """
+    doc = dumps({**header, "items": []}, pretty)
+    spool.seek(0)
+    with path.open("w", encoding="utf-8") as f:
+        if not pretty:
+            f.write(doc[:-len("[]}")])
+            f.write("[")
+            for i, line in enumerate(spool):
+                if i:
+                    f.write(",")
+                f.write(line[:-1])
+            f.write("]}")
+            return
+        f.write(doc[:-len("[]\n}")])
+        if count:
+            f.write("[\n")
+            for i, line in enumerate(spool):
+                if i:
+                    f.write(",\n")
+                f.write("    " + dumps(json.loads(line), True).replace("\n", "\n    "))
+            f.write("\n  ]")
+        else:
+            f.write("[]")
+        f.write("\n}")
+
+
+def write_ndjson(spool: IO[str], path: Path) -> None:
+    spool.seek(0)
+    with path.open("w", encoding="utf-8") as f:
+        shutil.copyfileobj(spool, f, _COPY_BUFSIZE)
+
+
+def _flatten(obj: Dict[str, Any], prefix: str, out: Dict[str, Any]) -> None:
+    for k, v in obj.items():
+        name = prefix + k
+        if isinstance(v, dict) and v:
+            _flatten(v, name + ".", out)
+        else:
+            out[name] = v
+
+
+def write_columnar(spool: IO[str], count: int, header: Dict[str, Any], path: Path) -> None:
+    """
+    Column-oriented variant. Columns appear in first-seen order; a column
+    first seen at row n is back-filled with n nulls. Values are buffered
+    per column for up to _COLUMN_CHUNK rows and flushed to one temp file per
+    column, so memory stays flat.
+    """
+    columns: Dict[str, IO[str]] = {}
+    buffers: Dict[str, List[Any]] = {}
+    dicts: Dict[str, Dict[Any, int]] = {}
+
+    def flush() -> None:
+        for name, buf in buffers.items():
+            if buf:
+                columns[name].write(dumps(buf)[1:-1] + ",")
+                buf.clear()
+
+    try:
+        spool.seek(0)
+        for row, line in enumerate(spool):
+            flat: Dict[str, Any] = {}
+            _flatten(json.loads(line), "", flat)
+            for name, v in flat.items():
+                buf = buffers.get(name)
+                if buf is None:
+                    columns[name] = tempfile.TemporaryFile("w+", encoding="utf-8", dir=path.parent)
+                    columns[name].write("null," * (row - row % _COLUMN_CHUNK))
+                    buf = buffers[name] = [None] * (row % _COLUMN_CHUNK)
+                if name in DICT_COLUMNS and v is not None:
+                    d = dicts.setdefault(name, {})
+                    v = d.setdefault(v, len(d))
+                buf.append(v)
+            if len(flat) < len(buffers):
+                for name, buf in buffers.items():
+                    if name not in flat:
+                        buf.append(None)
+            if (row + 1) % _COLUMN_CHUNK == 0:
+                flush()
+        flush()
+
+        doc = dumps({
+            **header,
+            "layout": "columnar",
+            "count": count,
+            "dicts": {name: list(d) for name, d in dicts.items()},
+            "columns": {},
+        })
+        with path.open("w", encoding="utf-8") as f:
+            f.write(doc[:-len("{}}")])
+            f.write("{")
+            for i, (name, col) in enumerate(columns.items()):
+                f.write(("," if i else "") + dumps(name) + ":[")
+                col.seek(0)
+                # every value is followed by ","; drop the last one
+                prev = col.read(_COPY_BUFSIZE)
+                while True:
+                    chunk = col.read(_COPY_BUFSIZE)
+                    if not chunk:
+                        break
+                    f.write(prev)
+                    prev = chunk
+                f.write(prev[:-1] + "]")
+            f.write("}}")
+    finally:
+        for col in columns.values():
+            col.close()
+
+
+def _compress(src: Path, comp: str) -> Path:
+    dst = compressed_path(src, comp)
+    if comp == "gz":
+        out = gzip.open(dst, "wb", compresslevel=GZIP_LEVEL)
+    else:
+        out = lzma.open(dst, "wb", preset=XZ_PRESET)
+    with src.open("rb") as fin, out as fout:
+        shutil.copyfileobj(fin, fout, _COPY_BUFSIZE)
+    return dst
+
+
+def compress_all(paths: List[Path], compress: Tuple[str, ...], workers: int) -> List[Path]:
+    """Precompressed copies of every path, `workers` at a time; returns them in order."""
+    jobs = [(p, comp) for p in paths for comp in compress]
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        return list(pool.map(lambda job: _compress(*job), jobs))
@@ -0,0 +1,269 @@
+"""
+The whole pipeline in one Python process:
+
+    capture -> normalize -> delta / archive / bundle -> package -> upload
+
+instead of one process per workflow step, each re-reading what the previous
+one wrote to out/:
+  - capture keeps the raw documents in memory (capture_all.RawSink) and
+    normalize reads them from there; the raw feeds are only written to out/
+    when normalize is not part of the run (they are then its final artifact)
+    or with --keep-raw
+  - delta, archive and bundle share one streamed pass over
+    deals_all.normalized.json (DeltaBuilder, price_archive.ingest and
+    BundleBuilder fed item by item)
+  - package zips out/ in-process (the workflow's exclusions: no raw feeds, no
+    .gz / .xz copies) and upload reuses drive_upload's parallel uploader
+Capture-side imports (Playwright, requests) and the Google client are only
+imported when their stage runs.
+
+Stages can be picked with --only / --skip (comma-separated); a stage whose
+input comes from a stage that is not run reads it from out/, as left by an
+earlier run or workflow step. When capture runs and every feed came back
+unchanged (http_cache.changed()), the run stops after capture unless --force.
+
+Usage:
+  python -m collectors run                                  # everything
+  python -m collectors run --capture fanout --skip upload
+  python -m collectors run --skip capture --publish delta   # raw feeds already in out/
+  python -m collectors run --only normalize,bundle --no-cache
+"""
+import argparse
+import asyncio
+import fnmatch
+import itertools
+import os
+import sys
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "planner"))
+
+import deals_delta  # noqa: E402
+import lean_capture  # noqa: E402
+import norm_cache  # noqa: E402
+import normalize  # noqa: E402
+import output_formats  # noqa: E402
+import price_archive  # noqa: E402
+import run_manifest  # noqa: E402
+import build_bundle  # noqa: E402
+
+STAGES = ("capture", "normalize", "delta", "archive", "bundle", "package", "upload")
+
+ZIP_PATH = normalize.OUT_DIR / "flyer-data.zip"
+# Not zipped: raw feeds, and the .gz / .xz copies (already compressed).
+ZIP_EXCLUDE = ("*_products.json", "*.gz", "*.xz")
+
+PUBLISH_MODES = ("full", "delta")
+UPLOADS = {
+    "full": [normalize.ALL_NORM, normalize.SOBEYS_NORM, normalize.WALMART_NORM, deals_delta.DELTA_PATH, ZIP_PATH],
+    "delta": [deals_delta.DELTA_PATH],
+}
+
+
+def _require(path: Path) -> None:
+    if not path.exists() or path.stat().st_size == 0:
+        raise RuntimeError(f"Missing or empty file: {path}")
+
+
+def _tap(items: Iterable[Dict[str, Any]], consumers: List[Callable[[Dict[str, Any]], None]]) -> Iterator[Dict[str, Any]]:
+    """Pass every item to each consumer on its way through."""
+    for it in items:
+        for consume in consumers:
+            consume(it)
+        yield it
+
+
+def run_capture(args: argparse.Namespace, keep: bool) -> Optional[Dict[str, Any]]:
+    """Capture args.capture; returns the raw documents when `keep`, else saves them to out/."""
+    import capture_all
+
+    raw: Dict[str, Any] = {}
+    t0 = time.monotonic()
+    results = asyncio.run(capture_all.capture_all(
+        args.capture or capture_all.DEFAULT_RETAILERS,
+        args.deadline or capture_all.DEADLINE_S,
+        args.attempts or capture_all.ATTEMPTS,
+        args.lean,
+        raw if keep else None,
+        reset_status=True,
+    ))
+    capture_all.report(results, time.monotonic() - t0, in_memory=keep)
+    if not any(r.ok for r in results):
+        raise RuntimeError("every capture failed")
+    return raw if keep else None
+
+
+def run_normalize(raw: Optional[Dict[str, Any]], args: argparse.Namespace) -> Dict[str, int]:
+    opts = output_formats.OutputOptions(pretty=args.pretty, formats=args.format, compress=args.compress)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    cache = None if args.no_cache else norm_cache.NormCache()
+    try:
+        with run_manifest.stage("normalize") as st:
+            counts = normalize.normalize_all(stream=True, workers=workers, cache=cache, full=args.full,
+                                             opts=opts, raw=raw, max_invalid=args.max_invalid,
+                                             max_invalid_share=args.max_invalid_share)
+            st.add(items=sum(counts.values()))
+    finally:
+        if cache is not None:
+            cache.close()
+    _require(normalize.ALL_NORM)
+    return counts
+
+
+def run_derived(delta: bool, archive: bool, bundle: bool) -> None:
+    """delta / archive / bundle from one streamed pass over the merged file."""
+    _require(normalize.ALL_NORM)
+    meta: Dict[str, Any] = {}
+    items = normalize._iter_json_array(normalize.ALL_NORM, ("items",), meta)
+    head = list(itertools.islice(items, 1))  # header scalars (captured_at) are read by now
+    captured_at = meta.get("captured_at")
+
+    consumers: List[Callable[[Dict[str, Any]], None]] = []
+    if delta:
+        delta_builder = deals_delta.DeltaBuilder(deals_delta.load_previous(deals_delta.SNAPSHOT_PATH))
+        consumers.append(delta_builder.add)
+    if bundle:
+        t0 = time.perf_counter()
+        bundle_builder, prefs = build_bundle.new_builder()
+        consumers.append(bundle_builder.add)
+    stream = _tap(itertools.chain(head, items), consumers)
+
+    if archive:
+        conn = price_archive.connect()
+        try:
+            with run_manifest.stage("archive.ingest") as st:
+                week = price_archive.week_of(captured_at)
+                n = price_archive.ingest(conn, stream, week, captured_at)
+                st.add(items=n)
+            print(f"[archive] {week}: archived {n} priced items -> {price_archive.ARCHIVE_PATH}")
+            with run_manifest.stage("archive.compact"):
+                weeks = price_archive.compact(conn)
+                run_manifest.wrote(price_archive.ARCHIVE_PATH)
+            print(f"[archive] compacted {len(weeks)} weeks" + (f" ({weeks[0]} .. {weeks[-1]})" if weeks else ""))
+        finally:
+            conn.close()
+    else:
+        with run_manifest.stage("derive") as st:
+            n = sum(1 for _ in stream)
+            st.add(items=n)
+
+    if delta:
+        with run_manifest.stage("delta"):
+            deals_delta.finish_delta(delta_builder, captured_at)
+    if bundle:
+        with run_manifest.stage("bundle") as st:
+            stats = build_bundle.write_bundle(
+                bundle_builder, prefs, {"file": normalize.ALL_NORM.name, "captured_at": captured_at},
+                t0=t0,
+            )
+            st.add(items=stats["items"])
+            run_manifest.wrote(build_bundle.BUNDLE_PATH)
+
+
+def run_package(out_dir: Path = normalize.OUT_DIR, zip_path: Path = ZIP_PATH) -> int:
+    """Zip the published contents of out/ (see ZIP_EXCLUDE); returns the files added."""
+    files = sorted(
+        p for p in out_dir.rglob("*")
+        if p.is_file() and p != zip_path and not any(fnmatch.fnmatch(p.name, pat) for pat in ZIP_EXCLUDE)
+    )
+    with run_manifest.stage("package") as st:
+        tmp = zip_path.with_suffix(".tmp")
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            for p in files:
+                zf.write(p, p.relative_to(out_dir).as_posix())
+        os.replace(tmp, zip_path)
+        st.add(items=len(files))
+        run_manifest.wrote(zip_path)
+    print(f"[package] wrote {zip_path} ({len(files)} files)")
+    return len(files)
+
+
+def run_upload(mode: str, fake_drive: Optional[Path] = None) -> None:
+    import drive_upload
+
+    paths = UPLOADS[mode]
+    for path in paths:
+        _require(path)
+    service, folder_id, http_factory = drive_upload.open_drive(fake_drive)
+    with run_manifest.stage("drive_upload"):
+        drive_upload.upload_all(service, folder_id, paths, http_factory=http_factory)
+
+
+def run(stages: List[str], args: argparse.Namespace) -> int:
+    t0 = time.monotonic()
+    raw: Optional[Dict[str, Any]] = None
+    if "capture" in stages:
+        keep = "normalize" in stages and not args.keep_raw
+        raw = run_capture(args, keep)
+        import http_cache
+
+        if not args.force and not http_cache.changed():
+            print("[run] every feed unchanged since the last run; stopping after capture (--force to go on)")
+            return 0
+    if "normalize" in stages:
+        run_normalize(raw, args)
+        raw = None  # release the raw documents before the later stages
+    if {"delta", "archive", "bundle"} & set(stages):
+        run_derived("delta" in stages, "archive" in stages, "bundle" in stages)
+    if "package" in stages:
+        run_package()
+    if "upload" in stages:
+        run_upload(args.publish, args.fake_drive)
+    print(f"[run] {' -> '.join(stages)} in {time.monotonic() - t0:.1f}s")
+    return 0
+
+
+def _stage_list(value: str) -> List[str]:
+    return list(normalize._list_arg(STAGES, "stage")(value))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m collectors", description="Flyer pipeline in a single process.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run", help="capture -> normalize -> delta / archive / bundle -> package -> upload")
+    p.add_argument("--only", type=_stage_list, default=None, help=f"run only these stages ({', '.join(STAGES)})")
+    p.add_argument("--skip", type=_stage_list, default=[], help="run every stage but these")
+    p.add_argument("--force", action="store_true", help="go on after capture even if no feed changed")
+
+    g = p.add_argument_group("capture")
+    g.add_argument("--capture", type=lambda v: [r.strip() for r in v.split(",") if r.strip()], default=None,
+                   help="comma-separated captures, as for capture_all.py (default: its default retailers)")
+    g.add_argument("--deadline", type=float, default=None, help="per-retailer deadline in seconds")
+    g.add_argument("--attempts", type=int, default=None, help="attempts per retailer within its deadline")
+    g.add_argument("--lean", action="store_true", default=lean_capture.enabled(),
+                   help="block non-essential requests in browser captures (default: LEAN_CAPTURE env)")
+    g.add_argument("--keep-raw", action="store_true",
+                   help="also write the raw feeds to out/ when normalize runs in the same process")
+
+    g = p.add_argument_group("normalize")
+    g.add_argument("--workers", type=int, default=0, help="worker processes for normalization (0 = one per CPU)")
+    g.add_argument("--full", action="store_true", help="ignore (but refresh) the normalize cache")
+    g.add_argument("--no-cache", action="store_true", help="neither read nor write the normalize cache")
+    g.add_argument("--max-invalid", type=int, default=None, metavar="N",
+                   help="fail once more than N items fail schema validation (default: only report them)")
+    g.add_argument("--max-invalid-share", type=float, default=None, metavar="F",
+                   help="fail on a document error, no items, or more than this share (0-1) of invalid items")
+    g.add_argument("--pretty", action="store_true", help="write the .json documents indented")
+    g.add_argument("--format", type=normalize._list_arg(output_formats.FORMATS, "format"),
+                   default=output_formats.FORMATS, help="formats besides .json: ndjson, columnar, or none")
+    g.add_argument("--compress", type=normalize._list_arg(output_formats.COMPRESSIONS, "compression"),
+                   default=output_formats.COMPRESSIONS, help="precompressed copies: gz, xz, or none")
+
+    g = p.add_argument_group("upload")
+    g.add_argument("--publish", choices=PUBLISH_MODES, default=os.environ.get("PUBLISH_MODE") or "full",
+                   help="full outputs or only deals_delta.json (default: PUBLISH_MODE env, else full)")
+    g.add_argument("--fake-drive", type=Path,
+                   help="upload into a local directory through fake_drive.FakeDriveService instead of Drive")
+    args = ap.parse_args(argv)
+
+    stages = [s for s in STAGES if (args.only is None or s in args.only) and s not in args.skip]
+    if not stages:
+        ap.error("no stages left to run")
+    return run(stages, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
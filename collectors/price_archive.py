@@ -0,0 +1,398 @@
+"""
+Historical price archive (.cache/archive/prices.sqlite): every run's merged
+normalized items, keyed by ISO week, so "is this really a good price?" is
+one indexed lookup instead of downloading old releases.
+
+  - ingest: the merged feed is streamed into the week of its captured_at.
+    Weeks are append-only: a later run in the same week replaces that week
+    (the latest run of a week wins); other weeks are never rewritten.
+  - one row per priced item: retailer, title key, category (l1), the price
+    on a common scale with its kind `per` (product_match.unit_price(): per
+    kg / per l for measure prices, the effective price per item "ea"
+    otherwise) and enough of the item to show it. Prices are only ever
+    compared within one kind: series, lows and compaction group by `per`. The title key is product_match's match key (folded
+    title + brand tokens, sorted, plus the canonical size), so the same
+    product lines up across weeks and stores.
+  - indexes on (title_key, per, week, price), (retailer, week),
+    (category, week) and week: a price series or 52-week low reads only its
+    key's rows.
+  - compact: weeks older than --keep-weeks (default KEEP_WEEKS) are reduced
+    to the cheapest row per (week, retailer, title key, per), with `n` counting
+    the rows it stands for; per-item ids are dropped.
+
+The archive is the only copy of the history, so the workflow does not leave
+it to the Actions cache (entries unused for 7 days are evicted, and the runs
+are weekly): after each run it is uploaded to the `price-archive` release,
+and restored from there when the cache comes back without it. Once that
+release exists the workflow sets PRICE_ARCHIVE_REQUIRED=1, and writing to a
+missing archive then fails instead of silently starting an empty one.
+
+Usage:
+  python collectors/price_archive.py ingest [--in out/deals_all.normalized.json]
+  python collectors/price_archive.py compact [--keep-weeks 13] [--vacuum]
+  python collectors/price_archive.py keys chicken breast
+  python collectors/price_archive.py series "Boneless Skinless Chicken Breasts" [--retailer sobeys]
+  python collectors/price_archive.py low "Boneless Skinless Chicken Breasts" [--per kg] [--json]
+"""
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import product_match
+import run_manifest
+from normalize import ALL_NORM, _iter_json_array, _now_utc_iso
+
+ARCHIVE_PATH = Path(".cache/archive/prices.sqlite")
+# Set when earlier weeks are expected (see above): a missing archive is an error.
+REQUIRED_ENV = "PRICE_ARCHIVE_REQUIRED"
+
+KEEP_WEEKS = 13
+WINDOW_WEEKS = 52
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS weeks (
+    week TEXT PRIMARY KEY,
+    captured_at TEXT,
+    ingested_at TEXT NOT NULL,
+    items INTEGER NOT NULL,
+    compacted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS prices (
+    week TEXT NOT NULL,
+    retailer TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    category TEXT,
+    title TEXT,
+    source_item_id TEXT,
+    flyer_id TEXT,
+    price REAL NOT NULL,
+    price_value REAL,
+    price_unit TEXT,
+    multi_buy_qty INTEGER,
+    n INTEGER NOT NULL DEFAULT 1,
+    per TEXT NOT NULL DEFAULT 'ea'
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS prices_key_per ON prices(title_key, per, week, price);
+CREATE INDEX IF NOT EXISTS prices_retailer ON prices(retailer, week);
+CREATE INDEX IF NOT EXISTS prices_category ON prices(category, week);
+CREATE INDEX IF NOT EXISTS prices_week ON prices(week);
+"""
+
+_INSERT = """
+INSERT INTO prices (
+    week, retailer, title_key, category, title, source_item_id, flyer_id,
+    price, per, price_value, price_unit, multi_buy_qty
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+PER_KINDS = ("kg", "l", "ea")
+
+
+def iso_week(d: date) -> str:
+    y, w, _ = d.isocalendar()
+    return f"{y}-W{w:02d}"
+
+
+def week_of(ts: Optional[str]) -> str:
+    """ISO week ("2026-W42") of an ISO timestamp; this week when missing or unparseable."""
+    try:
+        return iso_week(datetime.fromisoformat(ts).date())
+    except (TypeError, ValueError):
+        return iso_week(date.today())
+
+
+def weeks_before(week: str, n: int) -> str:
+    """The ISO week n weeks before `week`."""
+    y, w = week.split("-W")
+    return iso_week(date.fromisocalendar(int(y), int(w), 1) - timedelta(weeks=n))
+
+
+def title_key(title: str, brand: Optional[str] = None) -> str:
+    toks, size, _ = product_match.match_key(title, brand)
+    return " ".join(sorted(toks)) + "|" + (size or "")
+
+
+def _row(week: str, item: Dict[str, Any]) -> Optional[tuple]:
+    price = item.get("price") or {}
+    compared = product_match.unit_price(price)
+    if compared is None:
+        return None
+    cat = (item.get("categories") or {}).get("l1")
+    return (
+        week,
+        item.get("retailer") or "",
+        title_key(item.get("title") or "", item.get("brand")),
+        cat.get("name") if isinstance(cat, dict) else None,
+        item.get("title"),
+        item.get("source_item_id"),
+        item.get("flyer_id"),
+        *compared,
+        price.get("value"),
+        price.get("unit"),
+        price.get("multi_buy_qty"),
+    )
+
+
+def connect(db_path: Path = ARCHIVE_PATH, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        if not db_path.exists():
+            raise RuntimeError(f"{db_path} not found; run `price_archive.py ingest` first")
+        connect(db_path).close()  # upgrades an archive from an older schema, if need be
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    else:
+        if not db_path.exists():
+            if os.environ.get(REQUIRED_ENV, "").strip().lower() in ("1", "true", "yes", "on"):
+                raise RuntimeError(f"{db_path} not found but {REQUIRED_ENV} is set; "
+                                   "restore the archive instead of starting an empty one")
+            print(f"[archive] {db_path} not found; starting a new archive")
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db_path))
+        conn.executescript(_TABLES)
+        _migrate(conn)
+        conn.executescript(_INDEXES)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Archives from before `per`: re-price every row per kg / l / item from its stored price fields."""
+    if any(r[1] == "per" for r in conn.execute("PRAGMA table_info(prices)")):
+        return
+    with conn:
+        conn.execute("ALTER TABLE prices ADD COLUMN per TEXT NOT NULL DEFAULT 'ea'")
+        conn.execute("DROP INDEX IF EXISTS prices_key_week")
+        rows = conn.execute("SELECT rowid, price, price_value, price_unit, multi_buy_qty FROM prices").fetchall()
+        updates = []
+        for rowid, eff, value, unit, qty in rows:
+            # `price` was the effective price: unit_value, else value
+            compared = product_match.unit_price({"value": value, "unit": unit, "multi_buy_qty": qty, "unit_value": eff})
+            updates.append((*(compared or (eff, "ea")), rowid))
+        conn.executemany("UPDATE prices SET price = ?, per = ? WHERE rowid = ?", updates)
+
+
+def ingest(conn: sqlite3.Connection, items: Iterable[Dict[str, Any]], week: str,
+           captured_at: Optional[str] = None, batch: int = 5000) -> int:
+    """Replace `week` with these items (each carrying `retailer`); returns the rows archived."""
+    n = 0
+    with conn:
+        conn.execute("DELETE FROM prices WHERE week = ?", (week,))
+        buf: List[tuple] = []
+        for it in items:
+            row = _row(week, it)
+            if row is None:
+                continue
+            buf.append(row)
+            if len(buf) >= batch:
+                conn.executemany(_INSERT, buf)
+                n += len(buf)
+                buf.clear()
+        if buf:
+            conn.executemany(_INSERT, buf)
+            n += len(buf)
+        conn.execute(
+            "INSERT OR REPLACE INTO weeks (week, captured_at, ingested_at, items, compacted) VALUES (?, ?, ?, ?, 0)",
+            (week, captured_at, _now_utc_iso(), n),
+        )
+    return n
+
+
+def compact(conn: sqlite3.Connection, keep_weeks: int = KEEP_WEEKS, vacuum: bool = False) -> List[str]:
+    """Reduce weeks older than the newest `keep_weeks` to one row per (week, retailer, key, per)."""
+    latest = conn.execute("SELECT MAX(week) FROM weeks").fetchone()[0]
+    if latest is None:
+        return []
+    cutoff = weeks_before(latest, keep_weeks - 1)
+    weeks = [r[0] for r in conn.execute(
+        "SELECT week FROM weeks WHERE week < ? AND compacted = 0 ORDER BY week", (cutoff,))]
+    with conn:
+        for week in weeks:
+            # Bare columns next to MIN() come from the cheapest row (SQLite).
+            conn.execute("""
+                CREATE TEMP TABLE compacted AS
+                SELECT week, retailer, title_key, category, title, MIN(price) AS price, per,
+                       price_value, price_unit, multi_buy_qty, SUM(n) AS n
+                FROM prices WHERE week = ? GROUP BY retailer, title_key, per
+            """, (week,))
+            conn.execute("DELETE FROM prices WHERE week = ?", (week,))
+            conn.execute("""
+                INSERT INTO prices (week, retailer, title_key, category, title, price, per,
+                                    price_value, price_unit, multi_buy_qty, n)
+                SELECT week, retailer, title_key, category, title, price, per,
+                       price_value, price_unit, multi_buy_qty, n FROM compacted
+            """)
+            conn.execute("DROP TABLE compacted")
+            conn.execute("UPDATE weeks SET compacted = 1 WHERE week = ?", (week,))
+    if vacuum and weeks:
+        conn.execute("VACUUM")
+    return weeks
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _window_start(conn: sqlite3.Connection, weeks: int) -> str:
+    latest = conn.execute("SELECT MAX(week) FROM weeks").fetchone()[0] or iso_week(date.today())
+    return weeks_before(latest, weeks - 1)
+
+
+def price_series(conn: sqlite3.Connection, key: str, retailer: Optional[str] = None,
+                 weeks: int = WINDOW_WEEKS, per: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Cheapest price per (week, retailer, per) of one title key over the last `weeks` weeks."""
+    sql = """
+        SELECT week, retailer, MIN(price) AS price, per, title, price_value, price_unit, multi_buy_qty
+        FROM prices WHERE title_key = ? AND week >= ?
+    """
+    params: List[Any] = [key, _window_start(conn, weeks)]
+    if per:
+        sql += " AND per = ?"
+        params.append(per)
+    if retailer:
+        sql += " AND retailer = ?"
+        params.append(retailer)
+    sql += " GROUP BY week, retailer, per ORDER BY week, per, price"
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def main_kind(conn: sqlite3.Connection, key: str, since: str) -> Optional[str]:
+    """The price kind a title key is most often sold by since the week `since`."""
+    row = conn.execute(
+        "SELECT per FROM prices WHERE title_key = ? AND week >= ? GROUP BY per ORDER BY SUM(n) DESC, per LIMIT 1",
+        (key, since),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def low(conn: sqlite3.Connection, key: str, retailer: Optional[str] = None,
+        weeks: int = WINDOW_WEEKS, per: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    The lowest price of one title key over the last `weeks` weeks, within one
+    price kind: `per`, else the kind the key is most often sold by (None if
+    never seen).
+    """
+    since = _window_start(conn, weeks)
+    per = per or main_kind(conn, key, since)
+    if per is None:
+        return None
+    sql = """
+        SELECT MIN(price) AS price, per, week, retailer, title, price_value, price_unit, multi_buy_qty,
+               COUNT(DISTINCT week) AS weeks_seen
+        FROM prices WHERE title_key = ? AND per = ? AND week >= ?
+    """
+    params: List[Any] = [key, per, since]
+    if retailer:
+        sql += " AND retailer = ?"
+        params.append(retailer)
+    row = dict(conn.execute(sql, params).fetchone())
+    return row if row["price"] is not None else None
+
+
+def find_keys(conn: sqlite3.Connection, words: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Title keys (one row per price kind) with a token starting with each word; most-seen first."""
+    toks = product_match.tokens(product_match._fold(words))
+    if not toks:
+        return []
+    where = " AND ".join("(' ' || title_key || ' ') LIKE ?" for _ in toks)
+    params = [f"% {t}%" for t in toks]
+    sql = f"""
+        SELECT title_key, per, COUNT(DISTINCT week) AS weeks_seen, MIN(price) AS low, MIN(title) AS title
+        FROM prices WHERE {where} GROUP BY title_key, per ORDER BY weeks_seen DESC, title_key, per LIMIT ?
+    """
+    return [dict(r) for r in conn.execute(sql, params + [limit])]
+
+
+def _key_arg(args: argparse.Namespace) -> str:
+    return args.title if args.key else title_key(args.title)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Weekly price archive of the merged normalized feed.")
+    ap.add_argument("--db", type=Path, default=ARCHIVE_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ingest", help="archive a merged normalized feed under its week")
+    p.add_argument("--in", dest="in_path", type=Path, default=ALL_NORM)
+    p.add_argument("--week", help="ISO week (YYYY-Www); default: the week of the feed's captured_at")
+
+    p = sub.add_parser("compact", help="reduce old weeks to the cheapest row per retailer and product")
+    p.add_argument("--keep-weeks", type=int, default=KEEP_WEEKS, help="newest weeks kept item by item")
+    p.add_argument("--vacuum", action="store_true")
+
+    p = sub.add_parser("keys", help="find title keys by words")
+    p.add_argument("words", nargs="+")
+    p.add_argument("--limit", type=int, default=20)
+
+    for name, help_text in (("series", "weekly price series of a product"), ("low", "lowest price of a product")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("title", help="item title (or a title key with --key)")
+        p.add_argument("--key", action="store_true", help="TITLE is a title key as printed by `keys`")
+        p.add_argument("--retailer")
+        p.add_argument("--weeks", type=int, default=WINDOW_WEEKS)
+        p.add_argument("--per", choices=PER_KINDS,
+                       help="price kind (per kg, l or item); low: default the product's most common")
+        p.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+
+    if args.cmd in ("ingest", "compact"):
+        conn = connect(args.db)
+        try:
+            with run_manifest.stage(f"archive.{args.cmd}") as st:
+                if args.cmd == "ingest":
+                    meta: Dict[str, Any] = {}
+                    items = _iter_json_array(args.in_path, ("items",), meta)
+                    head = list(itertools.islice(items, 1))  # header scalars (captured_at) are read by now
+                    week = args.week or week_of(meta.get("captured_at"))
+                    n = ingest(conn, itertools.chain(head, items), week, meta.get("captured_at"))
+                    st.add(items=n)
+                    print(f"[archive] {week}: archived {n} priced items -> {args.db}")
+                else:
+                    weeks = compact(conn, args.keep_weeks, args.vacuum)
+                    print(f"[archive] compacted {len(weeks)} weeks" + (f" ({weeks[0]} .. {weeks[-1]})" if weeks else ""))
+                run_manifest.wrote(args.db)
+        finally:
+            conn.close()
+        return 0
+
+    conn = connect(args.db, readonly=True)
+    try:
+        t0 = time.perf_counter()
+        if args.cmd == "keys":
+            rows: Any = find_keys(conn, " ".join(args.words), args.limit)
+        elif args.cmd == "series":
+            rows = price_series(conn, _key_arg(args), args.retailer, args.weeks, args.per)
+        else:
+            rows = low(conn, _key_arg(args), args.retailer, args.weeks, args.per)
+        ms = (time.perf_counter() - t0) * 1000
+    finally:
+        conn.close()
+
+    if getattr(args, "json", False):
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return 0
+    if not rows:
+        print("(not in the archive)")
+    elif args.cmd == "keys":
+        for r in rows:
+            print(f"{r['weeks_seen']:>3} wk  low {r['low']:g}/{r['per']:<6} {r['title_key']}")
+    elif args.cmd == "series":
+        for r in rows:
+            print(f"{r['week']}  {r['retailer']:<8} {r['price']:g}/{r['per']:<6} {r['title']}")
+    else:
+        print(f"{args.weeks}-week low: {rows['price']:g}/{rows['per']} at {rows['retailer']} in {rows['week']} "
+              f"({rows['title']}; seen in {rows['weeks_seen']} weeks)")
+    print(f"({ms:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
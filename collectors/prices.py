@@ -0,0 +1,202 @@
+"""
+Flyer price parsing: (pre_price_text, price_text, post_price_text) -> price object.
+
+Understands the formats flyers actually use:
+
+  "4.99" / "$1,299.99"          plain price
+  pre "2/" + "5.00", "2 for $5"  multi-buy        -> multi_buy_qty 2, unit_value 2.5
+  "$3.99/lb", post "lb"          per-weight price -> unit "lb", unit_value 3.99
+  post "/100 g", "/kg 8.80 lb"   per-measure      -> unit "100g" / "kg"
+  "99¢"                          cents            -> value 0.99
+  pre "SAVE" + "$2", "30% off"   savings, not a price -> value None
+  "1/2 price", "BOGO", "2 for 1"  (also "half price", "buy 1 get 1 free")
+
+`unit_value` is the price of one `unit`; it stays None for a plain
+single-item price.
+
+All grammars are compiled once, and parse results are memoized on the
+(pre, text, post) triple in an LRU (the same few hundred price strings repeat
+across a whole flyer). parse_column() parses a column of triples, doing each
+distinct one once; price_object() returns one shared item_model.Price per
+distinct triple.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from item_model import Price
+
+CURRENCY = "CAD"
+MEMO_SIZE = 8192
+
+_NUM = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+"
+
+_float_re = re.compile(r"[-+]?\d+(?:\.\d+)?")
+# "2/", "2 /", "2 for", "3 FOR"
+_multi_pre_re = re.compile(r"^\s*(\d+)\s*(?:/|for)\s*$", re.IGNORECASE)
+# "2/$5", "2 for $5.00", "3 for 99¢"; not "1/2 price" or "2/100 g" (a fraction,
+# a measure), so the quantity is at least 2 and the price is not followed by
+# more digits, a measure unit, "%" or "price"
+_multi_text_re = re.compile(
+    rf"^\s*([2-9]|[1-9]\d+)\s*(?:/|for)\s*\$?\s*({_NUM})"
+    r"(?![\d.,]|\s*(?:%|(?:lbs?|kg|g|ml|l|price)\b))\s*(¢|c\b)?",
+    re.IGNORECASE,
+)
+_price_re = re.compile(rf"\$?\s*({_NUM})\s*(¢|c\b|%)?", re.IGNORECASE)
+# Savings, not a price: "SAVE $2", "(up to) 30% off", "1/2 price", "half price",
+# "BOGO", "B1G1", "buy 1 get 1 free", "2 for 1"; checked on pre, on the price
+# text, and on the price text run into post ("1/2" + "price") before any price
+# grammar, so none of them reaches the plain-price fallback.
+_save_re = re.compile(
+    r"^\s*(?:(?:you\s+)?save\b|(?:up\s+to\s+)?\d+(?:\.\d+)?\s*%|(?:\d+\s*/\s*\d+|½|half)\s*(?:price|off)\b"
+    r"|bogo\b|b\d+g\d+\b|buy\s+(?:\d+|one|two)\s+get\b|\d+\s*for\s*1\s*$)",
+    re.IGNORECASE,
+)
+# "/lb", "lb", "/100 g", "per kg", "ea."
+_unit_re = re.compile(
+    r"^\s*(?:/|per\s+)?\s*(?:(\d+(?:\.\d+)?)\s*)?(lbs?|kg|g|ml|l|ea|each|pk|pkg|dozen|doz)\b\.?",
+    re.IGNORECASE,
+)
+
+_UNIT_ALIASES = {"lbs": "lb", "each": "ea", "pkg": "pk", "dozen": "doz"}
+# Units where a price is per measure (unit_value = value); counts are not.
+_MEASURES = {"lb", "kg", "g", "ml", "l"}
+
+_Parsed = Tuple[Optional[float], str, Optional[int], Optional[float]]
+
+
+def _safe_str(x: Any) -> str:
+    return "" if x is None else str(x)
+
+
+def extract_float(s: Any) -> Optional[float]:
+    """First float-looking number in s (thousands separators ignored)."""
+    if s is None:
+        return None
+    if isinstance(s, (int, float)):
+        return float(s)
+    txt = str(s)
+    if "," in txt:
+        txt = txt.replace(",", "")
+    m = _float_re.search(txt)
+    return float(m.group(0)) if m else None
+
+
+def _num(s: str, cents: Optional[str]) -> float:
+    v = float(s.replace(",", ""))
+    return round(v / 100, 2) if cents and cents.lower() in ("¢", "c") else v
+
+
+def multi_buy_qty(pre: Any) -> Optional[int]:
+    """Quantity of a multi-buy prefix such as "2/" or "3 for"."""
+    if not pre:
+        return None
+    m = _multi_pre_re.match(str(pre))
+    return int(m.group(1)) if m else None
+
+
+def parse_unit(s: str) -> Optional[str]:
+    """Canonical unit at the start of s ("/100 g" -> "100g"), or None."""
+    m = _unit_re.match(s)
+    if not m:
+        return None
+    u = m.group(2).lower()
+    u = _UNIT_ALIASES.get(u, u)
+    return f"{m.group(1)}{u}" if m.group(1) else u
+
+
+def _legacy_unit(post: str) -> str:
+    # Unrecognized post text is kept as-is (lowercased), like before.
+    return post.lower() if post else "ea"
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _parse(pre: str, text: str, post: str, override: Optional[float]) -> _Parsed:
+    qty = multi_buy_qty(pre)
+    value: Optional[float] = override
+    text_unit: Optional[str] = None
+
+    if _save_re.match(pre) or _save_re.match(text) or (post and _save_re.match(f"{text} {post}")):
+        # "SAVE $2", "1/2 price", "BOGO" are discounts, not what the item costs.
+        value, qty = None, None
+    elif override is None:
+        m = _multi_text_re.match(text)
+        if m:
+            qty = qty or int(m.group(1))
+            value = _num(m.group(2), m.group(3))
+            rest = text[m.end():]
+        else:
+            m = _price_re.search(text)
+            if m and m.group(2) != "%":
+                value = _num(m.group(1), m.group(2))
+                rest = text[m.end():]
+            else:
+                rest = ""
+        text_unit = parse_unit(rest) if rest else None
+
+    unit = parse_unit(post) if post else None
+    unit = unit or text_unit or _legacy_unit(post)
+
+    unit_value = None
+    if value is not None:
+        if qty and qty > 0:
+            # Example: pre "2/" + price "4.50" means 2 for 4.50 => unit_value 2.25
+            unit_value = round(value / qty, 4)
+        elif unit.lstrip("0123456789.") in _MEASURES:
+            unit_value = value
+    return value, unit, qty, unit_value
+
+
+def build_price(pre: Any, price_text: Any, post: Any, numeric_override: Optional[float] = None) -> Dict[str, Any]:
+    pre_s = _safe_str(pre).strip()
+    post_s = _safe_str(post).strip()
+    text_s = _safe_str(price_text).strip()
+    value, unit, qty, unit_value = _parse(pre_s, text_s, post_s, numeric_override)
+    return {
+        "currency": CURRENCY,
+        "value": value,
+        "unit": unit,
+        "pre": pre_s,
+        "post": post_s,
+        "text": text_s,
+        "multi_buy_qty": qty,
+        "unit_value": unit_value,
+    }
+
+
+def price_object(pre: Any, price_text: Any, post: Any, numeric_override: Optional[float] = None) -> Price:
+    """build_price as a shared, immutable Price: one object per distinct triple."""
+    return _price_object(_safe_str(pre).strip(), _safe_str(price_text).strip(), _safe_str(post).strip(),
+                         numeric_override)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _price_object(pre_s: str, text_s: str, post_s: str, override: Optional[float]) -> Price:
+    value, unit, qty, unit_value = _parse(pre_s, text_s, post_s, override)
+    return Price(CURRENCY, value, unit, pre_s, post_s, text_s, qty, unit_value)
+
+
+def parse_column(
+    pres: Sequence[Any],
+    texts: Sequence[Any],
+    posts: Sequence[Any],
+    overrides: Optional[Iterable[Optional[float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    build_price over whole columns at once; each distinct triple is parsed
+    once. Every returned dict is a separate object.
+    """
+    overrides = overrides if overrides is not None else [None] * len(texts)
+    done: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    out: List[Dict[str, Any]] = []
+    for key in zip(pres, texts, posts, overrides):
+        p = done.get(key)
+        if p is None:
+            p = done[key] = build_price(*key)
+        out.append(dict(p))
+    return out
+
+
+def memo_info():
+    """LRU statistics (hits, misses, maxsize, currsize) of the parse memo."""
+    return _parse.cache_info()
@@ -0,0 +1,320 @@
+"""
+Cross-retailer product matching: "same product, different store".
+
+Every priced item is reduced to a match key:
+  - title (+ brand) tokens: accent-folded, lowercased, stopwords and
+    flyer filler ("selected", "assorted", ...) dropped
+  - size, pulled out of the title and canonicalized ("2 x 500 mL" -> 1000ml,
+    "1.5 kg" -> 1500g, "12 pk" -> 12ct)
+  - price kind: what unit_price() compares on, per kg, per l or per item
+    ("ea"); a weight price is never compared with a volume or item price
+
+Items with identical keys are grouped directly (one dict pass). Fuzzy
+candidates come from an inverted token index with prefix filtering: each
+item is only indexed under its rarest tokens (enough of them that any pair
+above the Jaccard threshold must share one), and tokens in more than MAX_DF
+items are never used to look up candidates. Every item therefore probes a
+bounded number of postings, and matching stays close to linear in the number
+of items instead of comparing every pair.
+
+A pair matches when the items come from different retailers, have the same
+price kind, don't have conflicting brands or sizes and their token Jaccard
+is >= MIN_JACCARD (STRICT_JACCARD when either size is unknown). Matches are
+joined into groups; each group lists its offers cheapest first by
+unit_price() (price.unit_value, else price.value, with per-measure prices
+scaled to per kg / l, so $3.99/lb ranks above $6.00/kg), and its savings are
+the spread of that unit price.
+
+normalize.py stores the groups as the `matches` section of
+deals_all.normalized.json.
+
+Usage:
+  python collectors/product_match.py                 # biggest savings first
+  python collectors/product_match.py --top 50 --json
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MATCHER_VERSION = 2
+
+MIN_JACCARD = 0.6
+STRICT_JACCARD = 0.75
+# Tokens in more items than this are too common to find candidates with.
+MAX_DF = 100
+
+STOPWORDS = frozenset("""
+    a an and the of or with in on for to from per by
+    selected select assorted asst varieties variety various
+    each ea pack pkg pk size sizes ct count
+    fresh new regular original reg product products
+    lb lbs kg ml oz
+""".split())
+
+_word_re = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_multi_size_re = re.compile(r"(\d+)\s*[x×]\s*(\d+(?:\.\d+)?)\s*(kg|g|ml|l|lbs?|oz)\b")
+_size_re = re.compile(r"(\d+(?:\.\d+)?)\s*(kg|g|ml|l|lbs?|oz|ct|pk|pack|un|rolls?)\b")
+
+# unit -> (canonical unit, factor)
+_SIZE_UNITS = {
+    "g": ("g", 1), "kg": ("g", 1000), "lb": ("g", 453.6), "lbs": ("g", 453.6), "oz": ("g", 28.35),
+    "ml": ("ml", 1), "l": ("ml", 1000),
+    "ct": ("ct", 1), "pk": ("ct", 1), "pack": ("ct", 1), "un": ("ct", 1), "roll": ("ct", 1), "rolls": ("ct", 1),
+}
+
+
+def _fold(s: str) -> str:
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if not unicodedata.combining(c)).lower()
+
+
+def _canon_size(qty: float, unit: str) -> str:
+    base, factor = _SIZE_UNITS[unit]
+    # 2 significant digits, so 454 g (1 lb) and 450 g compare equal
+    q = float(f"{qty * factor:.2g}")
+    return f"{q:g}{base}"
+
+
+def parse_size(text: str) -> Tuple[Optional[str], str]:
+    """(canonical size or None, text with the size removed)."""
+    m = _multi_size_re.search(text)
+    if m:
+        return _canon_size(int(m.group(1)) * float(m.group(2)), m.group(3)), text[:m.start()] + " " + text[m.end():]
+    m = _size_re.search(text)
+    if m:
+        return _canon_size(float(m.group(1)), m.group(2)), text[:m.start()] + " " + text[m.end():]
+    return None, text
+
+
+def tokens(text: str) -> List[str]:
+    return [w for w in _word_re.findall(text) if w not in STOPWORDS and (len(w) > 1 or w.isdigit())]
+
+
+def match_key(title: str, brand: Optional[str] = None) -> Tuple[frozenset, Optional[str], frozenset]:
+    """(title + brand tokens, canonical size, brand tokens)."""
+    size, rest = parse_size(_fold(title or ""))
+    brand_toks = frozenset(tokens(_fold(brand))) if brand else frozenset()
+    return frozenset(tokens(rest)) | brand_toks, size, brand_toks
+
+
+def _effective_price(price: Dict[str, Any]) -> Optional[float]:
+    uv = price.get("unit_value")
+    return uv if uv is not None else price.get("value")
+
+
+# measure unit -> (common unit, how many of it in one common unit)
+_PER = {"g": ("kg", 1000.0), "kg": ("kg", 1.0), "lb": ("kg", 1 / 0.4536), "ml": ("l", 1000.0), "l": ("l", 1.0)}
+
+
+def unit_price(price: Dict[str, Any]) -> Optional[Tuple[float, str]]:
+    """
+    (price, per) on a scale comparable across flyers: a per-measure price
+    per "kg" or "l" ($3.99/lb -> 8.7963 per kg, $1.79/100 g -> 17.9 per kg),
+    anything else the effective price "ea". None without a price.
+    """
+    eff = _effective_price(price)
+    if eff is None:
+        return None
+    unit = price.get("unit") or "ea"
+    measure = unit.lstrip("0123456789.")
+    if measure in _PER and not price.get("multi_buy_qty"):
+        per, factor = _PER[measure]
+        qty = float(unit[:len(unit) - len(measure)] or 1)
+        return round(eff * factor / qty, 4), per
+    return eff, "ea"
+
+
+class _Rec:
+    __slots__ = ("retailer", "item_id", "flyer_id", "title", "toks", "size", "brand", "kind", "price")
+
+    def __init__(self, retailer, item_id, flyer_id, title, toks, size, brand, kind, price):
+        self.retailer = retailer
+        self.item_id = item_id
+        self.flyer_id = flyer_id
+        self.title = title
+        self.toks = toks
+        self.size = size
+        self.brand = brand
+        self.kind = kind
+        self.price = price
+
+
+class Matcher:
+    """Feed items with add(); groups() does the matching."""
+
+    def __init__(self, min_jaccard: float = MIN_JACCARD, strict_jaccard: float = STRICT_JACCARD, max_df: int = MAX_DF):
+        self.min_jaccard = min_jaccard
+        self.strict_jaccard = strict_jaccard
+        self.max_df = max_df
+        self._recs: List[_Rec] = []
+        self._df: Counter = Counter()
+        self.skipped = 0
+
+    def add(self, item: Dict[str, Any], retailer: Optional[str] = None) -> None:
+        price = item.get("price") or {}
+        compared = unit_price(price)
+        if compared is None:
+            self.skipped += 1  # promo-only / savings: nothing to compare
+            return
+        toks, size, brand = match_key(item.get("title") or "", item.get("brand"))
+        if not toks:
+            self.skipped += 1
+            return
+        self._df.update(toks)
+        self._recs.append(_Rec(
+            retailer or item.get("retailer") or "", item.get("source_item_id") or "", item.get("flyer_id") or "",
+            item.get("title") or "", toks, size, brand, compared[1],
+            (compared[0], price.get("value"), price.get("unit"), price.get("unit_value"), price.get("multi_buy_qty")),
+        ))
+
+    def add_all(self, items: Iterable[Dict[str, Any]], retailer: Optional[str] = None) -> None:
+        for it in items:
+            self.add(it, retailer)
+
+    def _accept(self, a: _Rec, b: _Rec) -> bool:
+        if a.kind != b.kind:
+            return False
+        if a.brand and b.brand and not (a.brand & b.brand):
+            return False
+        if a.size and b.size and a.size != b.size:
+            return False
+        inter = len(a.toks & b.toks)
+        jac = inter / (len(a.toks) + len(b.toks) - inter)
+        return jac >= (self.min_jaccard if a.size and b.size else self.strict_jaccard)
+
+    def _pairs(self) -> Iterable[Tuple[int, int]]:
+        df = self._df
+        t = self.min_jaccard
+        # token -> retailer -> item indexes; only other retailers are probed
+        index: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        recs = self._recs
+        for i, r in enumerate(recs):
+            # Prefix filtering: two sets with Jaccard >= t share one of each
+            # set's first |x| - ceil(t*|x|) + 1 rarest tokens.
+            ordered = sorted(r.toks, key=lambda w: (df[w], w))
+            prefix = ordered[:len(ordered) - math.ceil(t * len(ordered)) + 1]
+            seen = set()
+            for w in prefix:
+                if df[w] > self.max_df:
+                    continue
+                by_retailer = index[w]
+                for retailer, postings in by_retailer.items():
+                    if retailer == r.retailer:
+                        continue
+                    for j in postings:
+                        if j not in seen:
+                            seen.add(j)
+                            if self._accept(recs[j], r):
+                                yield j, i
+                by_retailer[r.retailer].append(i)
+
+    def groups(self) -> List[Dict[str, Any]]:
+        parent = list(range(len(self._recs)))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def union(a: int, b: int) -> None:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        # Exact keys first: no token is too common for these.
+        exact: Dict[Tuple[Any, ...], List[int]] = defaultdict(list)
+        for i, r in enumerate(self._recs):
+            exact[(r.toks, r.size, r.kind)].append(i)
+        for idx in exact.values():
+            if len({self._recs[i].retailer for i in idx}) > 1:
+                for i in idx[1:]:
+                    union(idx[0], i)
+
+        for a, b in self._pairs():
+            union(a, b)
+
+        members: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(self._recs)):
+            members[find(i)].append(i)
+
+        out = []
+        for idx in members.values():
+            if len(idx) < 2:
+                continue
+            out.append(self._group([self._recs[i] for i in idx]))
+        out.sort(key=lambda g: g["match_id"])
+        return out
+
+    def _group(self, recs: List[_Rec]) -> Dict[str, Any]:
+        recs.sort(key=lambda r: (r.price[0], r.retailer, r.item_id))
+        offers = [{
+            "retailer": r.retailer,
+            "source_item_id": r.item_id,
+            "flyer_id": r.flyer_id,
+            "title": r.title,
+            "value": r.price[1],
+            "unit": r.price[2],
+            "unit_value": r.price[3],
+            "multi_buy_qty": r.price[4],
+            "unit_price": r.price[0],
+        } for r in recs]
+        ids = sorted(f"{r.retailer}:{r.flyer_id}:{r.item_id}" for r in recs)
+        common = frozenset.intersection(*(r.toks for r in recs))
+        cheapest, dearest = recs[0].price[0], recs[-1].price[0]
+        return {
+            "match_id": hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()[:12],
+            "key": " ".join(sorted(common)),
+            "size": next((r.size for r in recs if r.size), None),
+            "price_kind": recs[0].kind,
+            "retailers": sorted({r.retailer for r in recs}),
+            "cheapest": offers[0],
+            "savings": round(dearest - cheapest, 2),
+            "offers": offers,
+        }
+
+
+def match_items(items: Iterable[Dict[str, Any]], **opts: Any) -> List[Dict[str, Any]]:
+    m = Matcher(**opts)
+    m.add_all(items)
+    return m.groups()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import normalize
+
+    ap = argparse.ArgumentParser(description="Match the same product across retailers in the merged deals file.")
+    ap.add_argument("--in", dest="in_path", type=Path, default=normalize.ALL_NORM)
+    ap.add_argument("--top", type=int, default=20, help="groups to print (biggest savings first)")
+    ap.add_argument("--min-jaccard", type=float, default=MIN_JACCARD)
+    ap.add_argument("--json", action="store_true", help="print the groups as JSON")
+    args = ap.parse_args(argv)
+
+    m = Matcher(min_jaccard=args.min_jaccard, strict_jaccard=max(args.min_jaccard, STRICT_JACCARD))
+    m.add_all(normalize._iter_json_array(args.in_path, ("items",)))
+    groups = m.groups()
+    groups.sort(key=lambda g: -g["savings"])
+    if args.json:
+        print(json.dumps(groups[:args.top], ensure_ascii=False, indent=2))
+        return 0
+    print(f"[match] {len(groups)} groups from {len(m._recs)} priced items ({m.skipped} skipped)")
+    for g in groups[:args.top]:
+        c, per = g["cheapest"], g["price_kind"]
+        others = ", ".join(f"{o['retailer']} {o['unit_price']}" for o in g["offers"][1:4])
+        if len(g["offers"]) > 4:
+            others += f", +{len(g['offers']) - 4} more"
+        print(f"  {g['key'][:50]:<50} {g['size'] or '':>7}  {c['retailer']} {c['unit_price']}/{per} (vs {others}; save {g['savings']}/{per})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Per-stage instrumentation shared by the collectors, normalize.py and
+drive_upload.py, written to out/run_manifest.json.
+
+    with run_manifest.stage("normalize") as st:
+        ...
+        st.add(items=n)
+        run_manifest.wrote(path)           # bytes written, to the current stage
+
+Each stage records wall time, CPU time (this process plus finished child
+processes; concurrent stages in one process share it), peak RSS (the
+process high-water mark when the stage ended), bytes downloaded / written,
+retries, item counts and ok/error, plus the size of every file written
+(`files`; merged across stages at the top level) and named durations
+within the stage (`timings`, e.g. the Drive upload's startup to first
+byte). The current stage is a context variable, so helpers deep in the call
+stack (save() functions, HTTP session hooks) add to whichever stage is
+running; outside any stage they are no-ops.
+
+A stage opened inside another one (normalize.matches inside normalize) is
+recorded with its `parent` and rolls its bytes and retries up into it;
+`totals` only sum top-level stages, so nothing is counted twice.
+
+Every finished stage is merged into the manifest right away, so the separate
+workflow steps (capture, normalize, upload) build one manifest per run
+(keyed by GITHUB_RUN_ID). Without GITHUB_RUN_ID every process starts its own
+manifest. With RUN_METRICS_PROM=<path> the same numbers are also written as a
+Prometheus textfile (node_exporter textfile collector).
+
+`python collectors/run_manifest.py` prints the manifest as a Markdown table.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MANIFEST_PATH = Path("out/run_manifest.json")
+PROM_ENV = "RUN_METRICS_PROM"
+
+COUNTERS = ("items", "retries", "bytes_in", "bytes_out")
+# Counters a nested stage adds to its parent; items count different things
+# per stage (normalize: items, normalize.matches: groups), so they stay put.
+ROLLUP = ("retries", "bytes_in", "bytes_out")
+
+_current: ContextVar[Optional["Stage"]] = ContextVar("run_manifest_stage", default=None)
+_write_lock = threading.Lock()
+# Outside GitHub Actions a run is one process.
+_LOCAL_RUN_ID = f"local-{os.getpid()}-{int(time.time())}"
+
+
+def _now_utc_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _cpu_s() -> float:
+    t = time.process_time()
+    if resource is not None:
+        ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+        t += ch.ru_utime + ch.ru_stime
+    return t
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Stage:
+    def __init__(self, name: str, parent: Optional["Stage"] = None):
+        self.name = name
+        self.parent = parent
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.files: Dict[str, int] = {}
+        self.timings: Dict[str, float] = {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._started_at = _now_utc_iso()
+        self._t0 = time.perf_counter()
+        self._c0 = _cpu_s()
+        self._result: Optional[Dict[str, Any]] = None
+
+    def add(self, **counts: int) -> None:
+        """Add to counters (items=, retries=, bytes_in=, bytes_out=); thread-safe."""
+        with self._lock:
+            for k, v in counts.items():
+                self.counts[k] = self.counts.get(k, 0) + int(v or 0)
+
+    def file(self, path: Path, size: int) -> None:
+        """Record the size of a file this stage wrote (last write wins)."""
+        with self._lock:
+            self.files[Path(path).name] = size
+
+    def timing(self, name: str, seconds: float) -> None:
+        """Record a named duration inside the stage (e.g. startup to first byte)."""
+        with self._lock:
+            self.timings[name] = round(seconds, 3)
+
+    def fail(self, error: Any) -> None:
+        self.status = "error"
+        self.error = str(error)[:500]
+
+    def finish(self) -> Dict[str, Any]:
+        if self._result is None:
+            self._result = {
+                "started_at": self._started_at,
+                "wall_s": round(time.perf_counter() - self._t0, 3),
+                "cpu_s": round(_cpu_s() - self._c0, 3),
+                "peak_rss_mb": _peak_rss_mb(),
+                **self.counts,
+                "status": self.status,
+                "error": self.error,
+            }
+            if self.parent is not None:
+                self._result["parent"] = self.parent.name
+            if self.files:
+                self._result["files"] = dict(sorted(self.files.items()))
+            if self.timings:
+                self._result["timings"] = dict(self.timings)
+        return self._result
+
+
+class _NoStage(Stage):
+    """Stand-in outside any stage: accepts everything, records nothing."""
+
+    def __init__(self):
+        super().__init__("")
+
+    def add(self, **counts: int) -> None:
+        pass
+
+    def file(self, path: Path, size: int) -> None:
+        pass
+
+    def timing(self, name: str, seconds: float) -> None:
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def current() -> Stage:
+    return _current.get() or _NO_STAGE
+
+
+def add(**counts: int) -> None:
+    current().add(**counts)
+
+
+def wrote(path: Path, items: Optional[int] = None) -> None:
+    """Count a file just written (its size; optionally its items) to the current stage."""
+    try:
+        size = Path(path).stat().st_size
+    except OSError:
+        size = 0
+    st = current()
+    st.add(bytes_out=size, items=items or 0)
+    st.file(path, size)
+
+
+def track_session(session) -> None:
+    """Count response bytes and urllib3 retries of a requests.Session to the current stage."""
+    st = current()
+
+    def hook(r, *args, **kwargs):
+        retries = getattr(getattr(r.raw, "retries", None), "history", None) or ()
+        st.add(bytes_in=len(r.content), retries=len(retries))
+
+    session.hooks["response"].append(hook)
+
+
+@contextmanager
+def stage(name: str, manifest: Path = MANIFEST_PATH) -> Iterator[Stage]:
+    st = Stage(name, _current.get())
+    token = _current.set(st)
+    try:
+        yield st
+    except BaseException as e:
+        st.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        record(st, manifest)
+        if st.parent is not None:
+            st.parent.add(**{k: st.counts[k] for k in ROLLUP})
+
+
+# ---------------------------------------------------------------------------
+# Manifest / Prometheus output
+# ---------------------------------------------------------------------------
+
+def _load(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def record(st: Stage, manifest: Path = MANIFEST_PATH) -> None:
+    result = st.finish()
+    run_id = os.environ.get("GITHUB_RUN_ID") or _LOCAL_RUN_ID
+    with _write_lock:
+        data = _load(manifest)
+        if data.get("run_id") != run_id:
+            data = {}  # a previous run's manifest
+        stages = data.get("stages") or {}
+        stages[st.name] = result
+        top = [s for s in stages.values() if not s.get("parent")]
+        data = {
+            "schema_version": 1,
+            "run_id": run_id,
+            "updated_at": _now_utc_iso(),
+            "totals": {
+                "wall_s": round(sum(s.get("wall_s") or 0 for s in top), 3),
+                **{k: sum(s.get(k) or 0 for s in top) for k in COUNTERS},
+                "failed_stages": sorted(n for n, s in stages.items() if s.get("status") != "ok"),
+            },
+            "stages": stages,
+            # file name -> bytes, across stages (publish bandwidth)
+            "files": dict(sorted({n: b for s in stages.values() for n, b in (s.get("files") or {}).items()}.items())),
+        }
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        prom = os.environ.get(PROM_ENV)
+        if prom:
+            write_prometheus(data, Path(prom))
+
+
+_PROM_METRICS = [
+    ("wall_s", "flyer_stage_wall_seconds", "gauge", "Wall-clock seconds of the stage", 1),
+    ("cpu_s", "flyer_stage_cpu_seconds", "gauge", "CPU seconds used during the stage", 1),
+    ("peak_rss_mb", "flyer_stage_peak_rss_bytes", "gauge", "Process peak RSS when the stage ended", 1024 * 1024),
+    ("bytes_in", "flyer_stage_downloaded_bytes", "gauge", "Bytes downloaded", 1),
+    ("bytes_out", "flyer_stage_written_bytes", "gauge", "Bytes written or uploaded", 1),
+    ("retries", "flyer_stage_retries", "gauge", "Retries", 1),
+    ("items", "flyer_stage_items", "gauge", "Items produced", 1),
+]
+
+
+def write_prometheus(data: Dict[str, Any], path: Path) -> None:
+    lines: List[str] = []
+    stages = data.get("stages") or {}
+    for key, metric, kind, help_text, scale in _PROM_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for name, s in sorted(stages.items()):
+            if s.get(key) is not None:
+                lines.append(f'{metric}{{stage="{name}"}} {s[key] * scale:g}')
+    lines += ["# HELP flyer_stage_ok 1 if the stage succeeded", "# TYPE flyer_stage_ok gauge"]
+    lines += [f'flyer_stage_ok{{stage="{n}"}} {int(s.get("status") == "ok")}' for n, s in sorted(stages.items())]
+
+    # textfile collectors read *.prom; write-then-rename so a scrape never sees half a file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    path = Path(argv[0]) if argv else MANIFEST_PATH
+    data = _load(path)
+    stages = data.get("stages") or {}
+    if not stages:
+        print(f"(no stages recorded in {path})")
+        return 0
+    print("| stage | status | wall s | cpu s | peak MB | items | retries | KiB in | KiB out |")
+    print("|---|---|---:|---:|---:|---:|---:|---:|---:|")
+    for name, s in sorted(stages.items(), key=lambda kv: kv[1].get("started_at") or ""):
+        print(
+            f"| {name} | {s.get('status')} | {s.get('wall_s', 0):.1f} | {s.get('cpu_s', 0):.1f} | "
+            f"{s.get('peak_rss_mb') or 0:.0f} | {s.get('items', 0)} | {s.get('retries', 0)} | "
+            f"{(s.get('bytes_in') or 0) / 1024:.0f} | {(s.get('bytes_out') or 0) / 1024:.0f} |"
+        )
+    files = data.get("files") or {}
+    if files:
+        print()
+        print("| file | KiB |")
+        print("|---|---:|")
+        for name, size in files.items():
+            print(f"| {name} | {size / 1024:.0f} |")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
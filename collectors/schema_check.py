@@ -0,0 +1,183 @@
+"""
+Schema checks on the normalized output (TASKS.md M0.6), run inside
+normalize.py's item loop instead of as a second pass over the written files:
+
+  document  every header has REQUIRED_KEYS plus its own keys (the per-retailer
+            documents "retailer", the merged one "sources"); `items` is a list
+            by construction (the writers emit it, and a raw feed whose items
+            are not a list already fails its adapter's shape check)
+  item      title, retailer, and price.value or promo_only
+
+Item checks run in the normalize workers, on the NormalizedItem before it is
+serialized: item_issues() is a fixed function of two attribute tests that
+returns a bit mask (0 = valid), so a valid item allocates nothing. The
+retailer is checked once per document, since the writers append it to every
+item. Rows that fail are not written to the normalize cache, so a cache hit
+is an item that passed.
+
+Report collects counts per retailer and check, plus the first SAMPLE_SIZE
+offending source_item_ids per check, into out/validation_report.json. With
+`max_invalid` set it raises as soon as more items than that (plus document
+errors) have failed, without normalizing the rest. `max_invalid_share` is the
+tolerant form for scheduled runs, where some flyer tiles are bound to carry no
+price: finish() fails on any document error, on zero items, or when more than
+that share of the items failed; per-item failures below it stay in the report.
+When normalize restores its outputs from the stage cache instead,
+enforce_saved() applies the same limits to the restored report.
+"""
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from item_model import NormalizedItem
+
+REPORT_PATH = Path("out") / "validation_report.json"
+
+REQUIRED_KEYS = ("schema_version", "captured_at", "flyers")
+RETAILER_KEYS = REQUIRED_KEYS + ("retailer",)
+MERGED_KEYS = REQUIRED_KEYS + ("sources",)
+
+MISSING_TITLE = 1
+MISSING_PRICE = 2  # neither price.value nor promo_only
+CHECKS: Tuple[Tuple[int, str], ...] = (
+    (MISSING_TITLE, "missing_title"),
+    (MISSING_PRICE, "missing_price"),
+)
+
+SAMPLE_SIZE = 20
+
+# (source_item_id, issue bits) of an item that failed
+Invalid = Tuple[str, int]
+
+
+def item_issues(item: NormalizedItem) -> int:
+    issues = 0
+    if not item.title:
+        issues |= MISSING_TITLE
+    if item.price.value is None and not item.promo_only:
+        issues |= MISSING_PRICE
+    return issues
+
+
+class ValidationError(RuntimeError):
+    pass
+
+
+def _fail(failures: int, max_invalid: int) -> None:
+    raise ValidationError(
+        f"schema validation: {failures} failures, more than --max-invalid {max_invalid} (see {REPORT_PATH})"
+    )
+
+
+def _check_share(max_share: Optional[float], items: int, invalid: int, document_errors: int) -> None:
+    if max_share is None:
+        return
+    if document_errors or not items:
+        raise ValidationError(
+            f"schema validation: {document_errors} document errors, {items} items (see {REPORT_PATH})"
+        )
+    if invalid > max_share * items:
+        raise ValidationError(
+            f"schema validation: {invalid} of {items} items failed, more than --max-invalid-share "
+            f"{max_share:g} (see {REPORT_PATH})"
+        )
+
+
+def enforce_saved(max_invalid: Optional[int], max_invalid_share: Optional[float] = None,
+                  path: Path = REPORT_PATH) -> None:
+    """Apply the limits to a report restored from the normalize cache (its items were not re-checked)."""
+    if max_invalid is None and max_invalid_share is None:
+        return
+    data = json.loads(path.read_text(encoding="utf-8"))
+    failures = data.get("failures", 0)
+    if max_invalid is not None and failures > max_invalid:
+        _fail(failures, max_invalid)
+    invalid = sum(r["invalid"] for r in (data.get("retailers") or {}).values())
+    _check_share(max_invalid_share, data.get("items", 0), invalid, failures - invalid)
+
+
+class Report:
+    def __init__(self, max_invalid: Optional[int] = None, max_invalid_share: Optional[float] = None):
+        self.max_invalid = max_invalid
+        self.max_invalid_share = max_invalid_share
+        self.retailers: Dict[str, Dict[str, Any]] = {}
+        self.documents: Dict[str, List[str]] = {}
+        self.failures = 0
+
+    def _retailer(self, name: str) -> Dict[str, Any]:
+        r = self.retailers.get(name)
+        if r is None:
+            r = self.retailers[name] = {
+                "items": 0,
+                "invalid": 0,
+                "checks": {check: 0 for _, check in CHECKS},
+                "samples": {check: [] for _, check in CHECKS},
+            }
+        return r
+
+    def add(self, retailer: str, items: int, invalid: Iterable[Invalid]) -> None:
+        """Count `items` checked rows of `retailer`, `invalid` among them."""
+        r = self._retailer(retailer)
+        r["items"] += items
+        for source_item_id, issues in invalid:
+            r["invalid"] += 1
+            self.failures += 1
+            for bit, check in CHECKS:
+                if issues & bit:
+                    r["checks"][check] += 1
+                    if len(r["samples"][check]) < SAMPLE_SIZE:
+                        r["samples"][check].append(source_item_id)
+        self._enforce()
+
+    def document(self, name: str, header: Dict[str, Any], required: Tuple[str, ...]) -> None:
+        """Check the header of the document written to `name`."""
+        errors = [f"missing {key}" for key in required if header.get(key) in (None, "")]
+        self.documents[name] = errors
+        self.failures += len(errors)
+        self._enforce()
+
+    def finish(self) -> None:
+        """Apply `max_invalid_share` once every item has been checked (after write())."""
+        invalid = sum(r["invalid"] for r in self.retailers.values())
+        items = sum(r["items"] for r in self.retailers.values())
+        _check_share(self.max_invalid_share, items, invalid, self.failures - invalid)
+
+    @property
+    def ok(self) -> bool:
+        return self.failures == 0
+
+    def _enforce(self) -> None:
+        if self.max_invalid is not None and self.failures > self.max_invalid:
+            self.write()
+            _fail(self.failures, self.max_invalid)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "ok": self.ok,
+            "max_invalid": self.max_invalid,
+            "max_invalid_share": self.max_invalid_share,
+            "items": sum(r["items"] for r in self.retailers.values()),
+            "failures": self.failures,
+            "retailers": self.retailers,
+            "documents": self.documents,
+        }
+
+    def write(self, path: Path = REPORT_PATH) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def summary(self) -> str:
+        failed: Dict[str, int] = {}
+        for r in self.retailers.values():
+            for check, n in r["checks"].items():
+                if n:
+                    failed[check] = failed.get(check, 0) + n
+        for name, errors in self.documents.items():
+            for e in errors:
+                failed[f"{name} {e}"] = 1
+        items = sum(r["items"] for r in self.retailers.values())
+        detail = f" ({', '.join(f'{k}: {n}' for k, n in failed.items())})" if failed else ""
+        return f"{items} items, {self.failures} failed{detail}"
@@ -1,56 +1,115 @@
 import json
 import re
 from pathlib import Path
+
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeoutError
 
-STORE_URL = "https://www.sobeys.com/flyer?set_preferred_store_number=0849"
+import base_url
+import browser_profile
+import feed_url_cache
+import http_cache
+import lean_capture
+import run_manifest
+
+STORE_URL = base_url.rebase("https://www.sobeys.com/flyer?set_preferred_store_number=0849")
 OUT_PATH = Path("out/sobeys_products.json")
 DEBUG_SHOT = Path("out/debug_sobeys.png")
 
 PRODUCTS_RE = re.compile(r"dam\.flippenterprise\.net/.*/products\?.*display_type=all")
 
-def capture_once() -> list:
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        ctx = browser.new_context()
-        page = ctx.new_page()
+UA = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+)
 
-        page.set_default_navigation_timeout(120_000)
-        page.set_default_timeout(120_000)
+def fetch_json(products_url: str):
+    """Fetch a known products URL directly (no browser)."""
+    headers = {
+        "User-Agent": UA,
+        "Accept": "application/json,text/plain,*/*",
+        "Accept-Language": "en-CA,en;q=0.9",
+        "Referer": STORE_URL,
+    }
+    r = http_cache.get(products_url, headers=headers, timeout=60)
+    return feed_url_cache.parse_feed_response(r)
 
-        try:
-            # Wait for the specific JSON response we care about
-            with page.expect_response(lambda r: bool(PRODUCTS_RE.search(r.url)), timeout=120_000) as resp_info:
-                page.goto(STORE_URL, wait_until="domcontentloaded")
+def capture_once(ctx, lean: bool = False, warm: bool = False) -> tuple:
+    """
+    Load the flyer page in a fresh page of `ctx` and return (products_url,
+    data) from the feed response. Only the page is thrown away afterwards.
+    """
+    page = ctx.new_page()
+    page.set_default_navigation_timeout(120_000)
+    page.set_default_timeout(120_000)
 
-            resp = resp_info.value
-            data = resp.json()
-            return data
+    stats = lean_capture.CaptureStats("sobeys", lean, warm)
+    lean_capture.install(page, stats)
 
+    try:
+        # Wait for the specific JSON response we care about
+        stats.start()
+        with page.expect_response(lambda r: bool(PRODUCTS_RE.search(r.url)), timeout=120_000) as resp_info:
+            page.goto(STORE_URL, wait_until="domcontentloaded")
+
+        resp = resp_info.value
+        stats.feed_seen()
+        data = resp.json()
+        return resp.url, data
+
+    except Exception:
+        OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            page.screenshot(path=str(DEBUG_SHOT), full_page=True)
         except Exception:
-            OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-            try:
-                page.screenshot(path=str(DEBUG_SHOT), full_page=True)
-            except Exception:
-                pass
-            raise
+            pass
+        raise
 
-        finally:
-            browser.close()
+    finally:
+        page.close()
+        lean_capture.write_stats(stats)
+
+def save(data) -> None:
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    OUT_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    run_manifest.wrote(OUT_PATH, items=len(data) if isinstance(data, list) else None)
+    print(f"[sobeys] saved -> {OUT_PATH}")
 
 def main():
+    with run_manifest.stage("capture.sobeys"):
+        _main()
+
+def _main():
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+    data = feed_url_cache.fetch_cached("sobeys", fetch_json)
+    if data is not None:
+        save(data)
+        return
+
     last_err = None
-    for attempt in range(1, 3):  # simple retry
+    warm = browser_profile.is_warm("sobeys")
+    with sync_playwright() as p:
+        # One browser and (warm) context for all attempts; each retry only gets a new page.
+        browser = p.chromium.launch(**browser_profile.BROWSER_OPTIONS)
+        ctx = browser_profile.new_context(browser, "sobeys")
         try:
-            data = capture_once()
-            OUT_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"[sobeys] saved -> {OUT_PATH}")
-            return
-        except Exception as e:
-            last_err = e
-            print(f"[sobeys] attempt {attempt} failed: {e}")
+            for attempt in range(1, 3):  # simple retry
+                try:
+                    # Lean mode on the first attempt only; retry with the full page
+                    # in case blocking cut off something the feed depends on.
+                    url, data = capture_once(ctx, lean=lean_capture.enabled() and attempt == 1,
+                                             warm=warm or attempt > 1)
+                    http_cache.mark_changed("sobeys:browser")
+                    feed_url_cache.put("sobeys", url)
+                    save(data)
+                    return
+                except Exception as e:
+                    last_err = e
+                    run_manifest.add(retries=1)
+                    print(f"[sobeys] attempt {attempt} failed: {e}")
+        finally:
+            browser_profile.save_state(ctx, "sobeys")
+            browser.close()
 
     raise RuntimeError(f"[sobeys] failed after retries: {last_err}")
 
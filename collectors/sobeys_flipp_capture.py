@@ -0,0 +1,92 @@
+"""
+Browserless Sobeys capture via Flipp.
+
+Resolves Sobeys' current flyer(s) near POSTAL_CODE through items/search,
+pulls every item of each flyer over plain HTTP and writes them to
+out/sobeys_products.json in the shape normalize_sobeys expects (the same
+field names as the dam.flippenterprise.net products feed).
+
+sobeys_capture.py (Playwright) stays as the fallback when this fails.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+import flipp
+import run_manifest
+
+POSTAL_CODE = os.environ.get("SOBEYS_POSTAL_CODE", "E3C0B8")
+MERCHANT = "Sobeys"
+
+OUT_PATH = Path("out/sobeys_products.json")
+
+
+def to_sobeys_item(it: Dict[str, Any], flyer: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a Flipp flyer item onto the products-feed field names."""
+    return {
+        "id": it.get("id") or it.get("flyer_item_id"),
+        "flyer_id": it.get("flyer_id") or flyer.get("flyer_id"),
+        "name": it.get("name"),
+        "brand": it.get("brand"),
+        "description": it.get("description"),
+        "pre_price_text": it.get("pre_price_text"),
+        "price_text": it.get("price_text") if it.get("price_text") is not None else it.get("price", it.get("current_price")),
+        "post_price_text": it.get("post_price_text"),
+        "original_price": it.get("original_price"),
+        "sale_story": it.get("sale_story"),
+        "valid_from": it.get("valid_from") or flyer.get("valid_from"),
+        "valid_to": it.get("valid_to") or flyer.get("valid_to"),
+        "item_categories": it.get("item_categories") or {},
+        "image_url": flipp.first_image(it),
+        "page": it.get("page"),
+    }
+
+
+def capture() -> List[Dict[str, Any]]:
+    session = flipp.new_session()
+    _, search = flipp.search_items(session, POSTAL_CODE, MERCHANT.lower())
+    flyers = flipp.merchant_flyers(search, MERCHANT)
+    if not flyers:
+        raise RuntimeError(f"No current {MERCHANT} flyer found near {POSTAL_CODE}")
+
+    items: List[Dict[str, Any]] = []
+    for flyer in flyers:
+        for it in flipp.flyer_items(session, flyer["flyer_id"]):
+            if not it.get("name"):
+                continue  # banners / non-product tiles
+            items.append(to_sobeys_item(it, flyer))
+
+    if not items:
+        raise RuntimeError(f"{MERCHANT} flyer(s) {[f['flyer_id'] for f in flyers]} returned no items")
+    return items
+
+
+def save(items: List[Dict[str, Any]]) -> None:
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    OUT_PATH.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+    run_manifest.wrote(OUT_PATH, items=len(items))
+    print(f"[sobeys/flipp] saved -> {OUT_PATH} ({len(items)} items)")
+
+
+def main():
+    with run_manifest.stage("capture.sobeys_flipp"):
+        _main()
+
+
+def _main():
+    last_err = None
+    for attempt in range(1, 3):
+        try:
+            save(capture())
+            return
+        except Exception as e:
+            last_err = e
+            run_manifest.add(retries=1)
+            print(f"[sobeys/flipp] attempt {attempt} failed: {e}")
+
+    raise RuntimeError(f"[sobeys/flipp] failed after retries: {last_err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,16 @@ import json
 import re
 from pathlib import Path
 
-import requests
 from playwright.sync_api import sync_playwright
 
-STORE_URL = "https://www.walmart.ca/en/flyer?flyer_type=walmartcanada&store_code=3032"
+import base_url
+import browser_profile
+import feed_url_cache
+import http_cache
+import lean_capture
+import run_manifest
+
+STORE_URL = base_url.rebase("https://www.walmart.ca/en/flyer?flyer_type=walmartcanada&store_code=3032")
 OUT_PATH = Path("out/walmart_products.json")
 DEBUG_SHOT = Path("out/debug_walmart.png")
 DEBUG_TXT = Path("out/debug_walmart_response.txt")
@@ -17,50 +23,66 @@ UA = (
     "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
 )
 
-def find_products_url() -> str:
-    """Use Playwright only to observe the products feed request URL."""
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        ctx = browser.new_context(
-            user_agent=UA,
-            locale="en-CA",
-            extra_http_headers={"Accept-Language": "en-CA,en;q=0.9"},
-            viewport={"width": 1280, "height": 720},
-        )
-        page = ctx.new_page()
-        page.set_default_timeout(120_000)
-        page.set_default_navigation_timeout(120_000)
+def _wait_for_feed(page, seen: dict, ms: int) -> None:
+    """Wait up to `ms` for the feed request, returning as soon as it is seen."""
+    for _ in range(0, ms, 250):
+        if seen["url"]:
+            return
+        page.wait_for_timeout(250)
+
+# Context options for the browser context (see browser_profile.new_context)
+CONTEXT_OPTIONS = dict(
+    user_agent=UA,
+    locale="en-CA",
+    extra_http_headers={"Accept-Language": "en-CA,en;q=0.9"},
+    viewport={"width": 1280, "height": 720},
+)
 
-        seen = {"url": None}
+def find_products_url(ctx, lean: bool = False, warm: bool = False) -> str:
+    """Use Playwright only to observe the products feed request URL (one fresh page of `ctx`)."""
+    page = ctx.new_page()
+    page.set_default_timeout(120_000)
+    page.set_default_navigation_timeout(120_000)
 
-        def on_request(req):
-            if PRODUCTS_RE.search(req.url):
-                seen["url"] = req.url
+    seen = {"url": None}
+    stats = lean_capture.CaptureStats("walmart", lean, warm)
+    lean_capture.install(page, stats)
 
-        page.on("request", on_request)
+    def on_request(req):
+        if PRODUCTS_RE.search(req.url):
+            seen["url"] = req.url
+            stats.feed_seen()
 
-        try:
-            page.goto(STORE_URL, wait_until="domcontentloaded")
+    page.on("request", on_request)
 
-            # Give it a moment to fire XHRs
-            page.wait_for_timeout(5000)
+    ok = False
+    try:
+        stats.start()
+        page.goto(STORE_URL, wait_until="domcontentloaded")
 
-            # If it didn’t fire yet, a tiny scroll often triggers the feed
-            if not seen["url"]:
-                page.mouse.wheel(0, 2000)
-                page.wait_for_timeout(4000)
+        # Give it a moment to fire XHRs
+        _wait_for_feed(page, seen, 5000)
 
-            if not seen["url"]:
-                raise RuntimeError("Did not observe Walmart products feed request URL.")
-            return seen["url"]
+        # If it didn’t fire yet, a tiny scroll often triggers the feed
+        if not seen["url"]:
+            page.mouse.wheel(0, 2000)
+            _wait_for_feed(page, seen, 4000)
 
-        finally:
+        if not seen["url"]:
+            raise RuntimeError("Did not observe Walmart products feed request URL.")
+        ok = True
+        return seen["url"]
+
+    finally:
+        # Lean mode only pays for a full-page screenshot when something broke
+        if not (lean and ok):
             OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
             try:
                 page.screenshot(path=str(DEBUG_SHOT), full_page=True)
             except Exception:
                 pass
-            browser.close()
+        page.close()
+        lean_capture.write_stats(stats)
 
 def fetch_json(products_url: str):
     """Fetch the observed URL with browser-like headers."""
@@ -72,7 +94,7 @@ def fetch_json(products_url: str):
         "Origin": "https://www.walmart.ca",
     }
 
-    r = requests.get(products_url, headers=headers, timeout=60)
+    r = http_cache.get(products_url, headers=headers, timeout=60)
 
     # Save debug info either way
     DEBUG_TXT.write_text(
@@ -82,29 +104,51 @@ def fetch_json(products_url: str):
         encoding="utf-8",
     )
 
-    r.raise_for_status()
+    # 4xx / non-JSON raise StaleFeedUrl (see debug_walmart_response.txt)
+    return feed_url_cache.parse_feed_response(r)
 
-    # Some endpoints return JSON even with odd content-type
-    text = r.text.lstrip()
-    if text.startswith("{") or text.startswith("["):
-        return r.json()
-
-    raise RuntimeError("Response did not look like JSON (see debug_walmart_response.txt).")
+def save(data) -> None:
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    OUT_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    run_manifest.wrote(OUT_PATH)
+    print(f"[walmart] saved -> {OUT_PATH}")
 
 def main():
+    with run_manifest.stage("capture.walmart_browser"):
+        _main()
+
+def _main():
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+    data = feed_url_cache.fetch_cached("walmart", fetch_json)
+    if data is not None:
+        save(data)
+        return
+
     last_err = None
-    for attempt in range(1, 4):
+    warm = browser_profile.is_warm("walmart")
+    with sync_playwright() as p:
+        # One browser and (warm) context for all attempts; each retry only gets a new page.
+        browser = p.chromium.launch(**browser_profile.BROWSER_OPTIONS)
+        ctx = browser_profile.new_context(browser, "walmart", **CONTEXT_OPTIONS)
         try:
-            url = find_products_url()
-            data = fetch_json(url)
-            OUT_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"[walmart] saved -> {OUT_PATH}")
-            return
-        except Exception as e:
-            last_err = e
-            print(f"[walmart] attempt {attempt} failed: {e}")
+            for attempt in range(1, 4):
+                try:
+                    # Lean mode on the first attempt only; retry with the full page
+                    # in case blocking cut off something the feed depends on.
+                    url = find_products_url(ctx, lean=lean_capture.enabled() and attempt == 1,
+                                            warm=warm or attempt > 1)
+                    data = fetch_json(url)
+                    feed_url_cache.put("walmart", url)
+                    save(data)
+                    return
+                except Exception as e:
+                    last_err = e
+                    run_manifest.add(retries=1)
+                    print(f"[walmart] attempt {attempt} failed: {e}")
+        finally:
+            browser_profile.save_state(ctx, "walmart")
+            browser.close()
 
     raise RuntimeError(f"[walmart] failed after retries: {last_err}")
 
@@ -0,0 +1,450 @@
+"""
+Planning bundle (out/planning_bundle.json): the full deal pool reduced to a
+small, LLM-safe set of anchors, price candidates and ingredient IDs.
+
+One streamed pass over deals_all.normalized.json:
+  - usable items: priced, not promo-only, not banned (prefs.json), and not in
+    a non-food category (category names are classified once, then memoized)
+  - category index: usable item counts per l1 / l2 category
+  - keyword index: title + brand tokens (accent-folded, crude plural
+    stemming) -> the anchors whose keyword phrases they complete
+  - per anchor and price kind, a bounded max-heap of its K cheapest
+    candidates, one per ingredient and retailer. Prices are compared on
+    product_match.unit_price(): per kg, per l, or per item ("ea"), so a
+    $3.99/lb and a $1.79/100 g offer rank on the same scale and neither
+    competes with a price per item; an anchor's candidates interleave its
+    kinds by rank (every kind's cheapest first)
+
+Anchors are the built-in ANCHORS (cheap proteins, produce, staples) plus
+one per line of cravings.txt. Ingredient IDs are `<anchor>-<hash>`, the hash
+taken over the product's match key (tokens + canonical size, see
+product_match.py), so the same product keeps its ID across weeks and stores.
+
+The bundle is written as compact JSON and must fit --max-bytes (and
+--max-tokens, estimated at BYTES_PER_TOKEN): when it doesn't, the most
+expensive (lowest-ranked) candidates are dropped first, then the lowest-priority anchors,
+then category rows. Bundle size and build time are logged and recorded in
+out/run_manifest.json.
+
+prefs.json (optional):
+  {"banned_ingredients": ["peanut", "pork"], "k": 5, "max_bytes": 32000}
+
+Usage:
+  python planner/build_bundle.py
+  python planner/build_bundle.py --k 8 --max-tokens 6000 --cravings cravings.txt
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "collectors"))
+
+import product_match  # noqa: E402
+import run_manifest  # noqa: E402
+from normalize import ALL_NORM, OUT_DIR, _iter_json_array  # noqa: E402
+
+BUNDLE_PATH = OUT_DIR / "planning_bundle.json"
+PREFS_PATH = Path("prefs.json")
+CRAVINGS_PATH = Path("cravings.txt")
+
+BUNDLE_VERSION = 2
+
+DEFAULT_K = 5
+DEFAULT_MAX_BYTES = 32_000
+# Rough JSON-to-token ratio for budgeting; real tokenizers vary.
+BYTES_PER_TOKEN = 4
+TOP_CATEGORIES = 25
+
+# anchor -> (group, keyword phrases); earlier groups win when trimming to budget
+ANCHORS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "chicken": ("protein", ("chicken",)),
+    "beef": ("protein", ("beef", "steak")),
+    "pork": ("protein", ("pork", "ham", "bacon")),
+    "turkey": ("protein", ("turkey",)),
+    "fish": ("protein", ("salmon", "tilapia", "cod", "haddock", "tuna", "fish", "shrimp")),
+    "eggs": ("protein", ("egg",)),
+    "tofu": ("protein", ("tofu",)),
+    "beans": ("protein", ("bean", "lentil", "chickpea")),
+    "potatoes": ("produce", ("potato",)),
+    "onions": ("produce", ("onion",)),
+    "carrots": ("produce", ("carrot",)),
+    "broccoli": ("produce", ("broccoli",)),
+    "peppers": ("produce", ("pepper",)),
+    "tomatoes": ("produce", ("tomato",)),
+    "leafy_greens": ("produce", ("lettuce", "spinach", "kale", "salad")),
+    "cucumbers": ("produce", ("cucumber",)),
+    "apples": ("produce", ("apple",)),
+    "bananas": ("produce", ("banana",)),
+    "berries": ("produce", ("strawberry", "blueberry", "raspberry")),
+    "rice": ("staple", ("rice",)),
+    "pasta": ("staple", ("pasta", "spaghetti", "penne", "macaroni", "noodle")),
+    "bread": ("staple", ("bread", "bun", "tortilla", "bagel")),
+    "milk": ("staple", ("milk",)),
+    "cheese": ("staple", ("cheese", "cheddar", "mozzarella")),
+    "yogurt": ("staple", ("yogurt",)),
+    "butter": ("staple", ("butter",)),
+    "flour": ("staple", ("flour",)),
+    "oats": ("staple", ("oat", "oatmeal")),
+    "tomato_sauce": ("staple", ("pasta sauce", "tomato sauce", "crushed tomato")),
+}
+GROUP_ORDER = ("craving", "protein", "produce", "staple")
+
+# Category-name phrases that mark a category as non-food, matched on whole
+# (stemmed) words: "pet" is not "Appetizers", and the bare "baby", "home" and
+# "health" would catch "Baby Spinach", "Home Baking" and "Health Foods".
+NON_FOOD = (
+    "household", "cleaning", "laundry", "paper", "health beauty", "health wellness", "health care",
+    "beauty", "personal care", "pharmacy", "baby care", "baby supplies", "baby essentials", "diaper", "pet", "home decor",
+    "home good", "home garden", "home improvement", "housewares", "kitchenware", "electronics",
+    "clothing", "apparel", "toys", "lawn garden", "garden centre", "automotive", "office", "seasonal decor",
+)
+
+
+def _stem(w: str) -> str:
+    """Crude plural folding: berries -> berry, potatoes -> potato, apples -> apple."""
+    if w.endswith("ss") or len(w) <= 3:
+        return w
+    if w.endswith("ies"):
+        return w[:-3] + "y"
+    if w.endswith("oes"):
+        return w[:-2]
+    if w.endswith("s"):
+        return w[:-1]
+    return w
+
+
+def _words(text: str) -> List[str]:
+    return [_stem(w) for w in product_match.tokens(product_match._fold(text))]
+
+
+class Anchor:
+    __slots__ = ("anchor_id", "group", "phrases", "label")
+
+    def __init__(self, anchor_id: str, group: str, phrases: Iterable[str], label: Optional[str] = None):
+        self.anchor_id = anchor_id
+        self.group = group
+        self.phrases = [frozenset(_words(p)) for p in phrases if _words(p)]
+        self.label = label or anchor_id
+
+
+def load_anchors(cravings: Optional[Path] = None) -> List[Anchor]:
+    """Cravings first (one anchor per non-empty, non-# line), then ANCHORS by group."""
+    out: List[Anchor] = []
+    if cravings is not None and cravings.exists():
+        for line in cravings.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            slug = "_".join(_words(line))[:40]
+            if slug:
+                out.append(Anchor(f"craving_{slug}", "craving", [line], label=line))
+    for group in GROUP_ORDER[1:]:
+        out.extend(Anchor(a, g, phrases) for a, (g, phrases) in ANCHORS.items() if g == group)
+    return [a for a in out if a.phrases]
+
+
+class KeywordIndex:
+    """token -> [(anchor, phrase)]; each phrase is indexed under one of its tokens."""
+
+    def __init__(self, anchors: List[Anchor]):
+        self._index: Dict[str, List[Tuple[Anchor, frozenset]]] = {}
+        for a in anchors:
+            for phrase in a.phrases:
+                self._index.setdefault(min(phrase), []).append((a, phrase))
+
+    def anchors_for(self, toks: frozenset) -> List[Anchor]:
+        hits: List[Anchor] = []
+        for w in toks:
+            for a, phrase in self._index.get(w, ()):
+                if a not in hits and phrase <= toks:
+                    hits.append(a)
+        return hits
+
+
+def _has_run(words: List[str], phrase: Tuple[str, ...]) -> bool:
+    n = len(phrase)
+    return any(tuple(words[i:i + n]) == phrase for i in range(len(words) - n + 1))
+
+
+class CategoryIndex:
+    """Usable item counts per (l1, l2), and a memoized food / non-food verdict per name."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self._food: Dict[str, bool] = {}
+        self._non_food = [tuple(_words(p)) for p in NON_FOOD]
+
+    def is_food(self, name: Optional[str]) -> bool:
+        if not name:
+            return True
+        v = self._food.get(name)
+        if v is None:
+            words = _words(name)
+            v = self._food[name] = not any(_has_run(words, nf) for nf in self._non_food)
+        return v
+
+    def names(self, item: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        cats = item.get("categories") or {}
+        return (cats.get("l1") or {}).get("name"), (cats.get("l2") or {}).get("name")
+
+    def rows(self, limit: int) -> List[Dict[str, Any]]:
+        return [{"l1": l1, "l2": l2, "items": n} for (l1, l2), n in self.counts.most_common(limit)]
+
+
+class TopK:
+    """The k cheapest candidates, one per key, as a bounded max-heap."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[float, Tuple[str, str], Dict[str, Any]]] = []
+        self._best: Dict[Tuple[str, str], float] = {}
+
+    def push(self, price: float, key: Tuple[str, str], cand: Dict[str, Any]) -> None:
+        old = self._best.get(key)
+        if old is not None:
+            if price >= old:
+                return
+            # rare (same product, cheaper in another flyer): k is small
+            self._heap = [e for e in self._heap if e[1] != key]
+            heapq.heapify(self._heap)
+        elif len(self._heap) >= self.k and -self._heap[0][0] <= price:
+            return
+        heapq.heappush(self._heap, (-price, key, cand))
+        self._best[key] = price
+        if len(self._heap) > self.k:
+            _, dropped, _ = heapq.heappop(self._heap)
+            del self._best[dropped]
+
+    def sorted(self) -> List[Dict[str, Any]]:
+        return [c for _, _, c in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
+
+
+def ingredient_id(anchor: Anchor, toks: frozenset, size: Optional[str]) -> str:
+    key = " ".join(sorted(toks)) + "|" + (size or "")
+    return f"{anchor.anchor_id}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:6]}"
+
+
+def load_prefs(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    prefs = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(prefs, dict):
+        raise SystemExit(f"{path}: expected a JSON object")
+    return prefs
+
+
+class BundleBuilder:
+    def __init__(self, anchors: List[Anchor], k: int = DEFAULT_K, banned: Iterable[str] = ()):
+        self.anchors = anchors
+        self.keywords = KeywordIndex(anchors)
+        self.categories = CategoryIndex()
+        self.banned = [frozenset(_words(b)) for b in banned if _words(b)]
+        self.k = k
+        # anchor -> price kind ("kg" / "l" / "ea") -> its k cheapest
+        self.top: Dict[str, Dict[str, TopK]] = {a.anchor_id: {} for a in anchors}
+        self.names: Dict[str, Tuple[str, Optional[str]]] = {}  # ingredient id -> (title, size)
+        self.counts: Counter = Counter()
+
+    def add(self, item: Dict[str, Any]) -> None:
+        self.counts["items"] += 1
+        price = item.get("price") or {}
+        compared = product_match.unit_price(price)
+        if compared is None or item.get("promo_only"):
+            return
+        l1, l2 = self.categories.names(item)
+        if not (self.categories.is_food(l1) and self.categories.is_food(l2)):
+            return
+        title = item.get("title") or ""
+        size, rest = product_match.parse_size(product_match._fold(title))
+        toks = frozenset(_words(rest))
+        if item.get("brand"):
+            toks |= frozenset(_words(item["brand"]))
+        if not toks or any(b <= toks for b in self.banned):
+            return
+        self.counts["usable"] += 1
+        self.categories.counts[(l1, l2)] += 1
+
+        hits = self.keywords.anchors_for(toks)
+        if not hits:
+            return
+        self.counts["anchored"] += 1
+        retailer = item.get("retailer") or ""
+        unit_price, per = compared
+        for a in hits:
+            ing = ingredient_id(a, toks, size)
+            top = self.top[a.anchor_id].get(per)
+            if top is None:
+                top = self.top[a.anchor_id][per] = TopK(self.k)
+            top.push(unit_price, (ing, retailer), {
+                "id": ing,
+                "retailer": retailer,
+                "value": price.get("value"),
+                "unit": price.get("unit"),
+                "unit_value": price.get("unit_value"),
+                "multi_buy_qty": price.get("multi_buy_qty"),
+                "unit_price": unit_price,
+                "per": per,
+                "valid_to": item.get("valid_to"),
+                "ref": f"{item.get('flyer_id') or ''}:{item.get('source_item_id') or ''}",
+            })
+            prev = self.names.get(ing)
+            if prev is None or len(title) < len(prev[0]):
+                self.names[ing] = (title, size)
+
+    def add_all(self, items: Iterable[Dict[str, Any]]) -> None:
+        for it in items:
+            self.add(it)
+
+    def candidates(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Per anchor, its kinds' candidates interleaved by rank (cheapest of each kind first)."""
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        for aid, kinds in self.top.items():
+            ranked = [kinds[per].sorted() for per in sorted(kinds)]
+            out[aid] = [c for rank in range(self.k) for cands in ranked if rank < len(cands) for c in (cands[rank],)]
+        return out
+
+
+def _doc(anchors: List[Anchor], cands: Dict[str, List[Dict[str, Any]]], names: Dict[str, Tuple[str, Optional[str]]],
+         categories: List[Dict[str, Any]], header: Dict[str, Any]) -> Dict[str, Any]:
+    used = [a for a in anchors if cands.get(a.anchor_id)]
+    catalog = {}
+    for a in used:
+        for c in cands[a.anchor_id]:
+            title, size = names[c["id"]]
+            catalog[c["id"]] = {"name": title, "anchor": a.anchor_id, "size": size}
+    return {
+        **header,
+        "anchors": [{"id": a.anchor_id, "group": a.group, "label": a.label, "candidates": cands[a.anchor_id]}
+                    for a in used],
+        "ingredients": dict(sorted(catalog.items())),
+        "categories": categories,
+    }
+
+
+def _dumps(doc: Dict[str, Any]) -> bytes:
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fit_budget(anchors: List[Anchor], cands: Dict[str, List[Dict[str, Any]]], names, categories: List[Dict[str, Any]],
+               header: Dict[str, Any], max_bytes: int) -> Tuple[bytes, Dict[str, int]]:
+    """
+    Smallest cut of the bundle that fits max_bytes: drop the lowest-ranked
+    candidate of the anchor with the most, down to one each; then whole anchors,
+    lowest priority first; then category rows. Raises SystemExit if even the
+    empty bundle is too big.
+    """
+    cands = {aid: list(c) for aid, c in cands.items()}
+    anchors = [a for a in anchors if cands.get(a.anchor_id)]
+    categories = list(categories)
+    trimmed = Counter()
+    while True:
+        data = _dumps(_doc(anchors, cands, names, categories, header))
+        if len(data) <= max_bytes:
+            return data, dict(trimmed)
+        widest = max(anchors, key=lambda a: (len(cands[a.anchor_id]), anchors.index(a)), default=None)
+        if widest is not None and len(cands[widest.anchor_id]) > 1:
+            cands[widest.anchor_id].pop()
+            trimmed["candidates"] += 1
+        elif anchors:
+            anchors.pop()
+            trimmed["anchors"] += 1
+        elif categories:
+            categories.pop()
+            trimmed["categories"] += 1
+        else:
+            raise SystemExit(f"[bundle] even an empty bundle is {len(data)} bytes (> {max_bytes})")
+
+
+def new_builder(prefs_path: Path = PREFS_PATH, cravings: Optional[Path] = CRAVINGS_PATH,
+                k: Optional[int] = None) -> Tuple[BundleBuilder, Dict[str, Any]]:
+    """(builder, prefs) for prefs.json / cravings.txt; feed it items, then write_bundle()."""
+    prefs = load_prefs(prefs_path)
+    k = k or int(prefs.get("k") or DEFAULT_K)
+    builder = BundleBuilder(load_anchors(cravings), k=max(1, k), banned=prefs.get("banned_ingredients") or ())
+    return builder, prefs
+
+
+def build_bundle(in_path: Path = ALL_NORM, out_path: Path = BUNDLE_PATH, prefs_path: Path = PREFS_PATH,
+                 cravings: Optional[Path] = CRAVINGS_PATH, k: Optional[int] = None,
+                 max_bytes: Optional[int] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    builder, prefs = new_builder(prefs_path, cravings, k)
+    meta: Dict[str, Any] = {}
+    builder.add_all(_iter_json_array(in_path, ("items",), meta))
+    return write_bundle(builder, prefs, {"file": in_path.name, "captured_at": meta.get("captured_at")},
+                        out_path, max_bytes, max_tokens, t0)
+
+
+def write_bundle(builder: BundleBuilder, prefs: Dict[str, Any], source: Dict[str, Any],
+                 out_path: Path = BUNDLE_PATH, max_bytes: Optional[int] = None, max_tokens: Optional[int] = None,
+                 t0: Optional[float] = None) -> Dict[str, Any]:
+    """Fit what `builder` collected to the budget and write it; returns the logged stats."""
+    t0 = time.perf_counter() if t0 is None else t0
+    budget = max_bytes or int(prefs.get("max_bytes") or DEFAULT_MAX_BYTES)
+    if max_tokens:
+        budget = min(budget, max_tokens * BYTES_PER_TOKEN)
+
+    anchors = builder.anchors
+    header = {
+        "bundle_version": BUNDLE_VERSION,
+        "source": source,
+        "counts": {"items": builder.counts["items"], "usable": builder.counts["usable"],
+                   "anchored": builder.counts["anchored"]},
+        "price_note": "candidates are ranked cheapest first within each price kind by unit_price, "
+                      "per kg, l or item (`per`); kinds alternate by rank",
+    }
+    data, trimmed = fit_budget(anchors, builder.candidates(), builder.names,
+                               builder.categories.rows(TOP_CATEGORIES), header, budget)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(data)
+
+    doc = json.loads(data)
+    stats = {
+        "bytes": len(data),
+        "approx_tokens": math.ceil(len(data) / BYTES_PER_TOKEN),
+        "budget_bytes": budget,
+        "anchors": len(doc["anchors"]),
+        "ingredients": len(doc["ingredients"]),
+        "trimmed": trimmed,
+        "build_s": round(time.perf_counter() - t0, 3),
+        **header["counts"],
+    }
+    print(f"[bundle] {stats['items']} items -> {stats['usable']} usable, {stats['anchored']} on an anchor")
+    print(f"[bundle] wrote {out_path} ({stats['bytes']} bytes, ~{stats['approx_tokens']} tokens, "
+          f"budget {budget}; {stats['anchors']} anchors, {stats['ingredients']} ingredients) in {stats['build_s']}s")
+    if trimmed:
+        print(f"[bundle] trimmed to fit: {trimmed}")
+    for a in doc["anchors"][:10]:
+        c = a["candidates"][0]
+        print(f"  {a['id']:<24} {doc['ingredients'][c['id']]['name'][:40]:<40} {c['retailer']} {c['value']}"
+              f"{'/' + c['unit'] if c['unit'] and c['unit'] != 'ea' else ''} ({c['unit_price']}/{c['per']})")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Reduce the normalized deal pool to a bounded planning bundle.")
+    ap.add_argument("--in", dest="in_path", type=Path, default=ALL_NORM)
+    ap.add_argument("--out", type=Path, default=BUNDLE_PATH)
+    ap.add_argument("--prefs", type=Path, default=PREFS_PATH)
+    ap.add_argument("--cravings", type=Path, default=CRAVINGS_PATH)
+    ap.add_argument("--k", type=int, default=None, help=f"candidates per anchor (default {DEFAULT_K})")
+    ap.add_argument("--max-bytes", type=int, default=None, help=f"hard size budget (default {DEFAULT_MAX_BYTES})")
+    ap.add_argument("--max-tokens", type=int, default=None,
+                    help=f"hard token budget, estimated at {BYTES_PER_TOKEN} bytes per token")
+    args = ap.parse_args(argv)
+    with run_manifest.stage("bundle") as st:
+        stats = build_bundle(args.in_path, args.out, args.prefs, args.cravings, k=args.k,
+                             max_bytes=args.max_bytes, max_tokens=args.max_tokens)
+        st.add(items=stats["items"])
+        run_manifest.wrote(args.out)
+
+
+if __name__ == "__main__":
+    main()